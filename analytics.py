@@ -0,0 +1,99 @@
+import archive
+
+# Grouped-SQL sales analytics. Windows are half-open [start, end) ISO
+# timestamps (see exports.time_range); with no window the per-variant and
+# per-day rollup tables are read instead of the sales table. Windows that
+# reach into archived months also read those archives from `folder`.
+METRICS = {'units': 'quantity', 'revenue': 'revenue', 'margin': 'margin'}
+GROUPS = ('variant', 'product')
+BUCKETS = {'hour': 13, 'day': 10}
+
+def window_clause(start, end):
+    clauses = []
+    params = []
+    if start:
+        clauses.append('sale_time >= ?')
+        params.append(start)
+    if end:
+        clauses.append('sale_time < ?')
+        params.append(end)
+    return (f"WHERE {' AND '.join(clauses)}" if clauses else ''), params
+
+# Per-variant totals over the window as a subquery: (variant_id, quantity, revenue, cost)
+def variant_totals(start, end, source='sales'):
+    if not start and not end:
+        return 'SELECT variant_id, quantity, revenue, cost FROM sales_rollup_variant', []
+    where, params = window_clause(start, end)
+    return f'''SELECT variant_id, SUM(quantity) AS quantity, SUM(revenue) AS revenue,
+                      SUM(COALESCE(unit_cost, 0) * quantity) AS cost
+               FROM {source} {where} GROUP BY variant_id''', params
+
+# Rollups already cover archived sales, so only windows need the archives
+def windowed_source(c, folder, start, end):
+    return archive.sales_source(c, folder if start or end else None, start, end)
+
+def top(c, group, metric, start, end, limit, folder=None):
+    with windowed_source(c, folder, start, end) as source:
+        totals, params = variant_totals(start, end, source)
+        if group == 'variant':
+            c.execute(f'''SELECT v.variant_id, p.name, v.type, v.size, t.quantity, t.revenue, t.revenue - t.cost AS margin
+                          FROM ({totals}) t JOIN variants v ON v.variant_id = t.variant_id
+                          JOIN products p ON p.product_id = v.product_id
+                          ORDER BY {METRICS[metric]} DESC, v.variant_id
+                          LIMIT ?''', params + [limit])
+            return [{'variant_id': variant_id, 'name': name, 'type': type_, 'size': size,
+                     'units': quantity, 'revenue': round(revenue, 2), 'margin': round(margin, 2)}
+                    for variant_id, name, type_, size, quantity, revenue, margin in c.fetchall()]
+        c.execute(f'''SELECT p.product_id, p.name, SUM(t.quantity) AS quantity, SUM(t.revenue) AS revenue,
+                             SUM(t.revenue - t.cost) AS margin
+                      FROM ({totals}) t JOIN variants v ON v.variant_id = t.variant_id
+                      JOIN products p ON p.product_id = v.product_id
+                      GROUP BY p.product_id
+                      ORDER BY {METRICS[metric]} DESC, p.product_id
+                      LIMIT ?''', params + [limit])
+        return [{'product_id': product_id, 'name': name, 'units': quantity, 'revenue': round(revenue, 2),
+                 'margin': round(margin, 2)}
+                for product_id, name, quantity, revenue, margin in c.fetchall()]
+
+def is_midnight(timestamp):
+    return not timestamp or timestamp.endswith('T00:00:00')
+
+# Sales per hour or day. Whole-day windows by day come from the daily rollup.
+def sales_over_time(c, bucket, start, end, folder=None):
+    if bucket == 'day' and is_midnight(start) and is_midnight(end):
+        clauses = []
+        params = []
+        if start:
+            clauses.append('day >= ?')
+            params.append(start[:10])
+        if end:
+            clauses.append('day < ?')
+            params.append(end[:10])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        c.execute(f'''SELECT day, sale_count, quantity, revenue, revenue - cost
+                      FROM sales_rollup_daily {where} ORDER BY day''', params)
+        rows = c.fetchall()
+    else:
+        where, params = window_clause(start, end)
+        with archive.sales_source(c, folder, start, end) as source:
+            c.execute(f'''SELECT substr(sale_time, 1, {BUCKETS[bucket]}) AS period, COUNT(*), SUM(quantity), SUM(revenue),
+                                 SUM(revenue - COALESCE(unit_cost, 0) * quantity)
+                          FROM {source} {where}
+                          GROUP BY period ORDER BY period''', params)
+            rows = c.fetchall()
+    return [{'period': period, 'sales': sales, 'units': quantity, 'revenue': round(revenue, 2), 'margin': round(margin, 2)}
+            for period, sales, quantity, revenue, margin in rows]
+
+# Units sold in the window as a share of units sold plus units still on hand
+def sell_through(c, start, end, limit, ascending=False, folder=None):
+    with windowed_source(c, folder, start, end) as source:
+        totals, params = variant_totals(start, end, source)
+        c.execute(f'''SELECT v.variant_id, p.name, v.type, v.size, COALESCE(t.quantity, 0) AS sold, v.stock,
+                             COALESCE(t.quantity * 1.0 / NULLIF(t.quantity + MAX(v.stock, 0), 0), 0) AS rate
+                      FROM variants v JOIN products p ON p.product_id = v.product_id
+                      LEFT JOIN ({totals}) t ON t.variant_id = v.variant_id
+                      ORDER BY rate {'ASC' if ascending else 'DESC'}, v.variant_id
+                      LIMIT ?''', params + [limit])
+        return [{'variant_id': variant_id, 'name': name, 'type': type_, 'size': size, 'sold': sold, 'stock': stock,
+                 'sell_through': round(rate, 4)}
+                for variant_id, name, type_, size, sold, stock, rate in c.fetchall()]
@@ -1,27 +1,148 @@
-from flask import Flask, render_template, request, jsonify, url_for, session, redirect, send_from_directory, send_file
-from flask_bcrypt import Bcrypt
+from flask import Flask, render_template, request, jsonify, url_for, session, redirect, send_from_directory, send_file, Response, g
 import sqlite3
 import os
+import json
+import click
 import uuid
 import logging
-from datetime import datetime
+import time
+import secrets
+from datetime import datetime, timedelta
 from werkzeug.utils import secure_filename
-from openpyxl import Workbook
-from io import BytesIO
+import db
+import rollups
+import migrations
+import query_plans
+import exports
+import catalog_import
+import images
+import datagen
+import analytics
+import reorder
+import http_cache
+import catalog_sync
+import search
+import ledger
+import archive
+import passwords
+import queues
+import pos
+from throttle import FailureLimiter
+from events import EventBroker
+import metrics
+from cache import LRUCache
 
 app = Flask(__name__)
-app.secret_key = 'your-secret-key'
-bcrypt = Bcrypt(app)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Configuration defaults, overridden by create_app(config). Importing this
+# module opens no connections and starts no threads, so a server may import
+# it in its master process and fork workers (see wsgi.py).
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
+app.config['DATABASE'] = os.environ.get('DATABASE', 'inventory.db')
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 8))
+# Apply migrations and seed an empty database in create_app(); servers with
+# several workers do this once in the master instead (prepare_database)
+app.config['INIT_DB'] = os.environ.get('INIT_DB') == '1'
+# Set when several worker processes share the database: each process then
+# drops its caches whenever another one commits (see sync_process_caches)
+app.config['MULTIPROCESS'] = os.environ.get('MULTIPROCESS') == '1'
+db.init_pool(app.config['DATABASE'], app.config['DB_POOL_SIZE'])
+
+# Barcode -> ready-built /scan payload, invalidated by every stock or variant write
+app.config['SCAN_CACHE_SIZE'] = 4096
+scan_cache = LRUCache(app.config['SCAN_CACHE_SIZE'])
+
+# Analytics results keyed by (kind, window end, ...). New sales only drop
+# windows they fall into; sell-through also depends on stock levels.
+app.config['ANALYTICS_CACHE_SIZE'] = 256
+analytics_cache = LRUCache(app.config['ANALYTICS_CACHE_SIZE'])
+ANALYTICS_LIMIT = 10
+MAX_ANALYTICS_LIMIT = 100
+
+# Conditional GET for the back-office pages: ETags come from a data version
+# bumped after every write request, and rendered bodies are cached per ETag.
+# Text responses over 1 KB are gzip/brotli compressed.
+data_version = http_cache.DataVersion()
+app.config['PAGE_CACHE_SIZE'] = 256
+page_cache = LRUCache(app.config['PAGE_CACHE_SIZE'])
+app.config['COMPRESS_RESPONSES'] = True
+# POST endpoints that do not change any data
+READ_ONLY_ENDPOINTS = {'login', 'logout', 'scan'}
+
+# Live stock, sale and purchase-approval feed for the inventory and Sell pages
+event_broker = EventBroker()
+
+# Optional group commit for sale, stock and purchase writes: a writer thread
+# batches them into shared transactions. Enable with WRITE_BEHIND=1.
+app.config['WRITE_BEHIND'] = os.environ.get('WRITE_BEHIND') == '1'
+
+# Password hashing runs on a few worker processes (see passwords.py) so
+# a burst of logins cannot starve other requests. Requests that would wait
+# more than PASSWORD_QUEUE_SIZE deep or PASSWORD_TIMEOUT seconds get a 503.
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', passwords.LOG_ROUNDS))
+app.config['PASSWORD_WORKERS'] = int(os.environ.get('PASSWORD_WORKERS', passwords.WORKERS))
+app.config['PASSWORD_QUEUE_SIZE'] = int(os.environ.get('PASSWORD_QUEUE_SIZE', passwords.QUEUE_SIZE))
+app.config['PASSWORD_TIMEOUT'] = float(os.environ.get('PASSWORD_TIMEOUT', passwords.TIMEOUT))
+
+# Failed logins allowed per username and per client address within the
+# window before further attempts are refused without checking the password.
+# The address limit is higher because a shop's tills may share one address.
+app.config['LOGIN_FAILURE_WINDOW'] = 15 * 60
+app.config['LOGIN_MAX_FAILURES'] = 5
+app.config['LOGIN_MAX_FAILURES_PER_ADDRESS'] = 50
+login_user_limiter = FailureLimiter(app.config['LOGIN_MAX_FAILURES'], app.config['LOGIN_FAILURE_WINDOW'])
+login_address_limiter = FailureLimiter(app.config['LOGIN_MAX_FAILURES_PER_ADDRESS'], app.config['LOGIN_FAILURE_WINDOW'])
+
+# Request/SQL instrumentation exposed at /metrics. The slow-query log is
+# opt-in: set SLOW_QUERY_MS to log statements slower than that.
+app.config['METRICS_ENABLED'] = True
+# /metrics exposes SQL text: scrapers send `Authorization: Bearer
+# <METRICS_TOKEN>`; without a token only loopback clients may scrape.
+# Admin sessions can always read it.
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+LOOPBACK_ADDRESSES = {'127.0.0.1', '::1'}
+app.config['SLOW_QUERY_MS'] = float(os.environ['SLOW_QUERY_MS']) if os.environ.get('SLOW_QUERY_MS') else None
+db.statement_observer = metrics.StatementTimer(
+    app.config['SLOW_QUERY_MS'] / 1000 if app.config['SLOW_QUERY_MS'] is not None else None)
+metrics.registry.register(metrics.Gauge(
+    'db_pool_connections', 'Pooled SQLite connections by state.', ('state',),
+    lambda: {(state,): value for state, value in db.get_pool().stats().items()}))
+metrics.registry.register(metrics.Gauge(
+    'scan_cache', 'Barcode scan cache size and counters.', ('field',),
+    lambda: {(field,): value for field, value in scan_cache.stats().items()}))
+metrics.registry.register(metrics.Gauge(
+    'analytics_cache', 'Analytics cache size and counters.', ('field',),
+    lambda: {(field,): value for field, value in analytics_cache.stats().items()}))
+metrics.registry.register(metrics.Gauge(
+    'page_cache', 'Rendered page cache size and counters.', ('field',),
+    lambda: {(field,): value for field, value in page_cache.stats().items()}))
+metrics.registry.register(metrics.Gauge(
+    'data_version', 'Write requests seen by this process.', (), lambda: data_version.value))
+metrics.registry.register(metrics.Gauge(
+    'db_write_queue', 'Write-behind batches, operations and queue depth.', ('field',),
+    lambda: {(field,): value for field, value in db.get_write_queue().stats().items()} if db.get_write_queue() else {}))
+metrics.registry.register(metrics.Gauge(
+    'password_hasher', 'Password hashing workers, calls in flight and outcomes.', ('field',),
+    lambda: {(field,): value for field, value in passwords.get_hasher().stats().items()}))
+metrics.registry.register(metrics.Gauge(
+    'login_throttle', 'Throttled failing usernames and addresses, and logins refused.', ('scope', 'field'),
+    lambda: {**{('username', field): value for field, value in login_user_limiter.stats().items()},
+             **{('address', field): value for field, value in login_address_limiter.stats().items()}}))
+metrics.registry.register(metrics.Gauge(
+    'event_feed_version', 'Latest live event version.', (), lambda: event_broker.version))
+
 # File upload configuration
 UPLOAD_FOLDER = 'static/uploads'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Closed months of sales, moved out of the hot table by `flask archive-sales`
+app.config['ARCHIVE_FOLDER'] = archive.ARCHIVE_FOLDER
 ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png'}
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Uploads are content-addressed and never rewritten, so browsers may cache them for a year
+IMAGE_MAX_AGE = 365 * 24 * 3600
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -29,56 +150,148 @@ def allowed_file(filename):
 # Initialize SQLite database
 def init_db():
     try:
-        conn = sqlite3.connect('inventory.db')
-        conn.execute('PRAGMA foreign_keys = ON')
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS products
-                     (product_id TEXT PRIMARY KEY, name TEXT)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS variants
-                     (variant_id TEXT PRIMARY KEY, product_id TEXT, barcode TEXT UNIQUE, type TEXT, size TEXT, 
-                      cost REAL, selling_price REAL, stock INTEGER, photo TEXT,
-                      FOREIGN KEY(product_id) REFERENCES products(product_id) ON DELETE CASCADE)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS requests
-                     (request_id TEXT PRIMARY KEY, variant_id TEXT, customer_name TEXT, contact_info TEXT,
-                      FOREIGN KEY(variant_id) REFERENCES variants(variant_id) ON DELETE CASCADE)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS sales
-                     (sale_id TEXT PRIMARY KEY, variant_id TEXT, quantity INTEGER, revenue REAL, sale_time TEXT,
-                      FOREIGN KEY(variant_id) REFERENCES variants(variant_id) ON DELETE CASCADE)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS users
-                     (user_id TEXT PRIMARY KEY, username TEXT UNIQUE, password_hash TEXT, is_admin INTEGER)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS purchases
-                     (purchase_id TEXT PRIMARY KEY, variant_id TEXT, quantity INTEGER, purchase_time TEXT,
-                      FOREIGN KEY(variant_id) REFERENCES variants(variant_id) ON DELETE CASCADE)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS pre_orders
-                     (pre_order_id TEXT PRIMARY KEY, variant_id TEXT, customer_name TEXT, contact_info TEXT, quantity INTEGER, pre_order_time TEXT,
-                      FOREIGN KEY(variant_id) REFERENCES variants(variant_id) ON DELETE CASCADE)''')
-        c.execute("SELECT COUNT(*) FROM products")
-        product_count = c.fetchone()[0]
-        c.execute("SELECT COUNT(*) FROM users")
-        user_count = c.fetchone()[0]
-        if product_count == 0:
-            logger.info("Adding sample product data")
-            c.execute("INSERT INTO products VALUES (?, ?)", ('p1', 'Team Jersey'))
-            c.execute("INSERT INTO products VALUES (?, ?)", ('p2', 'Practice Kit'))
-            c.execute("INSERT INTO variants VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                      ('v1', 'p1', '123456789', 'Home', 'M', 49.99, 79.99, 10, 'placeholder.jpg'))
-            c.execute("INSERT INTO variants VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                      ('v2', 'p1', '123456790', 'Home', 'L', 49.99, 79.99, 0, 'placeholder.jpg'))
-            c.execute("INSERT INTO variants VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                      ('v3', 'p1', '987654321', 'Away', 'S', 59.99, 89.99, 5, 'placeholder.jpg'))
-            c.execute("INSERT INTO variants VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                      ('v4', 'p2', '111222333', 'Training', 'M', 39.99, 69.99, 8, 'placeholder.jpg'))
-        if user_count == 0:
-            logger.info("Adding default admin user")
-            admin_id = str(uuid.uuid4())
-            password_hash = bcrypt.generate_password_hash('adminpass').decode('utf-8')
-            c.execute("INSERT INTO users VALUES (?, ?, ?, ?)", (admin_id, 'admin', password_hash, 1))
-        conn.commit()
+        with db.get_pool().connection() as conn:
+            version = migrations.migrate(conn)
+            logger.info(f"Database schema at version {version}")
+        # The write lock makes concurrent first starts seed only once
+        with db.get_pool().connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            c = conn.cursor()
+            c.execute("SELECT COUNT(*) FROM products")
+            product_count = c.fetchone()[0]
+            c.execute("SELECT COUNT(*) FROM users")
+            user_count = c.fetchone()[0]
+            if product_count == 0:
+                logger.info("Adding sample product data")
+                c.execute("INSERT INTO products VALUES (?, ?)", ('p1', 'Team Jersey'))
+                c.execute("INSERT INTO products VALUES (?, ?)", ('p2', 'Practice Kit'))
+                c.execute("INSERT INTO variants VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                          ('v1', 'p1', '123456789', 'Home', 'M', 49.99, 79.99, 10, 'placeholder.jpg'))
+                c.execute("INSERT INTO variants VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                          ('v2', 'p1', '123456790', 'Home', 'L', 49.99, 79.99, 0, 'placeholder.jpg'))
+                c.execute("INSERT INTO variants VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                          ('v3', 'p1', '987654321', 'Away', 'S', 59.99, 89.99, 5, 'placeholder.jpg'))
+                c.execute("INSERT INTO variants VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                          ('v4', 'p2', '111222333', 'Training', 'M', 39.99, 69.99, 8, 'placeholder.jpg'))
+            if user_count == 0:
+                logger.info("Adding default admin user")
+                admin_id = str(uuid.uuid4())
+                password_hash = passwords.hash_password('adminpass', app.config['BCRYPT_LOG_ROUNDS'])
+                c.execute("INSERT INTO users VALUES (?, ?, ?, ?)", (admin_id, 'admin', password_hash, 1))
         logger.info(f"Database initialized: {product_count} products, {user_count} users before initialization")
     except sqlite3.Error as e:
         logger.error(f"Database initialization failed: {e}")
-    finally:
-        conn.close()
+
+# Application factory for WSGI servers (see wsgi.py). Configures the shared
+# module-level app, so calling it again simply reconfigures it.
+def create_app(config=None):
+    if config:
+        app.config.update(config)
+    if not app.config.get('SECRET_KEY'):
+        logger.warning("SECRET_KEY is not set: using a random key, so sessions end on restart "
+                       "and are not shared between worker processes")
+        app.config['SECRET_KEY'] = secrets.token_hex(32)
+    db.init_pool(app.config['DATABASE'], app.config['DB_POOL_SIZE'])
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    if app.config['INIT_DB']:
+        init_db()
+    if app.config['WRITE_BEHIND']:
+        db.start_write_queue()
+    passwords.init_hasher(app.config['PASSWORD_WORKERS'], app.config['PASSWORD_QUEUE_SIZE'],
+                          app.config['PASSWORD_TIMEOUT'], app.config['BCRYPT_LOG_ROUNDS'])
+    if app.config['MULTIPROCESS']:
+        db.start_change_watcher(app.config['DATABASE'])
+    else:
+        db.stop_change_watcher()
+    return app
+
+# One-time setup before a server forks its workers: migrate and seed, then
+# close the connections so no child inherits them. Safe to run from several
+# processes at once.
+def prepare_database(config=None):
+    if config:
+        app.config.update(config)
+    db.init_pool(app.config['DATABASE'], app.config['DB_POOL_SIZE'])
+    init_db()
+    db.get_pool().close()
+
+def variant_barcodes(c, variant_ids):
+    placeholders = ','.join('?' * len(variant_ids))
+    c.execute(f"SELECT barcode FROM variants WHERE variant_id IN ({placeholders})", list(variant_ids))
+    return [row[0] for row in c.fetchall()]
+
+def stock_levels(c, variant_ids):
+    placeholders = ','.join('?' * len(variant_ids))
+    c.execute(f"SELECT variant_id, stock FROM variants WHERE variant_id IN ({placeholders})", list(variant_ids))
+    return dict(c.fetchall())
+
+# Call after commit: drop cached scans and push the new levels to live pages
+def stock_changed(barcodes, stock):
+    scan_cache.invalidate(*barcodes)
+    analytics_cache.invalidate_matching(lambda key: key[0] == 'sell_through')
+    for variant_id, level in stock.items():
+        event_broker.publish('stock', {'variant_id': variant_id, 'stock': level})
+
+def publish_sales(sales):
+    if sales:
+        invalidate_analytics(min(sale[4] for sale in sales))
+    for sale_id, variant_id, quantity, revenue, sale_time in sales:
+        event_broker.publish('sale', {'sale_id': sale_id, 'variant_id': variant_id, 'quantity': quantity,
+                                      'revenue': revenue, 'sale_time': sale_time})
+
+# Without a sale time (catalog changes, cascaded sale deletes) every result is dropped
+def invalidate_analytics(sale_time=None):
+    if sale_time is None:
+        analytics_cache.clear()
+    else:
+        analytics_cache.invalidate_matching(lambda key: key[0] == 'sell_through' or key[1] is None or key[1] > sale_time)
+
+def cached_analytics(key, compute):
+    payload = analytics_cache.get(key)
+    if payload is None:
+        version = analytics_cache.version
+        with db.transaction() as c:
+            payload = compute(c)
+        analytics_cache.put(key, payload, version)
+    return payload
+
+def analytics_params():
+    start, end = exports.time_range(request.args.get('from'), request.args.get('to'))
+    limit = max(1, min(int(request.args.get('limit', ANALYTICS_LIMIT)), MAX_ANALYTICS_LIMIT))
+    return start, end, limit
+
+def scan_payload(product):
+    return {
+        'product_id': product[0],
+        'name': product[1],
+        'type': product[2],
+        'selling_price': product[3],
+        'variant_id': product[4],
+        'barcode': product[5],
+        'size': product[6],
+        'stock': product[7],
+        'photo': url_for('image', size='display', filename=product[8]),
+        'thumbnail': url_for('image', size='thumb', filename=product[8]),
+        'request_url': url_for('contact_form', variant_id=product[4], _external=True) if product[7] == 0 else ''
+    }
+
+# Keyset pagination helpers: a cursor is the sort key of the last row served
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+def page_limit():
+    return max(1, min(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+
+def encode_cursor(*parts):
+    return '|'.join(str(part) for part in parts)
+
+def decode_cursor(cursor, length):
+    if not cursor:
+        return None
+    parts = cursor.split('|')
+    if len(parts) != length:
+        raise ValueError(f"Malformed cursor: {cursor}")
+    return parts
 
 # Middleware to check authentication
 def login_required(f):
@@ -100,6 +313,71 @@ def admin_required(f):
     wrap.__name__ = f.__name__
     return wrap
 
+# ETag/304 and rendered-body caching for GETs whose output depends only on
+# the database and the session user. Must be the innermost decorator.
+def conditional_get(f):
+    def wrap(*args, **kwargs):
+        if request.method != 'GET':
+            return f(*args, **kwargs)
+        etag = data_version.etag(request.full_path, session.get('user_id'), session.get('is_admin'))
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+        else:
+            cached = page_cache.get(etag)
+            if cached is None:
+                response = app.make_response(f(*args, **kwargs))
+                if response.status_code != 200 or g.get('uncacheable'):
+                    return response
+                page_cache.put(etag, (response.get_data(), response.mimetype))
+            else:
+                response = app.response_class(cached[0], mimetype=cached[1])
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    wrap.__name__ = f.__name__
+    return wrap
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    if app.config['METRICS_ENABLED'] and 'request_start' in g:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request(request.method, route, response.status_code, time.perf_counter() - g.request_start)
+    return response
+
+# Caches, the data version and the live event feed are per process. With
+# several workers, drop this process's caches and move its ETags on as soon
+# as another process has committed; this process's own writes invalidate
+# precisely as they happen.
+@app.before_request
+def sync_process_caches():
+    watcher = db.get_change_watcher()
+    if watcher is not None and watcher.changed():
+        scan_cache.clear()
+        analytics_cache.clear()
+        data_version.bump()
+
+@app.after_request
+def bump_data_version(response):
+    if request.method not in ('GET', 'HEAD', 'OPTIONS') and request.endpoint not in READ_ONLY_ENDPOINTS:
+        data_version.bump()
+    return response
+
+@app.after_request
+def compress(response):
+    if app.config['COMPRESS_RESPONSES']:
+        http_cache.compress_response(response, request.headers.get('Accept-Encoding', ''))
+    return response
+
+# Every pooled connection stayed checked out for the pool timeout
+@app.errorhandler(db.PoolTimeout)
+def database_busy(e):
+    logger.warning(f"Database busy: {e}")
+    return jsonify({'error': 'Server busy, try again shortly'}), 503, {'Retry-After': '1'}
+
 @app.route('/')
 def index():
     return redirect(url_for('login'))
@@ -111,18 +389,27 @@ def login():
             data = request.json
             username = data['username']
             password = data['password']
-            conn = sqlite3.connect('inventory.db')
-            conn.execute('PRAGMA foreign_keys = ON')
-            c = conn.cursor()
-            c.execute("SELECT user_id, username, password_hash, is_admin FROM users WHERE username = ?", (username,))
-            user = c.fetchone()
-            conn.close()
-            if user and bcrypt.check_password_hash(user[2], password):
+            address = request.remote_addr
+            retry_after = max(login_user_limiter.retry_after(username), login_address_limiter.retry_after(address))
+            if retry_after:
+                logger.warning(f"Login throttled for {username} from {address}")
+                return (jsonify({'error': 'Too many failed logins, try again later'}), 429,
+                        {'Retry-After': str(int(retry_after) + 1)})
+            with db.transaction() as c:
+                c.execute("SELECT user_id, username, password_hash, is_admin FROM users WHERE username = ?", (username,))
+                user = c.fetchone()
+            if user and passwords.get_hasher().check(user[2], password):
+                login_user_limiter.reset(username)
                 session['user_id'] = user[0]
                 session['username'] = user[1]
                 session['is_admin'] = user[3]
                 return jsonify({'success': True})
+            login_user_limiter.failed(username)
+            login_address_limiter.failed(address)
             return jsonify({'error': 'Invalid username or password'}), 401
+        except passwords.HasherBusy as e:
+            logger.warning(f"Login refused: {e}")
+            return jsonify({'error': 'Server busy, try again shortly'}), 503, {'Retry-After': '1'}
         except sqlite3.Error as e:
             logger.error(f"Login error: {e}")
             return jsonify({'error': 'Database error'}), 500
@@ -137,6 +424,7 @@ def logout():
 
 @app.route('/users', methods=['GET', 'POST'])
 @admin_required
+@conditional_get
 def users():
     if request.method == 'POST':
         try:
@@ -145,27 +433,24 @@ def users():
             password = data['password']
             is_admin = data.get('is_admin', 0)
             user_id = str(uuid.uuid4())
-            password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
-            conn = sqlite3.connect('inventory.db')
-            conn.execute('PRAGMA foreign_keys = ON')
-            c = conn.cursor()
-            c.execute("INSERT INTO users VALUES (?, ?, ?, ?)", (user_id, username, password_hash, is_admin))
-            conn.commit()
-            conn.close()
+            password_hash = passwords.get_hasher().hash(password)
+            with db.transaction() as c:
+                c.execute("INSERT INTO users VALUES (?, ?, ?, ?)", (user_id, username, password_hash, is_admin))
             return jsonify({'success': True})
+        except passwords.HasherBusy as e:
+            logger.warning(f"Add user refused: {e}")
+            return jsonify({'error': 'Server busy, try again shortly'}), 503, {'Retry-After': '1'}
         except sqlite3.Error as e:
             logger.error(f"Add user error: {e}")
             return jsonify({'error': 'Database error or username exists'}), 500
     try:
-        conn = sqlite3.connect('inventory.db')
-        conn.execute('PRAGMA foreign_keys = ON')
-        c = conn.cursor()
-        c.execute("SELECT user_id, username, is_admin FROM users")
-        users = c.fetchall()
-        conn.close()
+        with db.transaction() as c:
+            c.execute("SELECT user_id, username, is_admin FROM users")
+            users = c.fetchall()
         return render_template('users.html', users=users, username=session.get('username'), is_admin=session.get('is_admin'))
     except sqlite3.Error as e:
         logger.error(f"Users page error: {e}")
+        g.uncacheable = True
         return render_template('users.html', users=[], username=session.get('username'), is_admin=session.get('is_admin'), error="Database error")
 
 @app.route('/delete_user', methods=['POST'])
@@ -175,12 +460,8 @@ def delete_user():
         user_id = request.json['user_id']
         if user_id == session.get('user_id'):
             return jsonify({'error': 'Cannot delete own account'}), 400
-        conn = sqlite3.connect('inventory.db')
-        conn.execute('PRAGMA foreign_keys = ON')
-        c = conn.cursor()
-        c.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
-        conn.commit()
-        conn.close()
+        with db.transaction() as c:
+            c.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
         return jsonify({'success': True})
     except sqlite3.Error as e:
         logger.error(f"Delete user error: {e}")
@@ -188,6 +469,7 @@ def delete_user():
 
 @app.route('/inventory', methods=['GET', 'POST'])
 @login_required
+@conditional_get
 def inventory():
     if request.method == 'POST' and session.get('is_admin'):
         try:
@@ -198,130 +480,175 @@ def inventory():
                 stock = data['stock']
                 if stock < 0:
                     return jsonify({'error': 'Stock cannot be negative'}), 400
-                conn = sqlite3.connect('inventory.db')
-                conn.execute('PRAGMA foreign_keys = ON')
-                c = conn.cursor()
-                c.execute("UPDATE variants SET stock = ? WHERE variant_id = ?", (stock, variant_id))
-                conn.commit()
-                conn.close()
+                def update(c):
+                    with ledger.reason(c, 'count'):
+                        c.execute("UPDATE variants SET stock = ? WHERE variant_id = ?", (stock, variant_id))
+                    return variant_barcodes(c, [variant_id]), stock_levels(c, [variant_id])
+                barcodes, levels = db.write(update)
+                stock_changed(barcodes, levels)
                 return jsonify({'success': True})
             else:
                 return jsonify({'error': 'Invalid action'}), 400
         except sqlite3.Error as e:
             logger.error(f"Inventory action error: {e}")
             return jsonify({'error': 'Database error'}), 500
+    # Stock and sales history are lazy-loaded from /api/inventory and /api/sales
     try:
-        conn = sqlite3.connect('inventory.db')
-        conn.execute('PRAGMA foreign_keys = ON')
-        c = conn.cursor()
-        c.execute('''SELECT p.product_id, p.name, v.variant_id, v.type, v.size, v.barcode, v.cost, v.selling_price, v.stock
-                     FROM products p LEFT JOIN variants v ON p.product_id = v.product_id
-                     ORDER BY p.product_id, v.variant_id''')
-        rows = c.fetchall()
-        products = {}
-        for row in rows:
-            product_id, name, variant_id, type_, size, barcode, cost, selling_price, stock = row
-            if product_id not in products:
-                products[product_id] = {'product_id': product_id, 'name': name, 'variants': []}
-            if variant_id:  # Only add variants if they exist
-                products[product_id]['variants'].append({
-                    'variant_id': variant_id, 'type': type_, 'size': size, 'barcode': barcode,
-                    'cost': cost, 'selling_price': selling_price, 'stock': stock
-                })
-        products = list(products.values())
-        logger.info(f"Inventory fetched: {len(products)} products")
-        c.execute('''SELECT SUM(s.revenue - (v.cost * s.quantity)) as total_profit
-                     FROM sales s JOIN variants v ON s.variant_id = v.variant_id''')
-        total_profit = c.fetchone()[0] or 0
-        c.execute('SELECT SUM(revenue) as total_revenue FROM sales')
-        total_revenue = c.fetchone()[0] or 0
-        c.execute('''SELECT p.name, v.type, v.size, s.quantity, s.revenue, v.cost, s.sale_time
-                     FROM sales s JOIN variants v ON s.variant_id = v.variant_id
-                     JOIN products p ON v.product_id = p.product_id''')
-        sales = c.fetchall()
-        conn.close()
-        if not products:
-            logger.warning("No products found in inventory")
-        return render_template('inventory.html', products=products, total_profit=total_profit, total_revenue=total_revenue,
-                               sales=sales, username=session.get('username'), is_admin=session.get('is_admin'))
+        with db.transaction() as c:
+            total_revenue, total_profit = rollups.totals(c)
+        return render_template('inventory.html', total_profit=total_profit, total_revenue=total_revenue,
+                               username=session.get('username'), is_admin=session.get('is_admin'))
     except sqlite3.Error as e:
         logger.error(f"Inventory error: {e}")
-        return render_template('inventory.html', products=[], total_profit=0, total_revenue=0, sales=[],
+        g.uncacheable = True
+        return render_template('inventory.html', total_profit=0, total_revenue=0,
                                username=session.get('username'), is_admin=session.get('is_admin'), error="Database error")
 
+@app.route('/api/inventory')
+@login_required
+@conditional_get
+def inventory_api():
+    try:
+        limit = page_limit()
+        cursor = decode_cursor(request.args.get('cursor'), 2)
+        low_stock = request.args.get('low_stock')
+        low_stock = int(low_stock) if low_stock not in (None, '') else None
+        with db.transaction() as c:
+            rows = pos.inventory_page(c, cursor, request.args.get('name'), request.args.get('product_id'),
+                                      request.args.get('type'), request.args.get('size'), low_stock, limit + 1)
+    except ValueError:
+        return jsonify({'error': 'Invalid filter'}), 400
+    except sqlite3.Error as e:
+        logger.error(f"Inventory API error: {e}")
+        return jsonify({'error': 'Database error'}), 500
+    is_admin = session.get('is_admin')
+    items = []
+    for product_id, name, variant_id, type_, size, barcode, cost, selling_price, stock in rows[:limit]:
+        item = {'product_id': product_id, 'name': name, 'variant_id': variant_id, 'type': type_, 'size': size,
+                'barcode': barcode, 'selling_price': selling_price, 'stock': stock}
+        if is_admin:
+            item['cost'] = cost
+        items.append(item)
+    next_cursor = encode_cursor(rows[limit - 1][0], rows[limit - 1][2]) if len(rows) > limit else None
+    return jsonify({'items': items, 'next_cursor': next_cursor})
+
+@app.route('/api/sales')
+@login_required
+@conditional_get
+def sales_api():
+    try:
+        limit = page_limit()
+        cursor = decode_cursor(request.args.get('cursor'), 2)
+        with db.transaction() as c:
+            rows = pos.sales_page(c, cursor, limit + 1)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    except sqlite3.Error as e:
+        logger.error(f"Sales API error: {e}")
+        return jsonify({'error': 'Database error'}), 500
+    is_admin = session.get('is_admin')
+    items = []
+    for sale_id, name, type_, size, quantity, revenue, cost, sale_time in rows[:limit]:
+        item = {'sale_id': sale_id, 'name': name, 'type': type_, 'size': size, 'quantity': quantity,
+                'revenue': revenue, 'sale_time': sale_time}
+        if is_admin:
+            item['cost'] = cost
+        items.append(item)
+    next_cursor = encode_cursor(rows[limit - 1][7], rows[limit - 1][0]) if len(rows) > limit else None
+    return jsonify({'items': items, 'next_cursor': next_cursor})
+
 @app.route('/add_product', methods=['GET', 'POST'])
 @login_required
+@conditional_get
 def add_product():
     if request.method == 'POST':
         try:
             data = request.form
             product_id = str(uuid.uuid4())
-            conn = sqlite3.connect('inventory.db')
-            conn.execute('PRAGMA foreign_keys = ON')
-            c = conn.cursor()
-            c.execute("INSERT OR REPLACE INTO products VALUES (?, ?)", (product_id, data['name']))
-            for i in range(len(request.files)):
-                variant_id = str(uuid.uuid4())
-                barcode = data[f'barcode_{i}']
-                if not barcode or c.execute("SELECT barcode FROM variants WHERE barcode = ?", (barcode,)).fetchone():
-                    conn.close()
-                    return jsonify({'error': 'Duplicate or empty barcode'}), 400
-                type_ = data[f'type_{i}']
-                size = data[f'size_{i}']
-                cost = float(data[f'cost_{i}'])
-                selling_price = float(data[f'selling_price_{i}'])
-                stock = int(data[f'stock_{i}'])
-                if cost < 0 or selling_price < 0 or stock < 0:
-                    conn.close()
-                    return jsonify({'error': 'Negative values not allowed'}), 400
-                file = request.files[f'photo_{i}']
-                if not file or not allowed_file(file.filename):
-                    conn.close()
-                    return jsonify({'error': 'Valid image file required for each variant'}), 400
-                filename = secure_filename(f"{variant_id}.{file.filename.rsplit('.', 1)[1].lower()}")
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-                c.execute("INSERT OR REPLACE INTO variants VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                          (variant_id, product_id, barcode, type_, size, cost, selling_price, stock, filename))
-            conn.commit()
-            conn.close()
+            barcodes = []
+            uploads = []
+            with db.transaction() as c:
+                c.execute("INSERT OR REPLACE INTO products VALUES (?, ?)", (product_id, data['name']))
+                for i in range(len(request.files)):
+                    variant_id = str(uuid.uuid4())
+                    barcode = data[f'barcode_{i}']
+                    if not barcode or c.execute("SELECT barcode FROM variants WHERE barcode = ?", (barcode,)).fetchone():
+                        c.connection.rollback()
+                        return jsonify({'error': 'Duplicate or empty barcode'}), 400
+                    type_ = data[f'type_{i}']
+                    size = data[f'size_{i}']
+                    cost = float(data[f'cost_{i}'])
+                    selling_price = float(data[f'selling_price_{i}'])
+                    stock = int(data[f'stock_{i}'])
+                    if cost < 0 or selling_price < 0 or stock < 0:
+                        c.connection.rollback()
+                        return jsonify({'error': 'Negative values not allowed'}), 400
+                    file = request.files[f'photo_{i}']
+                    if not file or not allowed_file(file.filename):
+                        c.connection.rollback()
+                        return jsonify({'error': 'Valid image file required for each variant'}), 400
+                    filename, photo = images.read_upload(file)
+                    c.execute("INSERT OR REPLACE INTO variants VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                              (variant_id, product_id, barcode, type_, size, cost, selling_price, stock, filename))
+                    barcodes.append(barcode)
+                    uploads.append((filename, photo))
+            # Only now that the variants are committed, so a rejected product leaves no files
+            for filename, photo in uploads:
+                images.save_upload(app.config['UPLOAD_FOLDER'], filename, photo)
+            scan_cache.invalidate(*barcodes)
+            invalidate_analytics()
             return jsonify({'success': True})
-        except (sqlite3.Error, ValueError) as e:
+        except (sqlite3.Error, ValueError, OSError) as e:
             logger.error(f"Add product error: {e}")
             return jsonify({'error': 'Database or input error'}), 500
     try:
-        conn = sqlite3.connect('inventory.db')
-        conn.execute('PRAGMA foreign_keys = ON')
-        c = conn.cursor()
-        c.execute('SELECT product_id, name FROM products')
-        products = c.fetchall()
-        c.execute('''SELECT v.variant_id, p.name, v.type, v.size, v.barcode
-                     FROM variants v JOIN products p ON v.product_id = p.product_id''')
-        variants = c.fetchall()
-        conn.close()
+        with db.transaction() as c:
+            c.execute('SELECT product_id, name FROM products')
+            products = c.fetchall()
+            c.execute('''SELECT v.variant_id, p.name, v.type, v.size, v.barcode
+                         FROM variants v JOIN products p ON v.product_id = p.product_id''')
+            variants = c.fetchall()
         return render_template('add_product.html', products=products, variants=variants,
                                username=session.get('username'), is_admin=session.get('is_admin'))
     except sqlite3.Error as e:
         logger.error(f"Add product page error: {e}")
+        g.uncacheable = True
         return render_template('add_product.html', products=[], variants=[],
                                username=session.get('username'), is_admin=session.get('is_admin'), error="Database error")
 
+@app.route('/import_catalog', methods=['POST'])
+@admin_required
+def import_catalog():
+    file = request.files.get('file')
+    if not file or not file.filename.lower().endswith(('.csv', '.xlsx')):
+        return jsonify({'error': 'CSV or XLSX file required'}), 400
+    dry_run = request.form.get('dry_run', '').lower() in ('1', 'true', 'on', 'yes')
+    try:
+        with db.transaction() as c:
+            report = catalog_import.import_catalog(c, catalog_import.read_rows(file.stream, file.filename),
+                                                   app.config['UPLOAD_FOLDER'], dry_run)
+        if report['imported'] and not dry_run:
+            invalidate_analytics()
+        return jsonify(report)
+    except db.PoolTimeout:
+        raise
+    except Exception as e:
+        logger.error(f"Import catalog error: {e}")
+        return jsonify({'error': 'Database or file error'}), 500
+
 @app.route('/delete_product', methods=['POST'])
 @admin_required
 def delete_product():
     try:
         product_id = request.json['product_id']
-        conn = sqlite3.connect('inventory.db')
-        conn.execute('PRAGMA foreign_keys = ON')
-        c = conn.cursor()
-        c.execute("SELECT photo FROM variants WHERE product_id = ?", (product_id,))
-        photos = c.fetchall()
-        for photo in photos:
-            photo_path = os.path.join(app.config['UPLOAD_FOLDER'], photo[0])
-            if os.path.exists(photo_path) and photo[0] != 'placeholder.jpg':
-                os.remove(photo_path)
-        c.execute("DELETE FROM products WHERE product_id = ?", (product_id,))
-        conn.commit()
-        conn.close()
+        with db.transaction() as c:
+            c.execute("SELECT photo, barcode FROM variants WHERE product_id = ?", (product_id,))
+            photos = c.fetchall()
+            c.execute("DELETE FROM products WHERE product_id = ?", (product_id,))
+            orphans = images.unreferenced(c, [photo[0] for photo in photos])
+        scan_cache.invalidate(*[photo[1] for photo in photos])
+        invalidate_analytics()
+        images.remove(app.config['UPLOAD_FOLDER'], orphans)
         return jsonify({'success': True})
     except (sqlite3.Error, OSError) as e:
         logger.error(f"Delete product error: {e}")
@@ -332,18 +659,14 @@ def delete_product():
 def delete_variant():
     try:
         variant_id = request.json['variant_id']
-        conn = sqlite3.connect('inventory.db')
-        conn.execute('PRAGMA foreign_keys = ON')
-        c = conn.cursor()
-        c.execute("SELECT photo FROM variants WHERE variant_id = ?", (variant_id,))
-        photo = c.fetchone()[0]
-        if photo and photo != 'placeholder.jpg':
-            photo_path = os.path.join(app.config['UPLOAD_FOLDER'], photo)
-            if os.path.exists(photo_path):
-                os.remove(photo_path)
-        c.execute("DELETE FROM variants WHERE variant_id = ?", (variant_id,))
-        conn.commit()
-        conn.close()
+        with db.transaction() as c:
+            c.execute("SELECT photo, barcode FROM variants WHERE variant_id = ?", (variant_id,))
+            photo, barcode = c.fetchone()
+            c.execute("DELETE FROM variants WHERE variant_id = ?", (variant_id,))
+            orphans = images.unreferenced(c, [photo])
+        scan_cache.invalidate(barcode)
+        invalidate_analytics()
+        images.remove(app.config['UPLOAD_FOLDER'], orphans)
         return jsonify({'success': True})
     except (sqlite3.Error, OSError) as e:
         logger.error(f"Delete variant error: {e}")
@@ -354,19 +677,19 @@ def delete_variant():
 def approve_purchase():
     try:
         purchase_id = request.json['purchase_id']
-        conn = sqlite3.connect('inventory.db')
-        conn.execute('PRAGMA foreign_keys = ON')
-        c = conn.cursor()
-        c.execute("SELECT variant_id, quantity FROM purchases WHERE purchase_id = ?", (purchase_id,))
-        purchase = c.fetchone()
-        if not purchase:
-            conn.close()
+        def approve(c):
+            purchase = pos.approve_purchase(c, purchase_id)
+            if not purchase:
+                return None
+            variant_id, quantity = purchase
+            return variant_id, quantity, variant_barcodes(c, [variant_id]), stock_levels(c, [variant_id])
+        approved = db.write(approve)
+        if approved is None:
             return jsonify({'error': 'Purchase not found'}), 404
-        variant_id, quantity = purchase
-        c.execute("UPDATE variants SET stock = stock + ? WHERE variant_id = ?", (quantity, variant_id))
-        c.execute("DELETE FROM purchases WHERE purchase_id = ?", (purchase_id,))
-        conn.commit()
-        conn.close()
+        variant_id, quantity, barcodes, levels = approved
+        stock_changed(barcodes, levels)
+        event_broker.publish('purchase_approved', {'purchase_id': purchase_id, 'variant_id': variant_id,
+                                                   'quantity': quantity, 'stock': levels.get(variant_id)})
         return jsonify({'success': True})
     except sqlite3.Error as e:
         logger.error(f"Approve purchase error: {e}")
@@ -377,17 +700,84 @@ def approve_purchase():
 def reject_purchase():
     try:
         purchase_id = request.json['purchase_id']
-        conn = sqlite3.connect('inventory.db')
-        conn.execute('PRAGMA foreign_keys = ON')
-        c = conn.cursor()
-        c.execute("DELETE FROM purchases WHERE purchase_id = ?", (purchase_id,))
-        conn.commit()
-        conn.close()
+        db.write(lambda c: c.execute("DELETE FROM purchases WHERE purchase_id = ?", (purchase_id,)))
         return jsonify({'success': True})
     except sqlite3.Error as e:
         logger.error(f"Reject purchase error: {e}")
         return jsonify({'error': 'Database error'}), 500
 
+# Approve or reject many pending purchases at once, chosen either by id or as
+# every pending purchase for one variant. Approval adds each variant's summed
+# quantity with one grouped UPDATE; everything happens in one transaction.
+@app.route('/bulk_purchases', methods=['POST'])
+@admin_required
+def bulk_purchases():
+    action = request.json.get('action')
+    if action not in ('approve', 'reject'):
+        return jsonify({'error': 'Invalid action'}), 400
+    if 'purchase_ids' in request.json:
+        purchase_ids = request.json['purchase_ids']
+        if not isinstance(purchase_ids, list) or not purchase_ids:
+            return jsonify({'error': 'purchase_ids must be a non-empty list'}), 400
+        where, params = pos.purchases_clause(purchase_ids=purchase_ids)
+    elif request.json.get('variant_id'):
+        where, params = pos.purchases_clause(variant_id=request.json['variant_id'])
+    else:
+        return jsonify({'error': 'Provide purchase_ids or variant_id'}), 400
+    def process(c):
+        purchases = pos.process_purchases(c, action == 'approve', where, params)
+        variant_ids = list({variant_id for _, variant_id, _ in purchases})
+        if action == 'approve' and variant_ids:
+            return purchases, variant_ids, variant_barcodes(c, variant_ids), stock_levels(c, variant_ids)
+        return purchases, variant_ids, [], {}
+    try:
+        purchases, variant_ids, barcodes, levels = db.write(process)
+        if action == 'approve' and variant_ids:
+            stock_changed(barcodes, levels)
+            for purchase_id, variant_id, quantity in purchases:
+                event_broker.publish('purchase_approved', {'purchase_id': purchase_id, 'variant_id': variant_id,
+                                                           'quantity': quantity, 'stock': levels.get(variant_id)})
+        logger.info(f"Bulk {action}: {len(purchases)} purchases across {len(variant_ids)} variants")
+        return jsonify({'success': True, 'processed': len(purchases), 'variants': len(variant_ids)})
+    except sqlite3.Error as e:
+        logger.error(f"Bulk purchase error: {e}")
+        return jsonify({'error': 'Database error'}), 500
+
+# Reorder suggestions from sales velocity, pre-orders, customer requests and
+# pending purchases. POST turns suggestions (all, or the given variant_ids)
+# into purchase requests awaiting approval.
+@app.route('/api/reorder', methods=['GET', 'POST'])
+@login_required
+def reorder_suggestions():
+    try:
+        limit = page_limit()
+        variant_ids = request.json.get('variant_ids') if request.method == 'POST' else None
+        if variant_ids is not None and (not isinstance(variant_ids, list) or not variant_ids):
+            return jsonify({'error': 'variant_ids must be a non-empty list'}), 400
+        with db.transaction() as c:
+            stale = reorder.needs_refresh(c)
+        if stale:
+            db.write(reorder.refresh)
+        if request.method == 'GET':
+            with db.transaction() as c:
+                items = reorder.suggestions(c, limit)
+            return jsonify({'items': items, 'window_days': reorder.WINDOW_DAYS,
+                            'lead_time_days': reorder.LEAD_TIME_DAYS, 'target_cover_days': reorder.TARGET_COVER_DAYS})
+        purchase_time = datetime.now().isoformat()
+        def create_purchases(c):
+            items = reorder.suggestions(c, limit, variant_ids)
+            c.executemany("INSERT INTO purchases VALUES (?, ?, ?, ?)",
+                          [(str(uuid.uuid4()), item['variant_id'], item['suggested_quantity'], purchase_time) for item in items])
+            return items
+        items = db.write(create_purchases)
+        logger.info(f"Reorder: {len(items)} purchase requests created")
+        return jsonify({'success': True, 'created': len(items), 'items': items})
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    except sqlite3.Error as e:
+        logger.error(f"Reorder error: {e}")
+        return jsonify({'error': 'Database error'}), 500
+
 @app.route('/transactions', methods=['GET', 'POST'])
 @login_required
 def transactions():
@@ -395,32 +785,27 @@ def transactions():
         try:
             action = request.json['action']
             variant_id = request.json['variant_id']
-            conn = sqlite3.connect('inventory.db')
-            conn.execute('PRAGMA foreign_keys = ON')
-            c = conn.cursor()
             if action == 'sell':
                 selling_price = float(request.json['selling_price'])
-                c.execute("SELECT stock FROM variants WHERE variant_id = ?", (variant_id,))
-                stock = c.fetchone()[0]
-                if stock > 0:
-                    c.execute("UPDATE variants SET stock = stock - 1 WHERE variant_id = ?", (variant_id,))
-                    sale_id = str(uuid.uuid4())
-                    c.execute("INSERT INTO sales VALUES (?, ?, ?, ?, ?)",
-                              (sale_id, variant_id, 1, selling_price, datetime.now().isoformat()))
-                    conn.commit()
-                    conn.close()
-                    return jsonify({'success': True, 'new_stock': stock - 1, 'request_url': ''})
-                conn.close()
+                sale = (str(uuid.uuid4()), variant_id, 1, selling_price, datetime.now().isoformat())
+                def sell(c):
+                    new_stock = pos.sell_stock(c, variant_id, 1)
+                    if new_stock is None:
+                        return None, []
+                    pos.record_sales(c, [sale])
+                    return new_stock, variant_barcodes(c, [variant_id])
+                new_stock, barcodes = db.write(sell)
+                if new_stock is not None:
+                    stock_changed(barcodes, {variant_id: new_stock})
+                    publish_sales([sale])
+                    return jsonify({'success': True, 'new_stock': new_stock, 'request_url': ''})
                 return jsonify({'error': 'Out of stock', 'request_url': url_for('contact_form', variant_id=variant_id, _external=True)}), 400
             elif action == 'buy':
                 quantity = request.json['quantity']
                 if quantity < 1:
                     return jsonify({'error': 'Invalid quantity'}), 400
-                purchase_id = str(uuid.uuid4())
-                c.execute("INSERT INTO purchases VALUES (?, ?, ?, ?)",
-                          (purchase_id, variant_id, quantity, datetime.now().isoformat()))
-                conn.commit()
-                conn.close()
+                purchase = (str(uuid.uuid4()), variant_id, quantity, datetime.now().isoformat())
+                db.write(lambda c: c.execute("INSERT INTO purchases VALUES (?, ?, ?, ?)", purchase))
                 return jsonify({'success': True, 'message': f'Purchase request for {quantity} units submitted'})
             else:
                 return jsonify({'error': 'Invalid action'}), 400
@@ -429,60 +814,304 @@ def transactions():
             return jsonify({'error': 'Database error'}), 500
     return render_template('transactions.html', username=session.get('username'), is_admin=session.get('is_admin'))
 
+@app.route('/checkout', methods=['POST'])
+@login_required
+def checkout():
+    try:
+        if not isinstance(request.json, dict) or not isinstance(request.json.get('lines'), list):
+            return jsonify({'error': 'Invalid basket'}), 400
+        allow_partial = bool(request.json.get('allow_partial', False))
+        lines = []
+        for line in request.json['lines']:
+            if not isinstance(line, dict) or not isinstance(line.get('variant_id'), str):
+                return jsonify({'error': 'Invalid basket'}), 400
+            quantity = int(line.get('quantity', 1))
+            selling_price = float(line['selling_price'])
+            if quantity < 1 or selling_price < 0:
+                return jsonify({'error': 'Invalid quantity or price'}), 400
+            lines.append((line['variant_id'], quantity, selling_price))
+        if not lines:
+            return jsonify({'error': 'Empty basket'}), 400
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Invalid basket'}), 400
+    sale_time = datetime.now().isoformat()
+    variant_ids = list(dict.fromkeys(line[0] for line in lines))
+    # The basket is its own savepoint so an all-or-nothing basket can be
+    # undone without touching other writes batched in the same transaction
+    def sell_basket(c):
+        results = []
+        sales = []
+        c.execute('SAVEPOINT basket')
+        for variant_id, quantity, selling_price in lines:
+            new_stock = pos.sell_stock(c, variant_id, quantity)
+            if new_stock is None:
+                error = 'Out of stock' if stock_levels(c, [variant_id]) else 'Unknown variant'
+                results.append({'variant_id': variant_id, 'quantity': quantity, 'success': False, 'error': error})
+                continue
+            results.append({'variant_id': variant_id, 'quantity': quantity, 'success': True, 'new_stock': new_stock})
+            sales.append((str(uuid.uuid4()), variant_id, quantity, selling_price * quantity, sale_time))
+        if len(sales) < len(lines) and not allow_partial:
+            c.execute('ROLLBACK TO basket')
+            for result in results:
+                if result['success']:
+                    result.update(success=False, error='Basket not committed')
+                    del result['new_stock']
+            sales = []
+        pos.record_sales(c, sales)
+        c.execute('RELEASE basket')
+        barcodes = variant_barcodes(c, variant_ids) if sales else []
+        return results, sales, barcodes, stock_levels(c, variant_ids)
+    try:
+        results, sales, barcodes, stock = db.write(sell_basket)
+        for result in results:
+            if result.get('error') == 'Out of stock':
+                result['request_url'] = url_for('contact_form', variant_id=result['variant_id'], _external=True)
+        if not sales:
+            if any(result.get('error') == 'Unknown variant' for result in results):
+                return jsonify({'success': False, 'error': 'Unknown variant', 'lines': results, 'stock': stock}), 404
+            return jsonify({'success': False, 'error': 'Out of stock', 'lines': results, 'stock': stock}), 409
+        stock_changed(barcodes, stock)
+        publish_sales(sales)
+        return jsonify({'success': True, 'lines': results, 'stock': stock})
+    except sqlite3.Error as e:
+        logger.error(f"Checkout error: {e}")
+        return jsonify({'error': 'Database error'}), 500
+
 @app.route('/scan', methods=['POST'])
 @login_required
 def scan():
     try:
         barcode = request.json['barcode']
-        conn = sqlite3.connect('inventory.db')
-        conn.execute('PRAGMA foreign_keys = ON')
-        c = conn.cursor()
-        c.execute('''SELECT p.product_id, p.name, v.type, v.selling_price, v.variant_id, v.barcode, v.size, v.stock, v.photo
-                     FROM products p JOIN variants v ON p.product_id = v.product_id
-                     WHERE v.barcode = ?''', (barcode,))
-        product = c.fetchone()
-        conn.close()
+        payload = scan_cache.get(barcode)
+        if payload:
+            return jsonify(payload)
+        version = scan_cache.version
+        with db.transaction() as c:
+            product = pos.scan(c, barcode)
         if product:
-            return jsonify({
-                'product_id': product[0],
-                'name': product[1],
-                'type': product[2],
-                'selling_price': product[3],
-                'variant_id': product[4],
-                'barcode': product[5],
-                'size': product[6],
-                'stock': product[7],
-                'photo': url_for('static', filename=f'uploads/{product[8]}') if product[8] != 'placeholder.jpg' else url_for('static', filename='placeholder.jpg'),
-                'request_url': url_for('contact_form', variant_id=product[4], _external=True) if product[7] == 0 else ''
-            })
+            payload = scan_payload(product)
+            scan_cache.put(barcode, payload, version)
+            return jsonify(payload)
         return jsonify({'error': 'Product not found'}), 404
     except sqlite3.Error as e:
         logger.error(f"Scan error: {e}")
         return jsonify({'error': 'Database error'}), 500
 
+# Stock movements of one variant, newest first; ?cursor=<movement_id> pages
+@app.route('/api/stock/<variant_id>/ledger')
+@admin_required
+def stock_ledger(variant_id):
+    try:
+        limit = page_limit()
+        cursor = decode_cursor(request.args.get('cursor'), 1)
+        with db.transaction() as c:
+            rows = ledger.movements(c, variant_id, int(cursor[0]) if cursor else None, limit + 1)
+        items = [{'movement_id': movement_id, 'change': change, 'reason': reason, 'movement_time': movement_time}
+                 for movement_id, change, reason, movement_time in rows[:limit]]
+        next_cursor = encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+        return jsonify({'items': items, 'next_cursor': next_cursor})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except sqlite3.Error as e:
+        logger.error(f"Stock ledger error: {e}")
+        return jsonify({'error': 'Database error'}), 500
+
+# Point-in-time stock: ?at=<ISO time, or a date for its close of business>,
+# for one variant_id or a page of variants by id. Takes the daily snapshot
+# first when one is due, so the replayed tail stays short.
+@app.route('/api/stock_at')
+@admin_required
+def stock_at():
+    try:
+        at = datetime.fromisoformat(request.args['at'])
+        if len(request.args['at']) == 10:
+            at += timedelta(days=1, microseconds=-1)
+        at = at.isoformat()
+        limit = page_limit()
+        cursor = decode_cursor(request.args.get('cursor'), 1)
+        variant_id = request.args.get('variant_id')
+        with db.transaction() as c:
+            due = ledger.snapshot_due(c)
+        if due:
+            db.write(lambda c: ledger.snapshot_due(c) and ledger.snapshot(c))
+        with db.transaction() as c:
+            if variant_id:
+                rows = ledger.stock_at(c, at, [variant_id])
+            else:
+                rows = ledger.stock_at(c, at, after=cursor[0] if cursor else None, limit=limit + 1)
+        items = [{'variant_id': variant_id, 'stock': stock} for variant_id, stock in rows[:limit]]
+        next_cursor = encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+        return jsonify({'at': at, 'items': items, 'next_cursor': next_cursor})
+    except KeyError:
+        return jsonify({'error': 'at is required'}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except sqlite3.Error as e:
+        logger.error(f"Stock at error: {e}")
+        return jsonify({'error': 'Database error'}), 500
+
+# Type-ahead for the POS search box: ranked prefix matches over product
+# name, type, size and barcode
+@app.route('/api/search')
+@login_required
+def search_products():
+    try:
+        text = request.args.get('q', '')
+        limit = max(1, min(int(request.args.get('limit', search.SEARCH_LIMIT)), search.MAX_SEARCH_LIMIT))
+        with db.transaction() as c:
+            rows = search.search(c, text, limit)
+        return jsonify({'items': [{'variant_id': variant_id, 'name': name, 'type': type_, 'size': size,
+                                   'barcode': barcode, 'selling_price': selling_price, 'stock': stock,
+                                   'thumbnail': url_for('image', size='thumb', filename=photo) if photo else ''}
+                                  for variant_id, name, type_, size, barcode, selling_price, stock, photo in rows]})
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    except sqlite3.Error as e:
+        logger.error(f"Search error: {e}")
+        return jsonify({'error': 'Database error'}), 500
+
+# Compact catalog for POS clients that resolve scans locally: the full
+# snapshot, or with ?since=<version> only the variants changed after it.
+# Items are arrays in catalog_sync.FIELDS order; photo is a filename under
+# photo_url.
+@app.route('/api/catalog')
+@login_required
+def catalog():
+    try:
+        since = request.args.get('since')
+        with db.transaction() as c:
+            if since is None:
+                version, items = catalog_sync.snapshot(c)
+                result = {'version': version, 'items': items, 'deleted': [], 'snapshot': True}
+            else:
+                changes = catalog_sync.delta(c, int(since))
+                if changes is None:
+                    return jsonify({'reset': True, 'version': catalog_sync.current_version(c)}), 410
+                version, items, deleted = changes
+                result = {'version': version, 'items': items, 'deleted': deleted, 'snapshot': False}
+        photo_url = url_for('image', size='display', filename='_').rsplit('/', 1)[0] + '/'
+        result.update(fields=catalog_sync.FIELDS, photo_url=photo_url)
+        return jsonify(result)
+    except ValueError:
+        return jsonify({'error': 'since must be an integer version'}), 400
+    except sqlite3.Error as e:
+        logger.error(f"Catalog sync error: {e}")
+        return jsonify({'error': 'Database error'}), 500
+
+@app.route('/events')
+@login_required
+def events():
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        return jsonify({'error': 'Invalid event id'}), 400
+    return Response(event_broker.stream(last_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    token = app.config['METRICS_TOKEN']
+    if not session.get('is_admin'):
+        if token:
+            supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+            if not secrets.compare_digest(supplied.encode('utf-8'), token.encode('utf-8')):
+                return jsonify({'error': 'Metrics token required'}), 401
+        elif request.remote_addr not in LOOPBACK_ADDRESSES:
+            return jsonify({'error': 'Metrics are only served to localhost without METRICS_TOKEN'}), 403
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache_stats')
+@admin_required
+def cache_stats():
+    return jsonify({'scan': scan_cache.stats(), 'analytics': analytics_cache.stats()})
+
+@app.route('/api/analytics/top')
+@admin_required
+def analytics_top():
+    group = request.args.get('group', 'variant')
+    metric = request.args.get('by', 'units')
+    if group not in analytics.GROUPS or metric not in analytics.METRICS:
+        return jsonify({'error': f"group must be one of {', '.join(analytics.GROUPS)}; "
+                                 f"by must be one of {', '.join(analytics.METRICS)}"}), 400
+    try:
+        start, end, limit = analytics_params()
+        items = cached_analytics(('top', end, start, group, metric, limit),
+                                 lambda c: analytics.top(c, group, metric, start, end, limit, app.config['ARCHIVE_FOLDER']))
+        return jsonify({'group': group, 'by': metric, 'from': start, 'to': end, 'items': items})
+    except ValueError:
+        return jsonify({'error': 'Invalid from/to or limit'}), 400
+    except sqlite3.Error as e:
+        logger.error(f"Analytics top error: {e}")
+        return jsonify({'error': 'Database error'}), 500
+
+@app.route('/api/analytics/sales')
+@admin_required
+def analytics_sales():
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in analytics.BUCKETS:
+        return jsonify({'error': f"bucket must be one of {', '.join(analytics.BUCKETS)}"}), 400
+    try:
+        start, end, _ = analytics_params()
+        items = cached_analytics(('sales', end, start, bucket),
+                                 lambda c: analytics.sales_over_time(c, bucket, start, end, app.config['ARCHIVE_FOLDER']))
+        return jsonify({'bucket': bucket, 'from': start, 'to': end, 'items': items})
+    except ValueError:
+        return jsonify({'error': 'Invalid from/to'}), 400
+    except sqlite3.Error as e:
+        logger.error(f"Analytics sales error: {e}")
+        return jsonify({'error': 'Database error'}), 500
+
+@app.route('/api/analytics/sell_through')
+@admin_required
+def analytics_sell_through():
+    ascending = request.args.get('order', 'desc') == 'asc'
+    try:
+        start, end, limit = analytics_params()
+        items = cached_analytics(('sell_through', end, start, limit, ascending),
+                                 lambda c: analytics.sell_through(c, start, end, limit, ascending, app.config['ARCHIVE_FOLDER']))
+        return jsonify({'from': start, 'to': end, 'order': 'asc' if ascending else 'desc', 'items': items})
+    except ValueError:
+        return jsonify({'error': 'Invalid from/to or limit'}), 400
+    except sqlite3.Error as e:
+        logger.error(f"Analytics sell-through error: {e}")
+        return jsonify({'error': 'Database error'}), 500
+
+@app.route('/images/<size>/<filename>')
+def image(size, filename):
+    if size != 'original' and size not in images.SIZES:
+        return "Unknown image size", 404
+    folder = app.config['UPLOAD_FOLDER']
+    max_age = IMAGE_MAX_AGE
+    if size in images.SIZES:
+        if os.path.exists(images.derived_path(folder, size, filename)):
+            folder = os.path.join(folder, size)
+        else:
+            # Rendition not generated yet; serve the original briefly
+            max_age = 60
+    response = send_from_directory(folder, filename, max_age=max_age)
+    if max_age == IMAGE_MAX_AGE:
+        response.cache_control.immutable = True
+    return response
+
 @app.route('/contact/<variant_id>', methods=['GET', 'POST'])
 def contact_form(variant_id):
     try:
-        conn = sqlite3.connect('inventory.db')
-        conn.execute('PRAGMA foreign_keys = ON')
-        c = conn.cursor()
-        c.execute('''SELECT p.name, v.type, v.size
-                     FROM products p JOIN variants v ON p.product_id = v.product_id
-                     WHERE v.variant_id = ?''', (variant_id,))
-        product = c.fetchone()
-        if not product:
-            conn.close()
-            return "Product not found", 404
+        with db.transaction() as c:
+            c.execute('''SELECT p.name, v.type, v.size
+                         FROM products p JOIN variants v ON p.product_id = v.product_id
+                         WHERE v.variant_id = ?''', (variant_id,))
+            product = c.fetchone()
+            if not product:
+                return "Product not found", 404
+            if request.method == 'POST':
+                customer_name = request.form['customer_name']
+                contact_info = request.form['contact_info']
+                request_id = str(uuid.uuid4())
+                c.execute("INSERT INTO requests VALUES (?, ?, ?, ?, ?)",
+                          (request_id, variant_id, customer_name, contact_info, datetime.now().isoformat()))
         if request.method == 'POST':
-            customer_name = request.form['customer_name']
-            contact_info = request.form['contact_info']
-            request_id = str(uuid.uuid4())
-            c.execute("INSERT INTO requests VALUES (?, ?, ?, ?)",
-                      (request_id, variant_id, customer_name, contact_info))
-            conn.commit()
-            conn.close()
             return render_template('contact_success.html', product_name=product[0], type=product[1], size=product[2])
-        conn.close()
         return render_template('contact_form.html', variant_id=variant_id, product_name=product[0], type=product[1], size=product[2])
     except sqlite3.Error as e:
         logger.error(f"Contact form error: {e}")
@@ -491,84 +1120,103 @@ def contact_form(variant_id):
 @app.route('/pre_order/<variant_id>', methods=['GET', 'POST'])
 def pre_order(variant_id):
     try:
-        conn = sqlite3.connect('inventory.db')
-        conn.execute('PRAGMA foreign_keys = ON')
-        c = conn.cursor()
-        c.execute('''SELECT p.name, v.type, v.size
-                     FROM products p JOIN variants v ON p.product_id = v.product_id
-                     WHERE v.variant_id = ?''', (variant_id,))
-        product = c.fetchone()
-        if not product:
-            conn.close()
-            return "Product not found", 404
+        with db.transaction() as c:
+            c.execute('''SELECT p.name, v.type, v.size
+                         FROM products p JOIN variants v ON p.product_id = v.product_id
+                         WHERE v.variant_id = ?''', (variant_id,))
+            product = c.fetchone()
+            if not product:
+                return "Product not found", 404
+            if request.method == 'POST':
+                customer_name = request.form['customer_name']
+                contact_info = request.form['contact_info']
+                quantity = int(request.form['quantity'])
+                pre_order_id = str(uuid.uuid4())
+                c.execute("INSERT INTO pre_orders VALUES (?, ?, ?, ?, ?, ?)",
+                          (pre_order_id, variant_id, customer_name, contact_info, quantity, datetime.now().isoformat()))
         if request.method == 'POST':
-            customer_name = request.form['customer_name']
-            contact_info = request.form['contact_info']
-            quantity = int(request.form['quantity'])
-            pre_order_id = str(uuid.uuid4())
-            c.execute("INSERT INTO pre_orders VALUES (?, ?, ?, ?, ?, ?)",
-                      (pre_order_id, variant_id, customer_name, contact_info, quantity, datetime.now().isoformat()))
-            conn.commit()
-            conn.close()
             return render_template('pre_order_success.html', product_name=product[0], type=product[1], size=product[2], quantity=quantity)
-        conn.close()
         return render_template('pre_order.html', variant_id=variant_id, product_name=product[0], type=product[1], size=product[2])
     except sqlite3.Error as e:
         logger.error(f"Pre order error: {e}")
         return jsonify({'error': 'Database error'}), 500
 
+# The queues are loaded page by page from the JSON endpoints below
 @app.route('/pre_orders')
 @login_required
+@conditional_get
 def pre_orders():
+    return render_template('requests.html', username=session.get('username'), is_admin=session.get('is_admin'))
+
+# One page of a queue: ?sort=time|quantity&order=desc|asc, filtered by
+# ?variant_id= and ?from=/&to= (ISO dates or timestamps) on its time column
+def queue_page(name):
     try:
-        conn = sqlite3.connect('inventory.db')
-        conn.execute('PRAGMA foreign_keys = ON')
-        c = conn.cursor()
-        c.execute('''SELECT r.request_id, p.name, v.type, v.size, r.customer_name, r.contact_info
-                     FROM requests r
-                     JOIN variants v ON r.variant_id = v.variant_id
-                     JOIN products p ON v.product_id = p.product_id''')
-        requests = c.fetchall()
-        c.execute('''SELECT p.purchase_id, p_.name, v.type, v.size, p.quantity, p.purchase_time
-                     FROM purchases p
-                     JOIN variants v ON p.variant_id = v.variant_id
-                     JOIN products p_ ON v.product_id = p_.product_id''')
-        purchases = c.fetchall()
-        c.execute('''SELECT po.pre_order_id, p.name, v.type, v.size, po.customer_name, po.contact_info, po.quantity, po.pre_order_time
-                     FROM pre_orders po
-                     JOIN variants v ON po.variant_id = v.variant_id
-                     JOIN products p ON v.product_id = p.product_id''')
-        pre_orders = c.fetchall()
-        conn.close()
-        logger.info(f"Requests fetched: {len(requests)} customer requests, {len(purchases)} purchase requests, {len(pre_orders)} pre-orders")
-        return render_template('requests.html', requests=requests, purchases=purchases, pre_orders=pre_orders,
-                               username=session.get('username'), is_admin=session.get('is_admin'))
+        limit = page_limit()
+        cursor = decode_cursor(request.args.get('cursor'), 2)
+        order = request.args.get('order', 'desc')
+        if order not in ('asc', 'desc'):
+            raise ValueError('order must be asc or desc')
+        start, end = exports.time_range(request.args.get('from'), request.args.get('to'))
+        with db.transaction() as c:
+            items, last = queues.page(c, name, request.args.get('sort', 'time'), order == 'desc',
+                                      request.args.get('variant_id'), start, end, cursor, limit)
+        return jsonify({'items': items, 'next_cursor': encode_cursor(*last) if last else None})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except sqlite3.Error as e:
-        logger.error(f"Requests error: {e}")
-        return render_template('requests.html', requests=[], purchases=[], pre_orders=[],
-                               username=session.get('username'), is_admin=session.get('is_admin'), error="Database error")
+        logger.error(f"Queue {name} error: {e}")
+        return jsonify({'error': 'Database error'}), 500
+
+@app.route('/api/requests')
+@login_required
+@conditional_get
+def requests_api():
+    return queue_page('requests')
+
+@app.route('/api/pre_orders')
+@login_required
+@conditional_get
+def pre_orders_api():
+    return queue_page('pre_orders')
+
+@app.route('/api/purchases')
+@admin_required
+@conditional_get
+def purchases_api():
+    return queue_page('purchases')
+
+# Outstanding demand per variant, most demanded first; ?variant_id= for one
+@app.route('/api/demand')
+@login_required
+@conditional_get
+def demand_api():
+    try:
+        limit = page_limit()
+        cursor = decode_cursor(request.args.get('cursor'), 2)
+        with db.transaction() as c:
+            items, last = queues.demand(c, request.args.get('variant_id'), cursor, limit)
+        return jsonify({'items': items, 'next_cursor': encode_cursor(*last) if last else None})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except sqlite3.Error as e:
+        logger.error(f"Demand error: {e}")
+        return jsonify({'error': 'Database error'}), 500
 
 @app.route('/export_inventory')
 @login_required
 def export_inventory():
+    fmt = request.args.get('format', 'xlsx')
+    if fmt not in exports.EXPORT_FORMATS:
+        return jsonify({'error': f"Format must be one of {', '.join(exports.EXPORT_FORMATS)}"}), 400
     try:
-        conn = sqlite3.connect('inventory.db')
-        conn.execute('PRAGMA foreign_keys = ON')
-        c = conn.cursor()
-        c.execute('''SELECT p.name, v.type, v.size, v.barcode, v.cost, v.selling_price, v.stock
-                     FROM products p JOIN variants v ON p.product_id = v.product_id''')
-        data = c.fetchall()
-        conn.close()
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Inventory"
-        ws.append(['Product Name', 'Type', 'Size', 'Barcode', 'Cost', 'Selling Price', 'Stock'])
-        for row in data:
-            ws.append(row)
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        return send_file(output, download_name='inventory.xlsx', as_attachment=True)
+        return exports.export_response(
+            fmt, 'inventory', 'Inventory',
+            ['Product Name', 'Type', 'Size', 'Barcode', 'Cost', 'Selling Price', 'Stock'],
+            ['name', 'type', 'size', 'barcode', 'cost', 'selling_price', 'stock'],
+            exports.fetch_batches(exports.INVENTORY_QUERY))
+    except db.PoolTimeout:
+        raise
     except Exception as e:
         logger.error(f"Export inventory error: {e}")
         return jsonify({'error': 'Export failed'}), 500
@@ -576,30 +1224,137 @@ def export_inventory():
 @app.route('/export_sales')
 @login_required
 def export_sales():
+    fmt = request.args.get('format', 'xlsx')
+    if fmt not in exports.EXPORT_FORMATS:
+        return jsonify({'error': f"Format must be one of {', '.join(exports.EXPORT_FORMATS)}"}), 400
+    try:
+        start, end = exports.time_range(request.args.get('from'), request.args.get('to'))
+    except ValueError:
+        return jsonify({'error': 'from/to must be ISO dates or timestamps'}), 400
+    query, params = exports.sales_query(start, end)
     try:
-        conn = sqlite3.connect('inventory.db')
-        conn.execute('PRAGMA foreign_keys = ON')
-        c = conn.cursor()
-        c.execute('''SELECT p.name, v.type, v.size, s.quantity, s.revenue, v.cost, s.sale_time
-                     FROM sales s JOIN variants v ON s.variant_id = v.variant_id
-                     JOIN products p ON v.product_id = p.product_id''')
-        data = c.fetchall()
-        conn.close()
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Sales History"
-        ws.append(['Product Name', 'Type', 'Size', 'Quantity', 'Revenue', 'Cost', 'Sale Time'])
-        for row in data:
-            ws.append(row)
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        return send_file(output, download_name='sales_history.xlsx', as_attachment=True)
+        return exports.export_response(
+            fmt, 'sales_history', 'Sales History',
+            ['Product Name', 'Type', 'Size', 'Quantity', 'Revenue', 'Cost', 'Sale Time'],
+            ['name', 'type', 'size', 'quantity', 'revenue', 'cost', 'sale_time'],
+            exports.fetch_sales_batches(query, params, app.config['ARCHIVE_FOLDER'], start, end))
+    except db.PoolTimeout:
+        raise
     except Exception as e:
         logger.error(f"Export sales error: {e}")
         return jsonify({'error': 'Export failed'}), 500
 
-if __name__ == '__main__':
-    logger.info("Starting application and initializing database")
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending schema migrations."""
+    with db.get_pool().connection() as conn:
+        version = migrations.migrate(conn)
+    logger.info(f"Database schema at version {version}")
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Apply migrations and seed an empty database; run once per deployment."""
+    init_db()
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Fail if any hot query's plan contains an unindexed table scan."""
+    with db.get_pool().connection() as conn:
+        migrations.migrate(conn)
+        failures = query_plans.check(conn)
+    for name, detail in failures:
+        logger.error(f"Full scan in {name}: {detail}")
+    if failures:
+        raise SystemExit(1)
+    logger.info(f"All {len(query_plans.HOT_QUERIES)} hot queries use indexes")
+
+@app.cli.command('import-catalog')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--dry-run', is_flag=True, help='Validate the file without writing anything.')
+def import_catalog_command(path, dry_run):
+    """Bulk import products and variants from a CSV or XLSX file."""
+    with open(path, 'rb') as f, db.transaction() as c:
+        report = catalog_import.import_catalog(c, catalog_import.read_rows(f, path), app.config['UPLOAD_FOLDER'], dry_run)
+    click.echo(json.dumps(report, indent=2))
+
+@app.cli.command('generate-thumbnails')
+def generate_thumbnails_command():
+    """Create missing thumbnail and display renditions for every variant photo."""
+    with db.transaction() as c:
+        c.execute("SELECT DISTINCT photo FROM variants WHERE photo IS NOT NULL")
+        photos = [row[0] for row in c.fetchall()]
+    for future in [images.schedule_renditions(app.config['UPLOAD_FOLDER'], photo) for photo in photos]:
+        future.result()
+    logger.info(f"Renditions checked for {len(photos)} photos")
+
+@app.cli.command('rebuild-reorder')
+def rebuild_reorder_command():
+    """Recompute reorder demand and velocity for every variant."""
+    with db.transaction() as c:
+        reorder.rebuild(c)
+    logger.info("Reorder suggestions rebuilt")
+
+@app.cli.command('rebuild-search')
+def rebuild_search_command():
+    """Reindex every variant for full-text search."""
+    with db.transaction() as c:
+        search.rebuild(c)
+    logger.info("Search index rebuilt")
+
+@app.cli.command('snapshot-stock')
+def snapshot_stock_command():
+    """Snapshot stock for variants that moved since their last snapshot (run daily)."""
+    with db.transaction() as c:
+        ledger.snapshot(c)
+
+@app.cli.command('check-stock')
+@click.option('--full', is_flag=True, help='Replay every movement from zero and verify snapshots too.')
+def check_stock_command(full):
+    """Fail if variants.stock disagrees with the stock ledger."""
+    with db.transaction() as c:
+        mismatches = ledger.check(c, full)
+    for mismatch in mismatches:
+        logger.error(f"Stock mismatch ({mismatch['kind']}) for {mismatch['variant_id']}: "
+                     f"ledger {mismatch['expected']}, recorded {mismatch['actual']}")
+    if mismatches:
+        raise SystemExit(1)
+    logger.info("Stock matches the ledger")
+
+@app.cli.command('generate-data')
+@click.option('--variants', default=50000, show_default=True)
+@click.option('--sales', default=5000000, show_default=True)
+@click.option('--pre-orders', default=20000, show_default=True)
+@click.option('--requests', 'requests_', default=20000, show_default=True)
+@click.option('--purchases', default=5000, show_default=True)
+@click.option('--days', default=365, show_default=True, help='Spread sales and backlogs over this many days.')
+@click.option('--seed', default=42, show_default=True)
+def generate_data_command(variants, sales, pre_orders, requests_, purchases, days, seed):
+    """Fill the database with a deterministic synthetic catalog and sales history."""
     init_db()
-    app.run(debug=True)
\ No newline at end of file
+    start = time.perf_counter()
+    with db.get_pool().connection() as conn:
+        datagen.generate(conn, variants, sales, pre_orders, requests_, purchases, days, seed)
+    logger.info(f"Synthetic data generated in {time.perf_counter() - start:.1f}s")
+
+@app.cli.command('archive-sales')
+@click.option('--keep-months', default=archive.KEEP_MONTHS, show_default=True,
+              help='Whole months kept in the hot sales table besides the current one.')
+def archive_sales_command(keep_months):
+    """Move closed months of sales to compressed per-month archive files."""
+    with db.get_pool().connection() as conn:
+        moved = archive.archive_sales(conn, app.config['ARCHIVE_FOLDER'], keep_months)
+    invalidate_analytics()
+    logger.info(f"Archived {sum(moved.values())} sales from {len(moved)} months")
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the revenue/profit rollups from the sales table and its archives."""
+    with db.transaction() as c:
+        with archive.sales_source(c, app.config['ARCHIVE_FOLDER'], None, None) as source:
+            rollups.rebuild_rollups(c, source)
+        total_revenue, total_profit = rollups.totals(c)
+    logger.info(f"Rollups rebuilt: revenue {total_revenue:.2f}, profit {total_profit:.2f}")
+
+if __name__ == '__main__':
+    logger.info("Starting development server")
+    create_app({'INIT_DB': True}).run(debug=True)
\ No newline at end of file
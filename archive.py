@@ -0,0 +1,196 @@
+import gzip
+import logging
+import os
+import re
+import shutil
+import sqlite3
+from contextlib import contextmanager, nullcontext
+from datetime import date
+import db
+
+logger = logging.getLogger(__name__)
+
+# Cold storage for closed months of sales. Each month is moved out of the
+# hot `sales` table into its own SQLite file, gzip-compressed as
+# sales-YYYY-MM.sqlite.gz in the archive folder. The rollups keep counting
+# archived sales (their delete triggers are suspended while rows move), so
+# totals, per-variant and per-day figures never need the archives; windowed
+# queries decompress the months they overlap into cache/ and ATTACH them.
+# Deleting a variant no longer cascades to its archived sales: they stay in
+# the archive and in the rollups (row-level reads join to `variants`).
+ARCHIVE_FOLDER = 'archive'
+KEEP_MONTHS = 3
+SALES_COLUMNS = 'sale_id, variant_id, quantity, revenue, sale_time, unit_cost'
+# Triggers on `sales` that must not see rows leaving for the archive
+DELETE_TRIGGERS = ('sales_rollup_delete', 'reorder_sale_delete')
+
+ARCHIVE_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS archived.sales
+       (sale_id TEXT PRIMARY KEY, variant_id TEXT, quantity INTEGER, revenue REAL, sale_time TEXT, unit_cost REAL)''',
+    '''CREATE INDEX IF NOT EXISTS archived.idx_sales_time_totals
+       ON sales(sale_time, variant_id, quantity, revenue, unit_cost)''',
+]
+
+_archive_name = re.compile(r'^sales-(\d{4}-\d{2})\.sqlite\.gz$')
+
+def month_start(month):
+    return f'{month}-01T00:00:00'
+
+def next_month(month):
+    year, number = int(month[:4]), int(month[5:7])
+    return f'{year + number // 12:04d}-{number % 12 + 1:02d}'
+
+def archive_path(folder, month):
+    return os.path.join(folder, f'sales-{month}.sqlite.gz')
+
+def archived_months(folder):
+    if not os.path.isdir(folder):
+        return []
+    return sorted(match.group(1) for match in map(_archive_name.match, os.listdir(folder)) if match)
+
+# Archived months overlapping the half-open window [start, end)
+def months_between(folder, start, end):
+    return [month for month in archived_months(folder)
+            if (not end or month_start(month) < end) and (not start or month_start(next_month(month)) > start)]
+
+# Decompressed copy of a month under cache/, refreshed when the archive is newer
+def local_copy(folder, month):
+    source = archive_path(folder, month)
+    cache = os.path.join(folder, 'cache')
+    path = os.path.join(cache, f'sales-{month}.sqlite')
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(source):
+        os.makedirs(cache, exist_ok=True)
+        partial = f'{path}.{os.getpid()}.tmp'
+        with gzip.open(source, 'rb') as src, open(partial, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(partial, path)
+    return path
+
+# ATTACH one archived month as `archived`. Must be entered and left outside
+# a transaction, as SQLite cannot attach or detach inside one, and with no
+# statement still reading it: close cursors used inside before leaving.
+@contextmanager
+def attached(conn, path):
+    conn.execute("ATTACH DATABASE ? AS archived", (path,))
+    try:
+        yield
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.execute("DETACH DATABASE archived")
+
+# Source of sales rows for the window [start, end): just `sales` while no
+# archived month overlaps it, otherwise the hot table unioned with a temp
+# table filled from each overlapping archive (attached one at a time, which
+# sidesteps SQLite's limit on attached databases). The caller filters the
+# window again; the filter is pushed into both arms of the union. Filling
+# the temp table attaches and commits on the caller's connection, so when an
+# archive is involved the caller must not have a transaction open; writes
+# may follow inside the block.
+@contextmanager
+def sales_source(c, folder, start, end):
+    months = months_between(folder, start, end) if folder else []
+    if not months:
+        yield 'sales'
+        return
+    if c.connection.in_transaction:
+        raise sqlite3.ProgrammingError('Reading archived sales needs a connection with no transaction open')
+    clauses = []
+    params = []
+    if start:
+        clauses.append('sale_time >= ?')
+        params.append(start)
+    if end:
+        clauses.append('sale_time < ?')
+        params.append(end)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    conn = c.connection
+    c.execute(f'CREATE TEMP TABLE IF NOT EXISTS archived_sales AS SELECT {SALES_COLUMNS} FROM main.sales WHERE 0')
+    try:
+        for month in months:
+            with attached(conn, local_copy(folder, month)):
+                c.execute(f'INSERT INTO temp.archived_sales SELECT {SALES_COLUMNS} FROM archived.sales {where}', params)
+                conn.commit()
+        yield f'(SELECT {SALES_COLUMNS} FROM main.sales UNION ALL SELECT {SALES_COLUMNS} FROM temp.archived_sales)'
+    finally:
+        c.execute('DROP TABLE IF EXISTS temp.archived_sales')
+
+# Yield batches of `query` run against each archived month overlapping the
+# window and then the hot table, in month order. The query reads its sales
+# rows from {sales}; joins to other tables resolve to the main database.
+def sales_batches(c, folder, start, end, query, params, batch_size):
+    sources = [(month, 'archived.sales') for month in (months_between(folder, start, end) if folder else [])]
+    for month, sales in sources + [(None, 'main.sales')]:
+        with attached(c.connection, local_copy(folder, month)) if month else nullcontext():
+            # Its own cursor, closed even when the consumer stops early (a
+            # client disconnecting mid-export), so the DETACH never meets a
+            # statement still stepping through the archive
+            cursor = c.connection.cursor()
+            try:
+                cursor.execute(query.format(sales=sales), params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                cursor.close()
+
+def first_open_month(keep_months, today=None):
+    today = today or date.today()
+    index = today.year * 12 + today.month - 1 - keep_months
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+# Move a month of sales to its archive. Rows are copied first (committing
+# only the archive file), then deleted from the hot table in a second
+# transaction that writes only the main database, so a crash in between
+# leaves duplicates to be skipped on the next run rather than lost rows. A
+# month that already has an archive (late sales) is decompressed, topped up
+# and recompressed. Returns the number of rows moved.
+def archive_month(conn, folder, month):
+    os.makedirs(folder, exist_ok=True)
+    work = os.path.join(folder, f'sales-{month}.sqlite')
+    target = archive_path(folder, month)
+    if os.path.exists(target) and not os.path.exists(work):
+        with gzip.open(target, 'rb') as src, open(work, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+    window = (month_start(month), month_start(next_month(month)))
+    with attached(conn, work):
+        conn.execute('BEGIN')
+        for statement in ARCHIVE_SCHEMA:
+            conn.execute(statement)
+        conn.execute(f'''INSERT OR IGNORE INTO archived.sales SELECT {SALES_COLUMNS} FROM main.sales
+                         WHERE sale_time >= ? AND sale_time < ?''', window)
+        conn.commit()
+        conn.execute('BEGIN IMMEDIATE')
+        c = conn.cursor()
+        with db.suspended_triggers(c, DELETE_TRIGGERS):
+            moved = c.execute('''DELETE FROM main.sales WHERE sale_time >= ? AND sale_time < ?
+                                 AND sale_id IN (SELECT sale_id FROM archived.sales)''', window).rowcount
+        conn.commit()
+    partial = f'{target}.tmp'
+    with open(work, 'rb') as src, open(partial, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst)
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(partial, target)
+    os.remove(work)
+    logger.info(f"Archived {moved} sales for {month}")
+    return moved
+
+# Archive every month before the last `keep_months` whole months. Returns
+# {month: rows moved}.
+def archive_sales(conn, folder, keep_months=KEEP_MONTHS, today=None):
+    if keep_months < 1:
+        raise ValueError('keep_months must be at least 1; reorder velocity reads recent sales')
+    cutoff = month_start(first_open_month(keep_months, today))
+    oldest = conn.execute('SELECT MIN(sale_time) FROM sales WHERE sale_time < ?', (cutoff,)).fetchone()[0]
+    moved = {}
+    month = oldest[:7] if oldest else None
+    while month and month_start(month) < cutoff:
+        window = (month_start(month), month_start(next_month(month)))
+        if conn.execute('SELECT 1 FROM sales WHERE sale_time >= ? AND sale_time < ? LIMIT 1', window).fetchone():
+            moved[month] = archive_month(conn, folder, month)
+        month = next_month(month)
+    return moved
@@ -0,0 +1,448 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import datagen
+import db
+from cache import LRUCache
+import passwords
+
+# Benchmarks run against a throwaway copy of the database so the real
+# inventory.db is never modified.
+def copy_database(source='inventory.db'):
+    workdir = tempfile.mkdtemp(prefix='invmgmt-bench-')
+    path = os.path.join(workdir, 'inventory.db')
+    shutil.copyfile(source, path)
+    return path
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(name, samples):
+    total = sum(samples)
+    return {
+        'name': name,
+        'requests': len(samples),
+        'throughput_per_s': round(len(samples) / total, 1) if total else 0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'mean_ms': round(total / len(samples) * 1000, 3),
+    }
+
+SUMMARY_FIELDS = ('name', 'requests', 'throughput_per_s', 'p50_ms', 'p99_ms', 'mean_ms')
+
+def start_app(inventory_app, path, pool_size=db.POOL_SIZE):
+    return inventory_app.create_app({'DATABASE': path, 'DB_POOL_SIZE': pool_size, 'INIT_DB': True,
+                                     'SECRET_KEY': 'benchmark'})
+
+def logged_in_client(app, username='admin', password='adminpass'):
+    client = app.test_client()
+    response = client.post('/login', json={'username': username, 'password': password})
+    if response.status_code != 200:
+        raise SystemExit(f"Benchmark login failed: {response.status_code}")
+    return client
+
+def timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+# The pre-pool behaviour: a fresh connection, PRAGMA and close per request.
+def legacy_transaction_factory(path):
+    @contextmanager
+    def legacy_transaction():
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA foreign_keys = ON')
+        try:
+            yield conn.cursor()
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    return legacy_transaction
+
+# The scan cache would answer every repeated barcode after the first pass,
+# so the connection comparison runs with a cache that never holds anything
+@contextmanager
+def scan_cache_disabled(inventory_app):
+    scan_cache = inventory_app.scan_cache
+    inventory_app.scan_cache = LRUCache(maxsize=0)
+    try:
+        yield
+    finally:
+        inventory_app.scan_cache = scan_cache
+
+def bench_scan(args):
+    import app as inventory_app
+    path = copy_database(args.database)
+    start_app(inventory_app, path)
+    client = logged_in_client(inventory_app.app)
+    scan = lambda: client.post('/scan', json={'barcode': args.barcode})
+    with scan_cache_disabled(inventory_app):
+        pooled_transaction = db.transaction
+        db.transaction = legacy_transaction_factory(path)
+        try:
+            timed(scan, args.warmup)
+            before = summarize('scan (connect per request)', timed(scan, args.iterations))
+        finally:
+            db.transaction = pooled_transaction
+        timed(scan, args.warmup)
+        after = summarize('scan (pooled connection)', timed(scan, args.iterations))
+    timed(scan, args.warmup)
+    cached = summarize('scan (pooled, scan cache hits)', timed(scan, args.iterations))
+    return [before, after, cached]
+
+def bench_metrics(args):
+    import app as inventory_app
+    path = copy_database(args.database)
+    start_app(inventory_app, path)
+    client = logged_in_client(inventory_app.app)
+    scan = lambda: client.post('/scan', json={'barcode': args.barcode})
+    observer = db.statement_observer
+    with scan_cache_disabled(inventory_app):
+        inventory_app.app.config['METRICS_ENABLED'] = False
+        db.statement_observer = None
+        try:
+            timed(scan, args.warmup)
+            without = summarize('scan (metrics off)', timed(scan, args.iterations))
+        finally:
+            inventory_app.app.config['METRICS_ENABLED'] = True
+            db.statement_observer = observer
+        timed(scan, args.warmup)
+        with_metrics = summarize('scan (metrics on)', timed(scan, args.iterations))
+    with_metrics['overhead_ms'] = round(with_metrics['mean_ms'] - without['mean_ms'], 3)
+    render = summarize('render /metrics', timed(lambda: client.get('/metrics'), 200))
+    return [without, with_metrics, render]
+
+# Mixed-workload scenarios for the load benchmark: (name, weight, request).
+# Each request takes the worker's client, its random generator and the
+# sampled catalog, and returns the response.
+def load_scenarios(catalog, end, days):
+    def scan(client, rng):
+        return client.post('/scan', json={'barcode': rng.choice(catalog)[1]})
+    def sell(client, rng):
+        variant_id, _, selling_price = rng.choice(catalog)
+        return client.post('/transactions', json={'action': 'sell', 'variant_id': variant_id, 'selling_price': selling_price})
+    def inventory_page(client, rng):
+        return client.get('/inventory')
+    def inventory_api(client, rng):
+        return client.get('/api/inventory')
+    def pre_orders(client, rng):
+        return client.get('/pre_orders')
+    def pre_orders_api(client, rng):
+        return client.get('/api/pre_orders')
+    def demand_api(client, rng):
+        return client.get('/api/demand')
+    def export_inventory(client, rng):
+        return client.get('/export_inventory?format=csv')
+    def export_sales(client, rng):
+        day = (end - timedelta(days=rng.randrange(days) + 1)).date()
+        return client.get(f'/export_sales?format=csv&from={day}&to={day}')
+    return [
+        ('scan', 40, scan),
+        ('transactions sell', 20, sell),
+        ('inventory', 5, inventory_page),
+        ('api/inventory', 15, inventory_api),
+        ('pre_orders', 2, pre_orders),
+        ('api/pre_orders', 2, pre_orders_api),
+        ('api/demand', 2, demand_api),
+        ('export_inventory csv', 1, export_inventory),
+        ('export_sales csv (1 day)', 5, export_sales),
+    ]
+
+def bench_load(args):
+    import app as inventory_app
+    path = copy_database(args.database)
+    start_app(inventory_app, path, max(args.threads, db.POOL_SIZE))
+    # History ends now, so reorder velocity and recent analytics windows hold sales
+    end = datetime.now()
+    if args.variants:
+        start = time.perf_counter()
+        with db.get_pool().connection() as conn:
+            datagen.generate(conn, args.variants, args.sales, args.pre_orders, args.requests, args.purchases,
+                             args.days, args.seed, end)
+        print(f"Generated synthetic data in {time.perf_counter() - start:.1f}s")
+    with db.transaction() as c:
+        c.execute("SELECT variant_id, barcode, selling_price FROM variants ORDER BY variant_id")
+        catalog = c.fetchall()
+    scenarios = load_scenarios(catalog, end, args.days)
+    names = [name for name, _, _ in scenarios]
+    weights = [weight for _, weight, _ in scenarios]
+    requests = {name: fn for name, _, fn in scenarios}
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+    clients = [logged_in_client(inventory_app.app) for _ in range(args.threads)]
+    barrier = threading.Barrier(args.threads + 1)
+
+    def worker(index):
+        rng = random.Random(args.seed + index)
+        client = clients[index]
+        local = {name: [] for name in names}
+        local_errors = {name: 0 for name in names}
+        barrier.wait()
+        deadline = time.perf_counter() + args.duration
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            response = requests[name](client, rng)
+            response.get_data()  # drain streamed exports
+            local[name].append(time.perf_counter() - start)
+            if response.status_code >= 500:
+                local_errors[name] += 1
+        with lock:
+            for name in names:
+                samples[name].extend(local[name])
+                errors[name] += local_errors[name]
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    results = []
+    for name in names + ['all']:
+        runs = [s for values in samples.values() for s in values] if name == 'all' else samples[name]
+        if not runs:
+            continue
+        result = summarize(name, runs)
+        # Concurrent requests overlap, so throughput is against wall time
+        result['throughput_per_s'] = round(len(runs) / elapsed, 1)
+        result['errors'] = sum(errors.values()) if name == 'all' else errors[name]
+        results.append(result)
+    results[-1].update({'threads': args.threads, 'duration_s': round(elapsed, 1), 'variants': len(catalog)})
+    return results
+
+# Concurrent tills hammering /transactions sell; run once committing each
+# sale directly and once through the write-behind queue.
+def bench_sells(args):
+    import app as inventory_app
+    path = copy_database(args.database)
+    start_app(inventory_app, path, max(args.threads, db.POOL_SIZE))
+    with db.transaction() as c:
+        c.execute("UPDATE variants SET stock = 1000000")
+        c.execute("SELECT variant_id, selling_price FROM variants")
+        catalog = c.fetchall()
+    clients = [logged_in_client(inventory_app.app) for _ in range(args.threads)]
+
+    def run(name):
+        samples = []
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(args.threads + 1)
+
+        def till(index):
+            rng = random.Random(index)
+            client = clients[index]
+            local = []
+            failed = 0
+            barrier.wait()
+            deadline = time.perf_counter() + args.duration
+            while time.perf_counter() < deadline:
+                variant_id, selling_price = rng.choice(catalog)
+                start = time.perf_counter()
+                response = client.post('/transactions', json={'action': 'sell', 'variant_id': variant_id,
+                                                              'selling_price': selling_price})
+                local.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    failed += 1
+            with lock:
+                samples.extend(local)
+                errors.append(failed)
+
+        threads = [threading.Thread(target=till, args=(i,)) for i in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        result = summarize(name, samples)
+        result['throughput_per_s'] = round(len(samples) / elapsed, 1)
+        result['errors'] = sum(errors)
+        return result
+
+    direct = run('sell (commit per sale)')
+    write_queue = db.start_write_queue(args.batch_size, args.delay_ms / 1000)
+    try:
+        batched = run('sell (write-behind)')
+        stats = write_queue.stats()
+    finally:
+        db.stop_write_queue()
+    batched['mean_batch'] = round(stats['operations'] / stats['batches'], 1) if stats['batches'] else 0
+    return [direct, batched]
+
+# Shift change: tills logging in while others keep scanning. Run once with
+# bcrypt on the request threads and once on the password worker pool, and
+# compare scan latency under the login burst.
+def bench_logins(args):
+    import app as inventory_app
+    path = copy_database(args.database)
+    start_app(inventory_app, path, max(args.scanners + args.logins, db.POOL_SIZE))
+    scan_clients = [logged_in_client(inventory_app.app) for _ in range(args.scanners)]
+    login_clients = [inventory_app.app.test_client() for _ in range(args.logins)]
+    credentials = {'username': 'admin', 'password': 'adminpass'}
+
+    def run(label, workers):
+        hasher = inventory_app.passwords.init_hasher(workers, args.queue_size, inventory_app.passwords.TIMEOUT,
+                                                     args.rounds)
+        # Spawn the worker processes before timing
+        hasher.check(hasher.hash('warmup'), 'warmup')
+        samples = {'scan': [], 'login': []}
+        statuses = {}
+        lock = threading.Lock()
+        barrier = threading.Barrier(args.scanners + args.logins + 1)
+
+        def worker(kind, client):
+            local = []
+            local_statuses = {}
+            barrier.wait()
+            deadline = time.perf_counter() + args.duration
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                if kind == 'scan':
+                    response = client.post('/scan', json={'barcode': args.barcode})
+                else:
+                    response = client.post('/login', json=credentials)
+                local.append(time.perf_counter() - start)
+                local_statuses[response.status_code] = local_statuses.get(response.status_code, 0) + 1
+            with lock:
+                samples[kind].extend(local)
+                for status, count in local_statuses.items():
+                    statuses[(kind, status)] = statuses.get((kind, status), 0) + count
+
+        threads = ([threading.Thread(target=worker, args=('scan', client)) for client in scan_clients] +
+                   [threading.Thread(target=worker, args=('login', client)) for client in login_clients])
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        results = []
+        for kind in ('scan', 'login'):
+            result = summarize(f'{kind} ({label})', samples[kind])
+            result['throughput_per_s'] = round(len(samples[kind]) / elapsed, 1)
+            result['errors'] = sum(count for (k, status), count in statuses.items() if k == kind and status != 200)
+            results.append(result)
+        stats = hasher.stats()
+        results[-1].update({'rejected': stats['rejected'], 'timeouts': stats['timeouts']})
+        return results
+
+    try:
+        return run('bcrypt on request threads', 0) + run('bcrypt worker pool', args.workers)
+    finally:
+        inventory_app.passwords.get_hasher().close()
+
+# Cold start of a worker: a fresh interpreter imports the app and runs
+# create_app(), as a WSGI server does for each worker it spawns. Reports
+# heavy optional modules that got imported eagerly.
+STARTUP_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app({'DATABASE': sys.argv[1], 'SECRET_KEY': 'benchmark'})
+ready = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create_app': ready - imported,
+                  'eager': [name for name in sys.argv[2:] if name in sys.modules]}))
+'''
+HEAVY_MODULES = ('openpyxl', 'PIL', 'brotli')
+
+def bench_startup(args):
+    path = copy_database(args.database)
+    here = os.path.dirname(os.path.abspath(__file__))
+    totals, imports, factories = [], [], []
+    eager = set()
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, path, *HEAVY_MODULES], cwd=here,
+                                check=True, capture_output=True, text=True).stdout
+        totals.append(time.perf_counter() - start)
+        timings = json.loads(output.strip().splitlines()[-1])
+        imports.append(timings['import'])
+        factories.append(timings['create_app'])
+        eager.update(timings['eager'])
+    results = [summarize('worker start (process total)', totals), summarize('import app', imports),
+               summarize('create_app()', factories)]
+    results[0]['eager_heavy_modules'] = ','.join(sorted(eager)) or 'none'
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Inventory management benchmarks')
+    parser.add_argument('--database', default='inventory.db')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    scan_parser = subparsers.add_parser('scan', help='/scan latency with and without the connection pool')
+    scan_parser.add_argument('--barcode', default='123456789')
+    scan_parser.add_argument('--iterations', type=int, default=2000)
+    scan_parser.add_argument('--warmup', type=int, default=100)
+    scan_parser.set_defaults(run=bench_scan)
+    metrics_parser = subparsers.add_parser('metrics', help='/scan latency with and without instrumentation')
+    metrics_parser.add_argument('--barcode', default='123456789')
+    metrics_parser.add_argument('--iterations', type=int, default=2000)
+    metrics_parser.add_argument('--warmup', type=int, default=100)
+    metrics_parser.set_defaults(run=bench_metrics)
+    sells_parser = subparsers.add_parser('sells', help='Sells per second with and without write-behind group commit')
+    sells_parser.add_argument('--threads', type=int, default=16)
+    sells_parser.add_argument('--duration', type=float, default=10, help='Seconds per mode')
+    sells_parser.add_argument('--batch-size', type=int, default=db.WRITE_BATCH_SIZE)
+    sells_parser.add_argument('--delay-ms', type=float, default=db.WRITE_BATCH_DELAY * 1000)
+    sells_parser.set_defaults(run=bench_sells)
+    load_parser = subparsers.add_parser('load', help='Concurrent mixed workload against a synthetic dataset')
+    load_parser.add_argument('--threads', type=int, default=8)
+    load_parser.add_argument('--duration', type=float, default=30, help='Seconds to run the workload')
+    load_parser.add_argument('--variants', type=int, default=5000, help='Synthetic variants to add (0 to use the database as is)')
+    load_parser.add_argument('--sales', type=int, default=200000)
+    load_parser.add_argument('--pre-orders', type=int, default=2000)
+    load_parser.add_argument('--requests', type=int, default=2000)
+    load_parser.add_argument('--purchases', type=int, default=500)
+    load_parser.add_argument('--days', type=int, default=365)
+    load_parser.add_argument('--seed', type=int, default=42)
+    load_parser.set_defaults(run=bench_load)
+    logins_parser = subparsers.add_parser('logins', help='/scan latency during a burst of logins, with and without the password pool')
+    logins_parser.add_argument('--barcode', default='123456789')
+    logins_parser.add_argument('--scanners', type=int, default=4)
+    logins_parser.add_argument('--logins', type=int, default=8)
+    logins_parser.add_argument('--duration', type=float, default=10, help='Seconds per mode')
+    logins_parser.add_argument('--workers', type=int, default=passwords.WORKERS)
+    logins_parser.add_argument('--queue-size', type=int, default=passwords.QUEUE_SIZE)
+    logins_parser.add_argument('--rounds', type=int, default=passwords.LOG_ROUNDS)
+    logins_parser.set_defaults(run=bench_logins)
+    startup_parser = subparsers.add_parser('startup', help='Worker cold start: interpreter, import and create_app()')
+    startup_parser.add_argument('--runs', type=int, default=10)
+    startup_parser.set_defaults(run=bench_startup)
+    args = parser.parse_args()
+    results = args.run(args)
+    for result in results:
+        extra = ''.join(f"  {key} {value}" for key, value in result.items() if key not in SUMMARY_FIELDS)
+        print(f"{result['name']:<40} p50 {result['p50_ms']:>8.3f} ms  p99 {result['p99_ms']:>8.3f} ms  "
+              f"{result['throughput_per_s']:>9.1f} req/s{extra}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'benchmark': args.benchmark, 'time': time.time(), 'results': results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
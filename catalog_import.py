@@ -0,0 +1,103 @@
+import csv
+import io
+import os
+import uuid
+import logging
+from werkzeug.utils import secure_filename
+
+from images import PLACEHOLDER_PHOTO
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 1000
+REQUIRED_COLUMNS = ('name', 'barcode', 'cost', 'selling_price', 'stock')
+
+def normalize_header(header):
+    return [str(column or '').strip().lower().replace(' ', '_') for column in header]
+
+# Stream dict rows from an uploaded CSV or XLSX file without loading it whole
+def read_rows(stream, filename):
+    if filename.lower().endswith('.xlsx'):
+        from openpyxl import load_workbook
+        wb = load_workbook(stream, read_only=True, data_only=True)
+        rows = wb.active.iter_rows(values_only=True)
+        header = normalize_header(next(rows, ()))
+        for row in rows:
+            if any(value not in (None, '') for value in row):
+                yield dict(zip(header, row))
+        wb.close()
+    else:
+        reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+        header = normalize_header(next(reader, ()))
+        for row in reader:
+            if any(value.strip() for value in row):
+                yield dict(zip(header, row))
+
+def text(value):
+    return '' if value is None else str(value).strip()
+
+def parse_row(row, upload_folder):
+    missing = [column for column in REQUIRED_COLUMNS if text(row.get(column)) == '']
+    if missing:
+        raise ValueError(f"Missing {', '.join(missing)}")
+    cost = float(row['cost'])
+    selling_price = float(row['selling_price'])
+    stock = int(float(row['stock']))
+    if cost < 0 or selling_price < 0 or stock < 0:
+        raise ValueError('Negative values not allowed')
+    photo = text(row.get('photo')) or PLACEHOLDER_PHOTO
+    # Only plain file names inside the upload folder; a path would later be
+    # served, and unlinked on delete, relative to it
+    if photo != secure_filename(photo):
+        raise ValueError(f"Photo {photo} must be a file name, not a path")
+    if photo != PLACEHOLDER_PHOTO and not os.path.isfile(os.path.join(upload_folder, photo)):
+        raise ValueError(f"Photo {photo} not found in uploads")
+    barcode = row['barcode']
+    if isinstance(barcode, float) and barcode.is_integer():
+        barcode = int(barcode)  # numeric barcode cells in spreadsheets
+    barcode = text(barcode)
+    return text(row['name']), barcode, text(row.get('type')), text(row.get('size')), cost, selling_price, stock, photo
+
+# Validate and insert catalog rows in one transaction. Duplicate barcodes are
+# checked against a set built once; products are matched by exact name and
+# created as needed. Invalid rows are skipped and reported by row number
+# (the header is row 1). With dry_run nothing is written.
+def import_catalog(c, rows, upload_folder, dry_run=False):
+    c.execute("SELECT barcode FROM variants")
+    barcodes = {row[0] for row in c.fetchall()}
+    c.execute("SELECT name, product_id FROM products")
+    products = dict(c.fetchall())
+    new_products = []
+    variants = []
+    report = {'rows': 0, 'imported': 0, 'products_created': 0, 'errors': [], 'dry_run': dry_run}
+    for row_number, row in enumerate(rows, start=2):
+        report['rows'] += 1
+        try:
+            name, barcode, type_, size, cost, selling_price, stock, photo = parse_row(row, upload_folder)
+        except (KeyError, TypeError, ValueError) as e:
+            report['errors'].append({'row': row_number, 'barcode': text(row.get('barcode')), 'error': str(e)})
+            continue
+        if barcode in barcodes:
+            report['errors'].append({'row': row_number, 'barcode': barcode, 'error': 'Duplicate barcode'})
+            continue
+        barcodes.add(barcode)
+        if name not in products:
+            products[name] = str(uuid.uuid4())
+            new_products.append((products[name], name))
+        variants.append((str(uuid.uuid4()), products[name], barcode, type_, size, cost, selling_price, stock, photo))
+        report['imported'] += 1
+        if len(variants) >= IMPORT_BATCH_SIZE:
+            flush(c, new_products, variants, report, dry_run)
+    flush(c, new_products, variants, report, dry_run)
+    logger.info(f"Catalog import{' (dry run)' if dry_run else ''}: {report['imported']} of {report['rows']} rows, "
+                f"{report['products_created']} new products, {len(report['errors'])} errors")
+    return report
+
+def flush(c, new_products, variants, report, dry_run):
+    if not dry_run:
+        c.executemany("INSERT INTO products (product_id, name) VALUES (?, ?)", new_products)
+        c.executemany('''INSERT INTO variants (variant_id, product_id, barcode, type, size, cost, selling_price, stock, photo)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', variants)
+    report['products_created'] += len(new_products)
+    new_products.clear()
+    variants.clear()
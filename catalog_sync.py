@@ -0,0 +1,78 @@
+# Catalog change log for offline-capable POS clients. Triggers on variants
+# and products stamp each changed variant with the next catalog version in
+# `catalog_changes` (one row per variant, so the log stays as large as the
+# catalog). Clients load a snapshot once, then ask for the variants changed
+# since the version they hold; deleted variants are kept as tombstones.
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS catalog_sequence
+       (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)''',
+    '''INSERT OR IGNORE INTO catalog_sequence VALUES (1, 0)''',
+    '''CREATE TABLE IF NOT EXISTS catalog_changes
+       (variant_id TEXT PRIMARY KEY, version INTEGER NOT NULL, deleted INTEGER NOT NULL DEFAULT 0)''',
+    '''CREATE INDEX IF NOT EXISTS idx_catalog_changes_version ON catalog_changes(version)''',
+    '''CREATE TRIGGER IF NOT EXISTS catalog_variant_insert AFTER INSERT ON variants
+       BEGIN
+           UPDATE catalog_sequence SET version = version + 1 WHERE id = 1;
+           INSERT OR REPLACE INTO catalog_changes VALUES (NEW.variant_id, (SELECT version FROM catalog_sequence WHERE id = 1), 0);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS catalog_variant_update
+       AFTER UPDATE OF product_id, barcode, type, size, selling_price, stock, photo ON variants
+       BEGIN
+           UPDATE catalog_sequence SET version = version + 1 WHERE id = 1;
+           INSERT OR REPLACE INTO catalog_changes VALUES (NEW.variant_id, (SELECT version FROM catalog_sequence WHERE id = 1), 0);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS catalog_variant_delete AFTER DELETE ON variants
+       BEGIN
+           UPDATE catalog_sequence SET version = version + 1 WHERE id = 1;
+           INSERT OR REPLACE INTO catalog_changes VALUES (OLD.variant_id, (SELECT version FROM catalog_sequence WHERE id = 1), 1);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS catalog_product_rename AFTER UPDATE OF name ON products
+       BEGIN
+           UPDATE catalog_sequence SET version = version + 1 WHERE id = 1;
+           INSERT OR REPLACE INTO catalog_changes
+           SELECT variant_id, (SELECT version FROM catalog_sequence WHERE id = 1), 0 FROM variants WHERE product_id = NEW.product_id;
+       END''',
+]
+
+# Positional fields of each catalog item
+FIELDS = ('variant_id', 'barcode', 'name', 'type', 'size', 'selling_price', 'stock', 'photo')
+
+def create_change_log(c):
+    for statement in SCHEMA:
+        c.execute(statement)
+    c.execute("UPDATE catalog_sequence SET version = 1 WHERE id = 1 AND version = 0")
+    c.execute('''INSERT OR IGNORE INTO catalog_changes (variant_id, version)
+                 SELECT variant_id, 1 FROM variants''')
+
+def current_version(c):
+    c.execute("SELECT version FROM catalog_sequence WHERE id = 1")
+    return c.fetchone()[0]
+
+# The version is read before the rows, so anything changed in between is
+# also returned by the next delta; clients apply items as idempotent upserts.
+def snapshot(c):
+    version = current_version(c)
+    c.execute('''SELECT v.variant_id, v.barcode, p.name, v.type, v.size, v.selling_price, v.stock, v.photo
+                 FROM variants v JOIN products p ON p.product_id = v.product_id''')
+    return version, [list(row) for row in c.fetchall()]
+
+# Returns (version, items, deleted variant_ids), or None when `since` is not
+# a version this database has issued and the client must reload the snapshot
+def delta(c, since):
+    version = current_version(c)
+    if since < 0 or since > version:
+        return None
+    c.execute('''SELECT ch.variant_id, ch.deleted, v.barcode, p.name, v.type, v.size, v.selling_price, v.stock, v.photo
+                 FROM catalog_changes ch
+                 LEFT JOIN variants v ON v.variant_id = ch.variant_id
+                 LEFT JOIN products p ON p.product_id = v.product_id
+                 WHERE ch.version > ?
+                 ORDER BY ch.version''', (since,))
+    items = []
+    deleted = []
+    for variant_id, is_deleted, *fields in c.fetchall():
+        if is_deleted or fields[0] is None:
+            deleted.append(variant_id)
+        else:
+            items.append([variant_id] + fields)
+    return version, items, deleted
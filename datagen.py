@@ -0,0 +1,97 @@
+import random
+import uuid
+import logging
+from datetime import datetime, timedelta
+import db
+import images
+import rollups
+import reorder
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 10000
+PRODUCT_NAMES = ['Team Jersey', 'Practice Kit', 'Hoodie', 'Training Top', 'Shorts', 'Socks', 'Scarf', 'Cap',
+                 'Jacket', 'Polo', 'Track Pants', 'Beanie', 'Gloves', 'Tote Bag', 'Water Bottle', 'Backpack']
+TYPES = ['Home', 'Away', 'Third', 'Training', 'Retro']
+SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
+FIRST_NAMES = ['Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Robin', 'Avery']
+LAST_NAMES = ['Smith', 'Jones', 'Patel', 'Garcia', 'Kim', 'Nguyen', 'Brown', 'Silva', 'Khan', 'Murphy']
+
+def batched(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# Deterministic synthetic catalog and history: the same seed, volumes and
+# `end` (default now) always produce the same rows. Everything is written
+# in one transaction; the rollup and reorder sales triggers are suspended
+# during the bulk insert, the new sales are then added to the rollups and
+# the reorder velocity window is recounted.
+def generate(conn, variants=50000, sales=5000000, pre_orders=20000, requests=20000, purchases=5000,
+             days=365, seed=42, end=None):
+    rng = random.Random(seed)
+    new_id = lambda: str(uuid.UUID(int=rng.getrandbits(128), version=4))
+    end = end or datetime.now()
+    start = end - timedelta(days=days)
+    span = int((end - start).total_seconds())
+    random_time = lambda: (start + timedelta(seconds=rng.randrange(span), microseconds=rng.randrange(1000000))).isoformat()
+    person = lambda: f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        c = conn.cursor()
+        c.execute("SELECT COALESCE(MAX(CAST(barcode AS INTEGER)), 0) FROM variants WHERE barcode GLOB '[0-9]*'")
+        next_barcode = max(c.fetchone()[0] + 1, 400000000000)
+        catalog = []
+        products = []
+        for i in range(variants):
+            if i % len(SIZES) == 0:
+                product_id = new_id()
+                products.append((product_id, f"{rng.choice(PRODUCT_NAMES)} {len(products) + 1}"))
+                cost = round(rng.uniform(5, 60), 2)
+                type_ = rng.choice(TYPES)
+            price = round(cost * rng.uniform(1.3, 2.5), 2)
+            catalog.append((new_id(), product_id, str(next_barcode + i), type_, SIZES[i % len(SIZES)],
+                            cost, price, rng.randrange(0, 60), images.PLACEHOLDER_PHOTO))
+        c.executemany("INSERT INTO products (product_id, name) VALUES (?, ?)", products)
+        for batch in batched(catalog):
+            c.executemany('''INSERT INTO variants (variant_id, product_id, barcode, type, size, cost, selling_price, stock, photo)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', batch)
+        logger.info(f"Generated {len(products)} products, {len(catalog)} variants")
+
+        def sale_rows():
+            for _ in range(sales):
+                variant = rng.choice(catalog)
+                quantity = rng.choice((1, 1, 1, 1, 2, 2, 3))
+                yield new_id(), variant[0], quantity, round(variant[6] * quantity, 2), random_time(), variant[5]
+        # New rows get rowids above the current maximum
+        c.execute("SELECT COALESCE(MAX(rowid), 0) FROM sales")
+        last_rowid = c.fetchone()[0]
+        with db.suspended_triggers(c, ('sales_rollup_insert',) + reorder.SALES_TRIGGERS):
+            for batch in batched(sale_rows()):
+                c.executemany('''INSERT INTO sales (sale_id, variant_id, quantity, revenue, sale_time, unit_cost)
+                                 VALUES (?, ?, ?, ?, ?, ?)''', batch)
+        rollups.add_rollups(c, '(SELECT * FROM sales WHERE rowid > ?)', (last_rowid,))
+        reorder.refresh(c, force=True)
+        logger.info(f"Generated {sales} sales")
+
+        for batch in batched((new_id(), rng.choice(catalog)[0], person(), f"555-{rng.randrange(10000):04d}",
+                              rng.randrange(1, 5), random_time()) for _ in range(pre_orders)):
+            c.executemany("INSERT INTO pre_orders VALUES (?, ?, ?, ?, ?, ?)", batch)
+        for batch in batched((new_id(), rng.choice(catalog)[0], person(), f"555-{rng.randrange(10000):04d}",
+                              random_time()) for _ in range(requests)):
+            c.executemany("INSERT INTO requests VALUES (?, ?, ?, ?, ?)", batch)
+        for batch in batched((new_id(), rng.choice(catalog)[0], rng.randrange(1, 50), random_time())
+                             for _ in range(purchases)):
+            c.executemany("INSERT INTO purchases VALUES (?, ?, ?, ?)", batch)
+        logger.info(f"Generated {pre_orders} pre-orders, {requests} requests, {purchases} purchases")
+        c.execute('ANALYZE')
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
@@ -0,0 +1,357 @@
+import sqlite3
+import queue
+import threading
+import logging
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DATABASE = 'inventory.db'
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+WRITE_BATCH_SIZE = 64
+# Memory-map the database so worker processes share the OS page cache
+# instead of each connection copying hot pages into its own cache, and cap
+# the WAL file at this size after each checkpoint
+MMAP_SIZE = 256 * 1024 * 1024
+JOURNAL_SIZE_LIMIT = 64 * 1024 * 1024
+WRITE_BATCH_DELAY = 0.002
+
+# Optional callback(sql, seconds) run after every statement; set by the metrics layer
+statement_observer = None
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        if statement_observer is None:
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            statement_observer(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        if statement_observer is None:
+            return super().executemany(sql, seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            statement_observer(sql, time.perf_counter() - start)
+
+# Connection.execute() goes through cursor(), so every statement is timed
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+# Raised when no pooled connection came free within the pool timeout
+class PoolTimeout(Exception):
+    pass
+
+# Pool of long-lived SQLite connections shared by all request threads.
+# Each connection is configured once (WAL, busy_timeout, synchronous=NORMAL,
+# foreign keys, mmap) instead of on every request. Connections are opened
+# lazily, so a pool created before a fork holds nothing a child could share.
+class ConnectionPool:
+    def __init__(self, path=DATABASE, size=POOL_SIZE, timeout=BUSY_TIMEOUT_MS / 1000):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._all = []
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE, factory=TimedConnection)
+        conn.execute('PRAGMA foreign_keys = ON')
+        conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        conn.execute(f'PRAGMA journal_size_limit = {JOURNAL_SIZE_LIMIT}')
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                conn = self._connect()
+                self._created += 1
+                self._all.append(conn)
+                return conn
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(f'No database connection free within {self.timeout}s') from None
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        changes = conn.total_changes
+        try:
+            yield conn
+            if conn.in_transaction:
+                commit(conn, conn.total_changes != changes)
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        idle = self._idle.qsize()
+        return {'size': self.size, 'open': self._created, 'idle': idle, 'in_use': self._created - idle}
+
+    def close(self):
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all = []
+            self._created = 0
+            self._idle = queue.LifoQueue(maxsize=self.size)
+
+# Group commit for POS writes. One writer thread owns a connection and runs
+# queued operations back to back in a single transaction, each inside its
+# own savepoint, committing every `batch_size` operations or `delay` seconds
+# after the first operation of the batch arrived. Callers block until the
+# batch holding their operation has committed, so a response still means
+# the write is in the database; a failing operation is rolled back alone
+# and its exception re-raised in the caller.
+class WriteQueue:
+    def __init__(self, pool, batch_size=WRITE_BATCH_SIZE, delay=WRITE_BATCH_DELAY):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.delay = delay
+        self.batches = 0
+        self.operations = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, operation):
+        future = Future()
+        self._queue.put((operation, future))
+        return future.result()
+
+    def _run(self):
+        conn = self.pool._connect()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                batch = [item]
+                deadline = time.perf_counter() + self.delay
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get(timeout=max(deadline - time.perf_counter(), 0))
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        self._queue.put(None)
+                        break
+                    batch.append(item)
+                self._commit(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit(self, conn, batch):
+        outcomes = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            c = conn.cursor()
+            changes = conn.total_changes
+            for operation, future in batch:
+                c.execute('SAVEPOINT write_op')
+                try:
+                    outcomes.append((future, operation(c), None))
+                except Exception as e:
+                    c.execute('ROLLBACK TO write_op')
+                    outcomes.append((future, None, e))
+                c.execute('RELEASE write_op')
+            commit(conn, conn.total_changes != changes)
+        except Exception as e:
+            logger.error(f"Write batch of {len(batch)} failed: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.operations += len(batch)
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        return {'batches': self.batches, 'operations': self.operations, 'queued': self._queue.qsize()}
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+# Notices commits made by other processes. PRAGMA data_version on the
+# watcher's own connection changes after any other connection commits,
+# including this process's pooled ones, so each commit that changed rows
+# also bumps the shared change_counter (see commit()) and the watcher
+# remembers the versions this process wrote. A change is reported when the
+# counter moved by more than this process's own commits, or when the data
+# changed without the counter moving (DDL, or a commit from outside the
+# app's pools); a foreign commit landing in the same interval as one of
+# those is still reported, an own commit is never.
+class ChangeWatcher:
+    def __init__(self, path=DATABASE):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._own = []
+        self._data_version = self._read_data_version()
+        self._version = self._read_version()
+
+    def _read_data_version(self):
+        return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def _read_version(self):
+        return self._conn.execute('SELECT version FROM change_counter WHERE id = 1').fetchone()[0]
+
+    # Inside the committing transaction; returns the version it will publish
+    def stamp(self, conn):
+        return conn.execute('UPDATE change_counter SET version = version + 1 WHERE id = 1 RETURNING version').fetchall()[0][0]
+
+    def committed(self, version):
+        with self._lock:
+            self._own.append(version)
+
+    def changed(self):
+        with self._lock:
+            data_version = self._read_data_version()
+            if data_version == self._data_version:
+                return False
+            self._data_version = data_version
+            version = self._read_version()
+            own = sum(1 for stamped in self._own if self._version < stamped <= version)
+            self._own = [stamped for stamped in self._own if stamped > version]
+            changed = version == self._version or version - self._version > own
+            self._version = version
+            return changed
+
+    def close(self):
+        self._conn.close()
+
+_pool = None
+_pool_lock = threading.Lock()
+_write_queue = None
+_watcher = None
+
+# Commit, first stamping the shared change counter when rows changed and a
+# watcher is running (MULTIPROCESS mode)
+def commit(conn, changed_rows=True):
+    watcher = _watcher
+    version = watcher.stamp(conn) if watcher is not None and changed_rows else None
+    conn.commit()
+    if version is not None:
+        watcher.committed(version)
+
+def start_change_watcher(path=DATABASE):
+    global _watcher
+    stop_change_watcher()
+    _watcher = ChangeWatcher(path)
+    return _watcher
+
+def stop_change_watcher():
+    global _watcher
+    if _watcher is not None:
+        _watcher.close()
+        _watcher = None
+
+def get_change_watcher():
+    return _watcher
+
+# Replacing the pool also stops write-behind, whose connection belongs to the old pool
+def init_pool(path=DATABASE, size=POOL_SIZE):
+    global _pool
+    with _pool_lock:
+        stop_write_queue()
+        if _pool is not None:
+            _pool.close()
+        _pool = ConnectionPool(path, size)
+    return _pool
+
+def get_pool():
+    if _pool is None:
+        init_pool()
+    return _pool
+
+# Drop the named triggers for a bulk operation inside the caller's
+# transaction, then recreate them from their stored definitions, i.e.
+# exactly as the migrations left them. If the block raises, the caller's
+# rollback restores them along with everything else.
+@contextmanager
+def suspended_triggers(c, names):
+    placeholders = ','.join('?' * len(names))
+    c.execute(f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN ({placeholders})", list(names))
+    definitions = c.fetchall()
+    for name, _ in definitions:
+        c.execute(f'DROP TRIGGER "{name}"')
+    yield
+    for _, sql in definitions:
+        c.execute(sql)
+
+# A connection outside the pool, configured like the pooled ones, for long
+# reads such as streamed exports: those last as long as the client takes to
+# download, and slow clients must not hold pool slots the routes need.
+@contextmanager
+def dedicated_connection():
+    conn = get_pool()._connect()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+# Check out a pooled connection and yield a cursor. Commits when the block
+# exits normally, rolls back if it raises.
+@contextmanager
+def transaction():
+    with get_pool().connection() as conn:
+        yield conn.cursor()
+
+def start_write_queue(batch_size=WRITE_BATCH_SIZE, delay=WRITE_BATCH_DELAY):
+    global _write_queue
+    stop_write_queue()
+    _write_queue = WriteQueue(get_pool(), batch_size, delay)
+    return _write_queue
+
+def stop_write_queue():
+    global _write_queue
+    if _write_queue is not None:
+        _write_queue.close()
+        _write_queue = None
+
+def get_write_queue():
+    return _write_queue
+
+# Run operation(cursor) as a write and return its result: through the
+# write-behind queue when it is running, otherwise in its own IMMEDIATE
+# transaction on a pooled connection. The operation runs off the request
+# thread in write-behind mode, so it must not touch Flask's request context.
+def write(operation):
+    if _write_queue is not None:
+        return _write_queue.submit(operation)
+    with get_pool().connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        return operation(conn.cursor())
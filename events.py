@@ -0,0 +1,49 @@
+import json
+import threading
+from collections import deque
+
+HISTORY_SIZE = 1000
+HEARTBEAT_SECONDS = 15
+
+# In-process publish/subscribe for Server-Sent Events. Every event gets a
+# monotonically increasing version (the SSE id), and recent events are
+# kept so a reconnecting client can resume from its Last-Event-ID.
+class EventBroker:
+    def __init__(self, history=HISTORY_SIZE):
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=history)
+        self.version = 0
+
+    def publish(self, kind, data):
+        with self._condition:
+            self.version += 1
+            self._events.append((self.version, kind, data))
+            self._condition.notify_all()
+            return self.version
+
+    # Events newer than `version`, or None if the client is too far behind
+    # (or from before a restart) to resume and must reload instead
+    def since(self, version):
+        if version > self.version or (self._events and version < self._events[0][0] - 1):
+            return None
+        return [event for event in self._events if event[0] > version]
+
+    def wait(self, version, timeout):
+        with self._condition:
+            self._condition.wait_for(lambda: self.version != version, timeout)
+            return self.since(version)
+
+    def stream(self, last_id=None, heartbeat=HEARTBEAT_SECONDS):
+        version = self.version if last_id is None else last_id
+        yield 'retry: 3000\n\n'
+        while True:
+            events = self.wait(version, heartbeat)
+            if events is None:
+                version = self.version
+                yield f"id: {version}\nevent: reset\ndata: {{}}\n\n"
+                continue
+            if not events:
+                yield ': keepalive\n\n'
+                continue
+            for version, kind, data in events:
+                yield f"id: {version}\nevent: {kind}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,111 @@
+import csv
+import io
+import json
+import logging
+import tempfile
+from datetime import datetime, timedelta
+from flask import Response, send_file
+import db
+import archive
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FORMATS = ('xlsx', 'csv', 'ndjson')
+INVENTORY_QUERY = '''SELECT p.name, v.type, v.size, v.barcode, v.cost, v.selling_price, v.stock
+                     FROM products p JOIN variants v ON p.product_id = v.product_id'''
+
+# Parse optional from/to bounds into a half-open [start, end) range of ISO
+# timestamps. A date-only `to` includes that whole day.
+def time_range(start, end):
+    if start:
+        start = datetime.fromisoformat(start).isoformat()
+    if end:
+        parsed = datetime.fromisoformat(end)
+        if len(end) == 10:
+            parsed += timedelta(days=1)
+        end = parsed.isoformat()
+    return start or None, end or None
+
+# Sales in the [start, end) window, oldest first, for fetch_sales_batches
+def sales_query(start, end):
+    clauses = []
+    params = []
+    if start:
+        clauses.append('s.sale_time >= ?')
+        params.append(start)
+    if end:
+        clauses.append('s.sale_time < ?')
+        params.append(end)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    return f'''SELECT p.name, v.type, v.size, s.quantity, s.revenue, COALESCE(s.unit_cost, v.cost), s.sale_time
+                FROM {{sales}} s JOIN variants v ON s.variant_id = v.variant_id
+                JOIN products p ON v.product_id = p.product_id
+                {where}
+                ORDER BY s.sale_time''', params
+
+# Yield query results in batches, so only one batch is held in memory at a
+# time. The rows stream at the client's pace, so they are read on a
+# dedicated connection rather than a pooled one.
+def fetch_batches(query, params=()):
+    with db.dedicated_connection() as conn:
+        c = conn.cursor()
+        c.execute(query, params)
+        while True:
+            rows = c.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            yield rows
+
+# Like fetch_batches for a query reading {sales}: archived months in the
+# [start, end) window are streamed first, then the hot table
+def fetch_sales_batches(query, params, archive_folder, start, end):
+    with db.dedicated_connection() as conn:
+        yield from archive.sales_batches(conn.cursor(), archive_folder, start, end, query, params, EXPORT_BATCH_SIZE)
+
+def csv_stream(header, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def ndjson_stream(keys, batches):
+    for rows in batches:
+        yield ''.join(json.dumps(dict(zip(keys, row))) + '\n' for row in rows)
+
+# openpyxl's write-only mode streams rows to a temporary file instead of
+# keeping the whole sheet in memory
+def xlsx_file(title, header, batches):
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    ws.append(header)
+    for rows in batches:
+        for row in rows:
+            ws.append(row)
+    output = tempfile.TemporaryFile()
+    wb.save(output)
+    output.seek(0)
+    return output
+
+def logged(stream, filename):
+    try:
+        yield from stream
+    except Exception as e:
+        logger.error(f"Export {filename} aborted: {e}")
+        raise
+
+def export_response(fmt, filename, title, header, keys, batches):
+    if fmt == 'csv':
+        return Response(logged(csv_stream(header, batches), filename), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename={filename}.csv'})
+    if fmt == 'ndjson':
+        return Response(logged(ndjson_stream(keys, batches), filename), mimetype='application/x-ndjson',
+                        headers={'Content-Disposition': f'attachment; filename={filename}.ndjson'})
+    return send_file(xlsx_file(title, header, batches), download_name=f'{filename}.xlsx', as_attachment=True,
+                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
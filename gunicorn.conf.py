@@ -0,0 +1,27 @@
+# gunicorn settings; see wsgi.py for the serving modes.
+#     gunicorn -c gunicorn.conf.py wsgi:app
+import os
+import secrets
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# Threaded workers: each open /events stream holds a thread for as long as
+# the page is open, so leave room above the expected request concurrency
+worker_class = 'gthread'
+threads = int(os.environ.get('THREADS', 16))
+# Each worker runs create_app() after forking; the master only migrates
+# and closes its connections, so none is ever shared between processes
+preload_app = False
+graceful_timeout = 30
+
+# Read by every worker through the inherited environment
+os.environ.setdefault('MULTIPROCESS', '1' if workers > 1 else '0')
+os.environ.setdefault('DB_POOL_SIZE', str(min(threads, 8)))
+if not os.environ.get('SECRET_KEY'):
+    # Shared by this master's workers, but sessions still end on restart
+    os.environ['SECRET_KEY'] = secrets.token_hex(32)
+
+# Migrate and seed once, in the master, before any worker starts
+def on_starting(server):
+    import app
+    app.prepare_database()
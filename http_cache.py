@@ -0,0 +1,56 @@
+import gzip
+import hashlib
+import threading
+import uuid
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = 1024
+COMPRESSIBLE_TYPES = ('text/html', 'text/plain', 'text/css', 'text/csv', 'application/json', 'application/javascript')
+
+# Process-wide counter bumped after every write request. ETags are built from
+# it (plus a per-process token, so a restart never revalidates an old page),
+# which lets read routes answer If-None-Match without querying the database.
+class DataVersion:
+    def __init__(self):
+        self.token = uuid.uuid4().hex[:8]
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def bump(self):
+        with self._lock:
+            self.value += 1
+            return self.value
+
+    def etag(self, *parts):
+        digest = hashlib.sha1('\0'.join(str(part) for part in parts).encode()).hexdigest()[:16]
+        return f"{self.token}-{self.value}-{digest}"
+
+def preferred_encoding(accept_encoding):
+    if brotli is not None and 'br' in accept_encoding:
+        return 'br'
+    if 'gzip' in accept_encoding:
+        return 'gzip'
+    return None
+
+# Compress a buffered text response in place when the client accepts it.
+# Streamed responses (exports, the event feed) are left alone.
+def compress_response(response, accept_encoding):
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = preferred_encoding(accept_encoding)
+    data = response.get_data()
+    if encoding is None or len(data) < COMPRESS_MIN_SIZE:
+        return response
+    if encoding == 'br':
+        data = brotli.compress(data, quality=5)
+    else:
+        data = gzip.compress(data, compresslevel=6)
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,99 @@
+import hashlib
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_PHOTO = 'placeholder.jpg'
+# Derived sizes, stored in a subfolder of the upload folder with the same filename
+SIZES = {'thumb': (160, 160), 'display': (800, 800)}
+WORKERS = 2
+
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='images')
+
+def derived_path(upload_folder, size, filename):
+    return os.path.join(upload_folder, size, filename)
+
+# Read an uploaded photo and name it by its content hash, so identical
+# images are kept once. Nothing is written here: save_upload() stores it
+# once the rows referencing it have committed, so a rejected insert leaves
+# no file behind.
+def read_upload(file):
+    data = file.read()
+    extension = file.filename.rsplit('.', 1)[1].lower()
+    return f"{hashlib.sha256(data).hexdigest()}.{extension}", data
+
+# Write the photo unless it is already stored, and queue thumbnail/display
+# renditions off the request path
+def save_upload(upload_folder, filename, data):
+    path = os.path.join(upload_folder, filename)
+    if not os.path.exists(path):
+        partial = f"{path}.{uuid.uuid4().hex}.partial"
+        with open(partial, 'wb') as f:
+            f.write(data)
+        os.replace(partial, path)
+    return schedule_renditions(upload_folder, filename)
+
+def schedule_renditions(upload_folder, filename):
+    return _executor.submit(make_renditions, upload_folder, filename)
+
+def make_renditions(upload_folder, filename):
+    try:
+        from PIL import Image
+    except ImportError:
+        # Without Pillow every size falls back to the original
+        return
+    source = os.path.join(upload_folder, filename)
+    try:
+        for size, bounds in SIZES.items():
+            target = derived_path(upload_folder, size, filename)
+            if os.path.exists(target):
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with Image.open(source) as image:
+                image_format = image.format
+                image.thumbnail(bounds)
+                if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+                # Write to a temporary name so readers never see a partial file
+                partial = f"{target}.{uuid.uuid4().hex}.partial"
+                image.save(partial, format=image_format, optimize=True)
+                os.replace(partial, target)
+    except (OSError, ValueError) as e:
+        logger.error(f"Image rendition failed for {filename}: {e}")
+
+# Photos are shared between variants; a file is only removed once no variant
+# references it. Call inside the deleting transaction, after the DELETE.
+def unreferenced(c, photos):
+    orphans = []
+    for photo in set(photos):
+        if not photo or photo == PLACEHOLDER_PHOTO:
+            continue
+        c.execute("SELECT 1 FROM variants WHERE photo = ? LIMIT 1", (photo,))
+        if not c.fetchone():
+            orphans.append(photo)
+    return orphans
+
+# Delete the files of photos found unreferenced. An upload of the same
+# image may have committed since, so the references are checked again
+# under the database write lock: uploads commit their rows under that lock
+# before writing the file, so either they see no file and write it again,
+# or this check sees their row and keeps it.
+def remove(upload_folder, photos):
+    if photos:
+        db.write(lambda c: _remove_unreferenced(c, upload_folder, photos))
+
+def _remove_unreferenced(c, upload_folder, photos):
+    folder = os.path.realpath(upload_folder)
+    for photo in unreferenced(c, photos):
+        for path in [os.path.join(upload_folder, photo)] + [derived_path(upload_folder, size, photo) for size in SIZES]:
+            # Photo names come from the database; never unlink outside the folder
+            if os.path.commonpath([folder, os.path.realpath(path)]) != folder:
+                logger.warning(f"Not removing {path}: outside the upload folder")
+                continue
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,162 @@
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Append-only stock ledger. Triggers on variants record every stock change
+# in `stock_movements` with the reason set by the writer (see reason()), so
+# no code path can change stock without leaving a movement. Periodic
+# per-variant snapshots hold the stock as of a movement id; stock at any
+# time is the nearest earlier snapshot plus the movements after it.
+SNAPSHOT_INTERVAL = timedelta(days=1)
+
+MOVEMENT_TIME = "strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')"
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS stock_movements
+       (movement_id INTEGER PRIMARY KEY, variant_id TEXT NOT NULL, change INTEGER NOT NULL,
+        reason TEXT NOT NULL, movement_time TEXT NOT NULL)''',
+    '''CREATE INDEX IF NOT EXISTS idx_stock_movements_variant
+       ON stock_movements(variant_id, movement_id, movement_time, change)''',
+    '''CREATE TABLE IF NOT EXISTS stock_snapshots
+       (variant_id TEXT NOT NULL, movement_id INTEGER NOT NULL, snapshot_time TEXT NOT NULL, stock INTEGER NOT NULL,
+        PRIMARY KEY (variant_id, movement_id))''',
+    '''CREATE INDEX IF NOT EXISTS idx_stock_snapshots_time ON stock_snapshots(snapshot_time)''',
+    # Reason for the stock changes of the current write; unset outside reason()
+    '''CREATE TABLE IF NOT EXISTS stock_reason
+       (id INTEGER PRIMARY KEY CHECK (id = 1), reason TEXT NOT NULL)''',
+    f'''CREATE TRIGGER IF NOT EXISTS ledger_variant_insert AFTER INSERT ON variants
+        WHEN COALESCE(NEW.stock, 0) != 0
+        BEGIN
+            INSERT INTO stock_movements (variant_id, change, reason, movement_time)
+            VALUES (NEW.variant_id, NEW.stock, COALESCE((SELECT reason FROM stock_reason WHERE id = 1), 'initial'), {MOVEMENT_TIME});
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS ledger_variant_stock AFTER UPDATE OF stock ON variants
+        WHEN COALESCE(NEW.stock, 0) != COALESCE(OLD.stock, 0)
+        BEGIN
+            INSERT INTO stock_movements (variant_id, change, reason, movement_time)
+            VALUES (NEW.variant_id, COALESCE(NEW.stock, 0) - COALESCE(OLD.stock, 0),
+                    COALESCE((SELECT reason FROM stock_reason WHERE id = 1), 'adjustment'), {MOVEMENT_TIME});
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS ledger_variant_delete AFTER DELETE ON variants
+        WHEN COALESCE(OLD.stock, 0) != 0
+        BEGIN
+            INSERT INTO stock_movements (variant_id, change, reason, movement_time)
+            VALUES (OLD.variant_id, -OLD.stock, 'deleted', {MOVEMENT_TIME});
+        END''',
+]
+
+# Reasons used by the application
+REASONS = ('opening', 'initial', 'count', 'sale', 'purchase', 'adjustment', 'deleted')
+
+def create_ledger(c):
+    for statement in SCHEMA:
+        c.execute(statement)
+    c.execute(f'''INSERT INTO stock_movements (variant_id, change, reason, movement_time)
+                  SELECT variant_id, stock, 'opening', {MOVEMENT_TIME} FROM variants
+                  WHERE COALESCE(stock, 0) != 0''')
+    snapshot(c)
+
+# Label the stock changes made inside the block, e.g.
+#     with ledger.reason(c, 'sale'):
+#         c.execute("UPDATE variants SET stock = stock - 1 ...")
+# Runs inside the caller's transaction, so a rollback also drops the label.
+# The label is written through a separate cursor, so the caller's rowcount
+# still belongs to its own statements, and cleared even if the block raises.
+@contextmanager
+def reason(c, label):
+    labels = c.connection.cursor()
+    labels.execute("INSERT OR REPLACE INTO stock_reason VALUES (1, ?)", (label,))
+    try:
+        yield
+    finally:
+        labels.execute("DELETE FROM stock_reason")
+
+def last_snapshot_time(c):
+    c.execute("SELECT MAX(snapshot_time) FROM stock_snapshots")
+    return c.fetchone()[0]
+
+def snapshot_due(c, now=None):
+    last = last_snapshot_time(c)
+    return last is None or datetime.fromisoformat(last) <= (now or datetime.now()) - SNAPSHOT_INTERVAL
+
+# Snapshot every variant whose stock moved since its last snapshot; variants
+# without movements keep their previous snapshot. Returns rows written.
+def snapshot(c):
+    c.execute("SELECT COALESCE(MAX(movement_id), 0) FROM stock_snapshots")
+    since = c.fetchone()[0]
+    c.execute('''INSERT OR IGNORE INTO stock_snapshots (variant_id, movement_id, snapshot_time, stock)
+                 SELECT m.variant_id, m.movement_id, ?, v.stock
+                 FROM (SELECT variant_id, MAX(movement_id) AS movement_id FROM stock_movements
+                       WHERE movement_id > ? GROUP BY variant_id) AS m
+                 JOIN variants v ON v.variant_id = m.variant_id''', (datetime.now().isoformat(), since))
+    written = c.rowcount
+    logger.info(f"Stock snapshot: {written} variants")
+    return written
+
+# Stock per variant as of `at` (an ISO timestamp), for the given variant ids
+# or a page of variants ordered by id after `after`. Returns (variant_id,
+# stock) pairs; variants created after `at` report 0.
+def stock_at(c, at, variant_ids=None, after=None, limit=None):
+    if variant_ids is not None:
+        placeholders = ','.join('?' * len(variant_ids))
+        where, params = f"WHERE v.variant_id IN ({placeholders})", list(variant_ids)
+    else:
+        where, params = ("WHERE v.variant_id > ?", [after]) if after else ('', [])
+    page = 'LIMIT ?' if limit else ''
+    c.execute(f'''SELECT v.variant_id,
+                         COALESCE(s.stock, 0) + COALESCE((SELECT SUM(m.change) FROM stock_movements m
+                                                          WHERE m.variant_id = v.variant_id
+                                                          AND m.movement_id > COALESCE(s.movement_id, 0)
+                                                          AND m.movement_time <= ?), 0)
+                  FROM variants v
+                  LEFT JOIN stock_snapshots s ON s.variant_id = v.variant_id
+                  AND s.movement_id = (SELECT MAX(movement_id) FROM stock_snapshots
+                                       WHERE variant_id = v.variant_id AND snapshot_time <= ?)
+                  {where}
+                  ORDER BY v.variant_id {page}''', [at, at] + params + ([limit] if limit else []))
+    return c.fetchall()
+
+# Movements of one variant, newest first, paged by movement id
+def movements(c, variant_id, before=None, limit=50):
+    c.execute(f'''SELECT movement_id, change, reason, movement_time FROM stock_movements
+                  WHERE variant_id = ? {'AND movement_id < ?' if before else ''}
+                  ORDER BY movement_id DESC LIMIT ?''',
+              [variant_id] + ([before] if before else []) + [limit])
+    return c.fetchall()
+
+# Compare variants.stock with the ledger. The quick check replays from each
+# variant's latest snapshot; full=True replays every movement from zero,
+# also verifies each snapshot against that replay and checks that deleted
+# variants net to zero. Returns a list of mismatches.
+def check(c, full=False):
+    mismatches = []
+    if full:
+        c.execute('''SELECT v.variant_id, COALESCE(v.stock, 0),
+                            COALESCE((SELECT SUM(change) FROM stock_movements m WHERE m.variant_id = v.variant_id), 0) AS ledger
+                     FROM variants v WHERE COALESCE(v.stock, 0) != ledger''')
+    else:
+        c.execute('''SELECT v.variant_id, COALESCE(v.stock, 0),
+                            COALESCE(s.stock, 0) + COALESCE((SELECT SUM(m.change) FROM stock_movements m
+                                                             WHERE m.variant_id = v.variant_id
+                                                             AND m.movement_id > COALESCE(s.movement_id, 0)), 0) AS ledger
+                     FROM variants v
+                     LEFT JOIN stock_snapshots s ON s.variant_id = v.variant_id
+                     AND s.movement_id = (SELECT MAX(movement_id) FROM stock_snapshots WHERE variant_id = v.variant_id)
+                     WHERE COALESCE(v.stock, 0) != ledger''')
+    mismatches += [{'variant_id': variant_id, 'kind': 'stock', 'expected': ledger, 'actual': stock}
+                   for variant_id, stock, ledger in c.fetchall()]
+    if full:
+        c.execute('''SELECT s.variant_id, s.movement_id, s.stock,
+                            (SELECT COALESCE(SUM(change), 0) FROM stock_movements m
+                             WHERE m.variant_id = s.variant_id AND m.movement_id <= s.movement_id) AS ledger
+                     FROM stock_snapshots s WHERE s.stock != ledger''')
+        mismatches += [{'variant_id': variant_id, 'kind': f'snapshot@{movement_id}', 'expected': ledger, 'actual': stock}
+                       for variant_id, movement_id, stock, ledger in c.fetchall()]
+        c.execute('''SELECT variant_id, SUM(change) FROM stock_movements
+                     WHERE variant_id NOT IN (SELECT variant_id FROM variants)
+                     GROUP BY variant_id HAVING SUM(change) != 0''')
+        mismatches += [{'variant_id': variant_id, 'kind': 'deleted', 'expected': 0, 'actual': balance}
+                       for variant_id, balance in c.fetchall()]
+    return mismatches
@@ -0,0 +1,171 @@
+import hashlib
+import re
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Minimal in-process Prometheus metrics: counters, histograms and gauges
+# read through callbacks at scrape time, rendered in the text format.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+MAX_STATEMENT_LABELS = 500
+# Statements longer than this are labelled by a prefix and a hash of the
+# whole fingerprint, so distinct statements never share a label
+MAX_LABEL_LENGTH = 160
+# Schema changes and connection setup are timed under one shared label
+SCHEMA_LABEL = 'schema'
+SCHEMA_KEYWORDS = ('CREATE', 'DROP', 'ALTER', 'PRAGMA', 'ANALYZE', 'VACUUM', 'REINDEX')
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{format_labels(self.label_names, labels)} {value}')
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        names = self.label_names + ('le',)
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{self.name}_bucket{format_labels(names, labels + (bound,))} {cumulative}')
+                lines.append(f'{self.name}_bucket{format_labels(names, labels + ("+Inf",))} {count}')
+                lines.append(f'{self.name}_sum{format_labels(self.label_names, labels)} {total}')
+                lines.append(f'{self.name}_count{format_labels(self.label_names, labels)} {count}')
+        return lines
+
+class Gauge:
+    def __init__(self, name, help_text, label_names, read):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.read = read
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} gauge']
+        try:
+            values = self.read()
+        except Exception as e:
+            logger.error(f"Gauge {self.name} failed: {e}")
+            return lines
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in sorted(values.items()):
+            lines.append(f'{self.name}{format_labels(self.label_names, labels)} {value}')
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+request_latency = registry.register(Histogram(
+    'http_request_duration_seconds', 'Time to produce the response headers, per route.', ('method', 'route')))
+request_count = registry.register(Counter(
+    'http_requests_total', 'Requests by route and status code.', ('method', 'route', 'status')))
+statement_latency = registry.register(Histogram(
+    'sqlite_statement_duration_seconds', 'Time spent in execute/executemany, per normalized statement.', ('statement',)))
+
+_whitespace = re.compile(r'\s+')
+_string_literal = re.compile(r"'(?:[^']|'')*'")
+_number_literal = re.compile(r'(?<![\w.])\d+(?:\.\d+)?\b')
+_placeholder_list = re.compile(r'\?(?:\s*,\s*\?)+')
+_statement_labels = {}
+_labels_in_use = set()
+_statement_lock = threading.Lock()
+
+# Fingerprint of a statement's shape: whitespace collapsed, literals and
+# variable-length IN (?, ?, ...) lists replaced by placeholders
+def fingerprint(sql):
+    normalized = _whitespace.sub(' ', sql).strip()
+    normalized = _number_literal.sub('?', _string_literal.sub('?', normalized))
+    return _placeholder_list.sub('?...', normalized)
+
+# Label for a statement, memoized per SQL string. Schema statements are
+# neither memoized nor counted against MAX_STATEMENT_LABELS.
+def statement_label(sql):
+    label = _statement_labels.get(sql)
+    if label is None:
+        keyword = sql.split(None, 1)[:1]
+        if keyword and keyword[0].upper() in SCHEMA_KEYWORDS:
+            return SCHEMA_LABEL
+        label = fingerprint(sql)
+        if len(label) > MAX_LABEL_LENGTH:
+            digest = hashlib.sha1(label.encode('utf-8')).hexdigest()[:12]
+            label = f'{label[:MAX_LABEL_LENGTH - 16]}... {digest}'
+        with _statement_lock:
+            if label not in _labels_in_use:
+                if len(_labels_in_use) >= MAX_STATEMENT_LABELS:
+                    return 'other'
+                _labels_in_use.add(label)
+            _statement_labels[sql] = label
+    return label
+
+class StatementTimer:
+    def __init__(self, slow_query_seconds=None):
+        self.slow_query_seconds = slow_query_seconds
+
+    def __call__(self, sql, seconds):
+        label = statement_label(sql)
+        statement_latency.observe((label,), seconds)
+        if self.slow_query_seconds is not None and seconds >= self.slow_query_seconds:
+            logger.warning(f"Slow query ({seconds * 1000:.1f} ms): {label}")
+
+def observe_request(method, route, status, seconds):
+    request_latency.observe((method, route), seconds)
+    request_count.inc((method, route, str(status)))
@@ -0,0 +1,94 @@
+import logging
+import rollups
+import reorder
+import catalog_sync
+import search
+import ledger
+import queues
+
+logger = logging.getLogger(__name__)
+
+# Numbered schema migrations. The applied version is kept in
+# PRAGMA user_version; each migration runs in its own transaction and
+# is never edited once released - add a new one instead.
+BASELINE_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS products
+       (product_id TEXT PRIMARY KEY, name TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS variants
+       (variant_id TEXT PRIMARY KEY, product_id TEXT, barcode TEXT UNIQUE, type TEXT, size TEXT,
+        cost REAL, selling_price REAL, stock INTEGER, photo TEXT,
+        FOREIGN KEY(product_id) REFERENCES products(product_id) ON DELETE CASCADE)''',
+    '''CREATE TABLE IF NOT EXISTS requests
+       (request_id TEXT PRIMARY KEY, variant_id TEXT, customer_name TEXT, contact_info TEXT,
+        FOREIGN KEY(variant_id) REFERENCES variants(variant_id) ON DELETE CASCADE)''',
+    '''CREATE TABLE IF NOT EXISTS sales
+       (sale_id TEXT PRIMARY KEY, variant_id TEXT, quantity INTEGER, revenue REAL, sale_time TEXT, unit_cost REAL,
+        FOREIGN KEY(variant_id) REFERENCES variants(variant_id) ON DELETE CASCADE)''',
+    '''CREATE TABLE IF NOT EXISTS users
+       (user_id TEXT PRIMARY KEY, username TEXT UNIQUE, password_hash TEXT, is_admin INTEGER)''',
+    '''CREATE TABLE IF NOT EXISTS purchases
+       (purchase_id TEXT PRIMARY KEY, variant_id TEXT, quantity INTEGER, purchase_time TEXT,
+        FOREIGN KEY(variant_id) REFERENCES variants(variant_id) ON DELETE CASCADE)''',
+    '''CREATE TABLE IF NOT EXISTS pre_orders
+       (pre_order_id TEXT PRIMARY KEY, variant_id TEXT, customer_name TEXT, contact_info TEXT, quantity INTEGER, pre_order_time TEXT,
+        FOREIGN KEY(variant_id) REFERENCES variants(variant_id) ON DELETE CASCADE)''',
+]
+
+# Foreign-key columns (used by joins and ON DELETE CASCADE) and the sort
+# keys of the paginated views
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_variants_product ON variants(product_id, variant_id)',
+    'CREATE INDEX IF NOT EXISTS idx_sales_variant ON sales(variant_id)',
+    'CREATE INDEX IF NOT EXISTS idx_sales_time ON sales(sale_time, sale_id)',
+    'CREATE INDEX IF NOT EXISTS idx_purchases_variant ON purchases(variant_id)',
+    'CREATE INDEX IF NOT EXISTS idx_requests_variant ON requests(variant_id)',
+    'CREATE INDEX IF NOT EXISTS idx_pre_orders_variant ON pre_orders(variant_id)',
+    'CREATE INDEX IF NOT EXISTS idx_products_name ON products(name COLLATE NOCASE)',
+]
+
+MIGRATIONS = [
+    (1, 'baseline schema', BASELINE_SCHEMA),
+    (2, 'sales rollups and sale-time cost', rollups.create_rollups),
+    (3, 'foreign-key and sort-key indexes', INDEXES),
+    (4, 'planner statistics', ['ANALYZE']),
+    (5, 'photo reference lookups', ['CREATE INDEX IF NOT EXISTS idx_variants_photo ON variants(photo)']),
+    # Covers the windowed analytics aggregates so they never touch the sales rows
+    (6, 'covering index for windowed sales analytics',
+     ['CREATE INDEX IF NOT EXISTS idx_sales_time_totals ON sales(sale_time, variant_id, quantity, revenue, unit_cost)']),
+    (7, 'reorder suggestions', reorder.create_reorder),
+    (8, 'catalog change log for POS delta sync', catalog_sync.create_change_log),
+    (9, 'full-text product search', search.create_search),
+    (10, 'stock movement ledger and snapshots', ledger.create_ledger),
+    (11, 'request times and queue sort indexes', queues.create_queues),
+    (12, 'shared change counter for multi-process cache invalidation',
+     ['CREATE TABLE IF NOT EXISTS change_counter (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)',
+      'INSERT OR IGNORE INTO change_counter VALUES (1, 0)']),
+]
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn):
+    version = schema_version(conn)
+    for number, description, steps in MIGRATIONS:
+        if number <= version:
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another process may have applied it while we waited for the write lock
+            if schema_version(conn) >= number:
+                conn.rollback()
+                continue
+            c = conn.cursor()
+            if callable(steps):
+                steps(c)
+            else:
+                for statement in steps:
+                    c.execute(statement)
+            c.execute(f'PRAGMA user_version = {number}')
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        logger.info(f"Applied migration {number}: {description}")
+    return schema_version(conn)
@@ -0,0 +1,118 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+# bcrypt cost factor (2**rounds iterations). Each step up doubles the time
+# of every login; existing hashes keep the cost they were created with.
+LOG_ROUNDS = 12
+WORKERS = min(2, os.cpu_count() or 1)
+# Requests allowed to wait for a free worker before new ones are refused
+QUEUE_SIZE = 32
+# Seconds a request waits for its hash, queueing included
+TIMEOUT = 5.0
+
+class HasherBusy(Exception):
+    pass
+
+# Hashes are $2b$ strings, compatible with those Flask-Bcrypt wrote before
+def hash_password(password, rounds=LOG_ROUNDS):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+def check_password(password_hash, password):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    except ValueError:
+        return False
+
+# Runs bcrypt in a small pool of worker processes, so a burst of logins
+# uses at most `workers` cores and never holds the GIL that request
+# threads serving /scan need. At most `queue_size` calls wait for a worker;
+# beyond that, or once a call has waited `timeout` seconds, HasherBusy is
+# raised so the request can fail fast. The processes are spawned on first
+# use rather than forked, as forking a threaded server is unsafe.
+# workers=0 hashes on the calling thread instead.
+class PasswordHasher:
+    def __init__(self, workers=WORKERS, queue_size=QUEUE_SIZE, timeout=TIMEOUT, rounds=LOG_ROUNDS):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.rounds = rounds
+        self._executor = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _release(self, future):
+        with self._lock:
+            self.in_flight -= 1
+            if not future.cancelled():
+                self.completed += 1
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        with self._lock:
+            if self.in_flight >= self.workers + self.queue_size:
+                self.rejected += 1
+                raise HasherBusy('Too many password checks queued')
+            self.in_flight += 1
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            with self._lock:
+                self.in_flight -= 1
+            raise
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise HasherBusy(f'Password check did not finish within {self.timeout}s')
+
+    def hash(self, password):
+        return self._run(hash_password, password, self.rounds)
+
+    def check(self, password_hash, password):
+        return self._run(check_password, password_hash, password)
+
+    def stats(self):
+        with self._lock:
+            return {'workers': self.workers, 'in_flight': self.in_flight, 'completed': self.completed,
+                    'rejected': self.rejected, 'timeouts': self.timeouts}
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+def init_hasher(workers=WORKERS, queue_size=QUEUE_SIZE, timeout=TIMEOUT, rounds=LOG_ROUNDS):
+    global _hasher
+    with _hasher_lock:
+        if _hasher is not None:
+            _hasher.close()
+        _hasher = PasswordHasher(workers, queue_size, timeout, rounds)
+    return _hasher
+
+def get_hasher():
+    if _hasher is None:
+        init_hasher()
+    return _hasher
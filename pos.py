@@ -0,0 +1,107 @@
+import json
+import ledger
+
+# SQL behind the till and back-office routes: barcode scans, the inventory
+# and sales pages, selling and purchase approval. It lives here rather than
+# inline in the routes so query_plans checks the statements the app runs.
+
+def like_prefix(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+def scan(c, barcode):
+    c.execute('''SELECT p.product_id, p.name, v.type, v.selling_price, v.variant_id, v.barcode, v.size, v.stock, v.photo
+                 FROM products p JOIN variants v ON p.product_id = v.product_id
+                 WHERE v.barcode = ?''', (barcode,))
+    return c.fetchone()
+
+# Variants ordered by (product_id, variant_id) after the `after` pair,
+# narrowed by a name prefix, exact product, type or size, and stock at or
+# below `low_stock`
+def inventory_page(c, after=None, name=None, product_id=None, type_=None, size=None, low_stock=None, limit=50):
+    clauses = []
+    params = []
+    if after:
+        clauses.append('(v.product_id, v.variant_id) > (?, ?)')
+        params.extend(after)
+    if name:
+        clauses.append("p.name LIKE ? ESCAPE '\\'")
+        params.append(like_prefix(name))
+    for column, value in (('product_id', product_id), ('type', type_), ('size', size)):
+        if value:
+            clauses.append(f'v.{column} = ?')
+            params.append(value)
+    if low_stock is not None:
+        clauses.append('v.stock <= ?')
+        params.append(low_stock)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    c.execute(f'''SELECT v.product_id, p.name, v.variant_id, v.type, v.size, v.barcode, v.cost, v.selling_price, v.stock
+                  FROM variants v JOIN products p ON p.product_id = v.product_id
+                  {where}
+                  ORDER BY v.product_id, v.variant_id
+                  LIMIT ?''', params + [limit])
+    return c.fetchall()
+
+# Sales newest first, after the (sale_time, sale_id) pair
+def sales_page(c, after=None, limit=50):
+    where = 'WHERE (s.sale_time, s.sale_id) < (?, ?)' if after else ''
+    c.execute(f'''SELECT s.sale_id, p.name, v.type, v.size, s.quantity, s.revenue, COALESCE(s.unit_cost, v.cost), s.sale_time
+                  FROM sales s JOIN variants v ON s.variant_id = v.variant_id
+                  JOIN products p ON v.product_id = p.product_id
+                  {where}
+                  ORDER BY s.sale_time DESC, s.sale_id DESC
+                  LIMIT ?''', list(after or []) + [limit])
+    return c.fetchall()
+
+# Decrement stock only if enough is on hand, so concurrent tills cannot oversell.
+# Returns the new stock level, or None if the variant is missing or short.
+def sell_stock(c, variant_id, quantity):
+    with ledger.reason(c, 'sale'):
+        c.execute("UPDATE variants SET stock = stock - ? WHERE variant_id = ? AND stock >= ?",
+                  (quantity, variant_id, quantity))
+        sold = c.rowcount
+    if sold == 0:
+        return None
+    c.execute("SELECT stock FROM variants WHERE variant_id = ?", (variant_id,))
+    return c.fetchone()[0]
+
+# Insert (sale_id, variant_id, quantity, revenue, sale_time) rows, stamping each
+# with the variant's cost at the time of sale. Rollups are kept by triggers.
+def record_sales(c, sales):
+    c.executemany('''INSERT INTO sales (sale_id, variant_id, quantity, revenue, sale_time, unit_cost)
+                     SELECT ?, ?, ?, ?, ?, cost FROM variants WHERE variant_id = ?''',
+                  [sale + (sale[1],) for sale in sales])
+
+# Add a pending purchase to stock and remove it. Returns (variant_id,
+# quantity), or None if there is no such purchase.
+def approve_purchase(c, purchase_id):
+    c.execute("SELECT variant_id, quantity FROM purchases WHERE purchase_id = ?", (purchase_id,))
+    purchase = c.fetchone()
+    if not purchase:
+        return None
+    variant_id, quantity = purchase
+    with ledger.reason(c, 'purchase'):
+        c.execute("UPDATE variants SET stock = stock + ? WHERE variant_id = ?", (quantity, variant_id))
+    c.execute("DELETE FROM purchases WHERE purchase_id = ?", (purchase_id,))
+    return purchase
+
+# Pending purchases chosen by id, or every one for a variant, as a WHERE
+# clause and its parameters
+def purchases_clause(purchase_ids=None, variant_id=None):
+    if purchase_ids is not None:
+        return "purchase_id IN (SELECT value FROM json_each(?))", (json.dumps(purchase_ids),)
+    return "variant_id = ?", (variant_id,)
+
+# Approve or reject the purchases matching `where`; approval adds each
+# variant's summed quantity with one grouped UPDATE. Returns the
+# (purchase_id, variant_id, quantity) rows processed.
+def process_purchases(c, approve, where, params):
+    if approve:
+        with ledger.reason(c, 'purchase'):
+            c.execute(f'''UPDATE variants SET stock = stock + pending.quantity
+                          FROM (SELECT variant_id, SUM(quantity) AS quantity FROM purchases
+                                WHERE {where} GROUP BY variant_id) AS pending
+                          WHERE variants.variant_id = pending.variant_id''', params)
+    c.execute(f"SELECT purchase_id, variant_id, quantity FROM purchases WHERE {where}", params)
+    purchases = c.fetchall()
+    c.execute(f"DELETE FROM purchases WHERE {where}", params)
+    return purchases
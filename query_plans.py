@@ -0,0 +1,116 @@
+import re
+import sqlite3
+import analytics
+import catalog_sync
+import exports
+import images
+import ledger
+import pos
+import queues
+import reorder
+import search
+
+# EXPLAIN QUERY PLAN regression check for the hot queries. Each entry runs
+# the same function the route calls, with sample arguments, and every
+# statement it issues is checked. A plan step of "SCAN <table>" without an
+# index, or a temporary B-tree, fails the check unless the entry allows that
+# exact step: the intended driving scan of a full export, a scan of an
+# already bounded subquery, or grouping and sorting by computed values,
+# which no index can serve.
+WINDOW = ('2025-01-01T00:00:00', '2025-02-01T00:00:00')
+GROUP = 'USE TEMP B-TREE FOR GROUP BY'
+SORT = 'USE TEMP B-TREE FOR ORDER BY'
+# Windowed analytics group the window's sales per variant (subquery t)
+# before ranking them
+WINDOW_TOTALS = ('SCAN t', GROUP, SORT)
+
+HOT_QUERIES = [
+    ('scan', lambda c: pos.scan(c, '123456789'), ()),
+    ('inventory page', lambda c: pos.inventory_page(c, ('p1', 'v1'), limit=51), ()),
+    ('inventory page by product', lambda c: pos.inventory_page(c, product_id='p1', limit=51), ()),
+    # Driven by the name index; only the matching variants are sorted
+    ('inventory page by name', lambda c: pos.inventory_page(c, name='Home', limit=51), (SORT,)),
+    ('inventory page by type and size', lambda c: pos.inventory_page(c, type_='Home', size='M', limit=51), ()),
+    ('inventory page low stock', lambda c: pos.inventory_page(c, ('p1', 'v1'), low_stock=5, limit=51), ()),
+    ('sales page', lambda c: pos.sales_page(c, ('9999', 'z'), 51), ()),
+    ('guarded sell', lambda c: pos.sell_stock(c, 'v1', 1), ()),
+    ('record sale', lambda c: pos.record_sales(c, [('plan-check', 'v1', 1, 79.99, '2025-01-01T12:00:00')]), ()),
+    ('approve purchase', lambda c: pos.approve_purchase(c, 'x'), ()),
+    ('bulk approve by variant',
+     lambda c: pos.process_purchases(c, True, *pos.purchases_clause(variant_id='v1')), ('SCAN pending',)),
+    ('bulk approve by id',
+     lambda c: pos.process_purchases(c, True, *pos.purchases_clause(purchase_ids=['x'])), ('SCAN pending', GROUP)),
+    ('reorder suggestions', lambda c: reorder.suggestions(c, 50), ()),
+    ('catalog delta', lambda c: catalog_sync.delta(c, 0), ()),
+    ('search', lambda c: search.search(c, 'home m', 10), ('SCAN s', SORT)),
+    ('photo references', lambda c: images.unreferenced(c, ['x.jpg']), ()),
+    # Lookups SQLite itself runs for ON DELETE CASCADE
+    ('cascade variants', lambda c: c.execute('SELECT 1 FROM variants WHERE product_id = ?', ('p1',)), ()),
+    ('cascade sales', lambda c: c.execute('SELECT 1 FROM sales WHERE variant_id = ?', ('v1',)), ()),
+    ('cascade purchases', lambda c: c.execute('SELECT 1 FROM purchases WHERE variant_id = ?', ('v1',)), ()),
+    ('cascade requests', lambda c: c.execute('SELECT 1 FROM requests WHERE variant_id = ?', ('v1',)), ()),
+    ('cascade pre_orders', lambda c: c.execute('SELECT 1 FROM pre_orders WHERE variant_id = ?', ('v1',)), ()),
+    ('pre-order queue page', lambda c: queues.page(c, 'pre_orders', after=('9999', 'z'), limit=50), ()),
+    ('pre-order queue by quantity', lambda c: queues.page(c, 'pre_orders', sort='quantity', limit=50), ()),
+    ('request queue by variant',
+     lambda c: queues.page(c, 'requests', variant_id='v1', start='2025-01-01', end='2025-02-01', limit=50), ()),
+    ('purchase queue page', lambda c: queues.page(c, 'purchases', descending=False, start='2025-01-01', limit=50), ()),
+    ('demand page', lambda c: queues.demand(c, after=(1000, 'z'), limit=50), ()),
+    ('top variants', lambda c: analytics.top(c, 'variant', 'units', None, None, 10), (SORT,)),
+    ('top variants in window', lambda c: analytics.top(c, 'variant', 'revenue', *WINDOW, 10), WINDOW_TOTALS),
+    ('top products in window', lambda c: analytics.top(c, 'product', 'margin', *WINDOW, 10), WINDOW_TOTALS),
+    ('sales by day', lambda c: analytics.sales_over_time(c, 'day', *WINDOW), ()),
+    ('sales by hour', lambda c: analytics.sales_over_time(c, 'hour', *WINDOW), (GROUP,)),
+    ('sell-through', lambda c: analytics.sell_through(c, None, None, 10), (SORT,)),
+    ('sell-through in window', lambda c: analytics.sell_through(c, *WINDOW, 10), (GROUP, SORT)),
+    ('export sales range', lambda c: export_sales(c, *WINDOW), ()),
+    ('export inventory', lambda c: c.execute(exports.INVENTORY_QUERY), ('SCAN p', 'SCAN v')),
+    ('stock ledger', lambda c: ledger.movements(c, 'v1', 100, 50), ()),
+    ('stock at', lambda c: ledger.stock_at(c, '2025-01-01', after='v1', limit=50), ()),
+]
+
+def export_sales(c, start, end):
+    query, params = exports.sales_query(start, end)
+    c.execute(query.format(sales='sales'), params)
+
+# Runs statements as usual, keeping each one with its parameters
+class RecordingCursor(sqlite3.Cursor):
+    def __init__(self, connection):
+        super().__init__(connection)
+        self.statements = []
+
+    def execute(self, sql, parameters=()):
+        self.statements.append((sql, parameters))
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        if seq_of_parameters:
+            self.statements.append((sql, seq_of_parameters[0]))
+        return super().executemany(sql, seq_of_parameters)
+
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+# Plans are checked with the ANALYZE statistics hidden (inside a rolled-back
+# transaction, which also undoes the writes of the entries that write), so
+# the planner assumes production-sized tables instead of preferring scans
+# over a handful of rows in a small database.
+def check(conn):
+    failures = []
+    conn.execute('BEGIN')
+    try:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+            conn.execute('DELETE FROM sqlite_stat1')
+            conn.execute('ANALYZE sqlite_schema')
+        for name, run, allowed in HOT_QUERIES:
+            c = conn.cursor(RecordingCursor)
+            run(c)
+            for query, params in c.statements:
+                for row in conn.execute(f'EXPLAIN QUERY PLAN {query}', params):
+                    detail = row[3]
+                    if (FULL_SCAN.match(detail) or 'TEMP B-TREE' in detail) and detail not in allowed:
+                        failures.append((name, detail))
+    finally:
+        conn.rollback()
+        conn.execute('ANALYZE sqlite_schema')
+    return failures
@@ -0,0 +1,116 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Paginated views of the work queues behind the Pre-orders page (customer
+# requests, pre-orders and purchase requests) and of outstanding demand per
+# variant. Each queue page walks one index in sort order with a keyset
+# cursor of (sort value, id), optionally narrowed to a variant and a time
+# window. Demand comes from reorder_status, whose triggers already count
+# pre-ordered units, customer requests and pending purchases per variant
+# as the contact and pre-order forms are submitted.
+
+# name -> (table, key, time column, selected columns, sort keys)
+QUEUES = {
+    'requests': ('requests', 'request_id', 'request_time',
+                 ('request_id', 'variant_id', 'customer_name', 'contact_info', 'request_time'),
+                 {'time': 'request_time'}),
+    'pre_orders': ('pre_orders', 'pre_order_id', 'pre_order_time',
+                   ('pre_order_id', 'variant_id', 'customer_name', 'contact_info', 'quantity', 'pre_order_time'),
+                   {'time': 'pre_order_time', 'quantity': 'quantity'}),
+    'purchases': ('purchases', 'purchase_id', 'purchase_time',
+                  ('purchase_id', 'variant_id', 'quantity', 'purchase_time'),
+                  {'time': 'purchase_time', 'quantity': 'quantity'}),
+}
+
+SCHEMA = [
+    # One index per sort key, plus (variant, time) for the variant filter,
+    # which also serves ON DELETE CASCADE in place of the variant-only ones
+    'CREATE INDEX IF NOT EXISTS idx_requests_time ON requests(request_time, request_id)',
+    'CREATE INDEX IF NOT EXISTS idx_requests_variant_time ON requests(variant_id, request_time, request_id)',
+    'DROP INDEX IF EXISTS idx_requests_variant',
+    'CREATE INDEX IF NOT EXISTS idx_pre_orders_time ON pre_orders(pre_order_time, pre_order_id)',
+    'CREATE INDEX IF NOT EXISTS idx_pre_orders_variant_time ON pre_orders(variant_id, pre_order_time, pre_order_id)',
+    'CREATE INDEX IF NOT EXISTS idx_pre_orders_quantity ON pre_orders(quantity, pre_order_id)',
+    'DROP INDEX IF EXISTS idx_pre_orders_variant',
+    'CREATE INDEX IF NOT EXISTS idx_purchases_time ON purchases(purchase_time, purchase_id)',
+    'CREATE INDEX IF NOT EXISTS idx_purchases_variant_time ON purchases(variant_id, purchase_time, purchase_id)',
+    'CREATE INDEX IF NOT EXISTS idx_purchases_quantity ON purchases(quantity, purchase_id)',
+    'DROP INDEX IF EXISTS idx_purchases_variant',
+    '''CREATE INDEX IF NOT EXISTS idx_reorder_demand ON reorder_status(pre_ordered + requested, variant_id)
+       WHERE pre_ordered > 0 OR requested > 0''',
+]
+
+def create_queues(c):
+    c.execute("PRAGMA table_info(requests)")
+    if 'request_time' not in [column[1] for column in c.fetchall()]:
+        # Requests taken before this column existed have no time: '' sorts
+        # them oldest and keeps the keyset cursor free of NULLs
+        logger.info("Adding request_time to requests")
+        c.execute("ALTER TABLE requests ADD COLUMN request_time TEXT NOT NULL DEFAULT ''")
+    for statement in SCHEMA:
+        c.execute(statement)
+
+# One page of a queue joined to its product, ordered by `sort` then id.
+# `after` is the (sort value, id) of the last row already served. Returns
+# (items, cursor of the last item or None when this is the last page).
+def page(c, name, sort='time', descending=True, variant_id=None, start=None, end=None, after=None, limit=50):
+    table, key, time_column, columns, sorts = QUEUES[name]
+    if sort not in sorts:
+        raise ValueError(f"{name} can be sorted by {', '.join(sorts)}")
+    sort_column = sorts[sort]
+    clauses = []
+    params = []
+    if variant_id:
+        clauses.append('q.variant_id = ?')
+        params.append(variant_id)
+    if start:
+        clauses.append(f'q.{time_column} >= ?')
+        params.append(start)
+    if end:
+        clauses.append(f'q.{time_column} < ?')
+        params.append(end)
+    if after:
+        clauses.append(f"(q.{sort_column}, q.{key}) {'<' if descending else '>'} (?, ?)")
+        params.extend((int(after[0]) if sort_column == 'quantity' else after[0], after[1]))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    direction = 'DESC' if descending else 'ASC'
+    # CROSS JOIN keeps the queue as the outer loop, so its index serves the order
+    c.execute(f'''SELECT {', '.join(f'q.{column}' for column in columns)}, p.name, v.type, v.size
+                  FROM {table} q CROSS JOIN variants v ON v.variant_id = q.variant_id
+                  JOIN products p ON p.product_id = v.product_id
+                  {where}
+                  ORDER BY q.{sort_column} {direction}, q.{key} {direction}
+                  LIMIT ?''', params + [limit + 1])
+    rows = c.fetchall()
+    items = [dict(zip(columns + ('name', 'type', 'size'), row)) for row in rows[:limit]]
+    cursor = (items[-1][sort_column], items[-1][key]) if len(rows) > limit else None
+    for item in items:
+        item[time_column] = item[time_column] or None
+    return items, cursor
+
+# Variants with pre-orders or customer requests outstanding, most demanded
+# first. `after` is the (demand, variant_id) of the last row already served.
+def demand(c, variant_id=None, after=None, limit=50):
+    clauses = ['(r.pre_ordered > 0 OR r.requested > 0)']
+    params = []
+    if variant_id:
+        clauses.append('r.variant_id = ?')
+        params.append(variant_id)
+    if after:
+        clauses.append('(r.pre_ordered + r.requested, r.variant_id) < (?, ?)')
+        params.extend((int(after[0]), after[1]))
+    c.execute(f'''SELECT r.variant_id, p.name, v.type, v.size, r.stock, r.pending, r.pre_ordered, r.requested
+                  FROM reorder_status r CROSS JOIN variants v ON v.variant_id = r.variant_id
+                  JOIN products p ON p.product_id = v.product_id
+                  WHERE {' AND '.join(clauses)}
+                  ORDER BY r.pre_ordered + r.requested DESC, r.variant_id DESC
+                  LIMIT ?''', params + [limit + 1])
+    rows = c.fetchall()
+    items = [{'variant_id': variant_id, 'name': name, 'type': type_, 'size': size, 'stock': stock,
+              'pending': pending, 'pre_ordered': pre_ordered, 'requested': requested,
+              'demand': pre_ordered + requested,
+              'shortfall': max(pre_ordered + requested - stock - pending, 0)}
+             for variant_id, name, type_, size, stock, pending, pre_ordered, requested in rows[:limit]]
+    cursor = (items[-1]['demand'], items[-1]['variant_id']) if len(rows) > limit else None
+    return items, cursor
@@ -0,0 +1,152 @@
+import json
+import logging
+from datetime import date, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Reorder suggestions kept per variant in `reorder_status`, maintained by
+# triggers the same way as the sales rollups: every sale, stock change,
+# pre-order, customer request and purchase request adjusts only its own
+# variant's row. Velocity is units sold over the last WINDOW_DAYS days; new
+# sales are added as they happen and refresh() expires old ones once a day.
+# Suggested quantity covers LEAD_TIME_DAYS + TARGET_COVER_DAYS of sales plus
+# all pre-orders and customer requests, less stock on hand and purchases
+# already pending.
+WINDOW_DAYS = 28
+LEAD_TIME_DAYS = 7
+TARGET_COVER_DAYS = 28
+HORIZON_DAYS = LEAD_TIME_DAYS + TARGET_COVER_DAYS
+
+WINDOW_START = f"date('now', 'localtime', '-{WINDOW_DAYS} days')"
+
+SCHEMA = [
+    f'''CREATE TABLE IF NOT EXISTS reorder_status
+        (variant_id TEXT PRIMARY KEY REFERENCES variants(variant_id) ON DELETE CASCADE,
+         stock INTEGER NOT NULL DEFAULT 0,
+         recent_units INTEGER NOT NULL DEFAULT 0,
+         pre_ordered INTEGER NOT NULL DEFAULT 0,
+         requested INTEGER NOT NULL DEFAULT 0,
+         pending INTEGER NOT NULL DEFAULT 0,
+         days_of_cover REAL GENERATED ALWAYS AS
+             (CASE WHEN recent_units > 0
+                   THEN MAX(stock + pending - pre_ordered, 0) * {WINDOW_DAYS}.0 / recent_units END) STORED,
+         suggested_quantity INTEGER GENERATED ALWAYS AS
+             (MAX((recent_units * {HORIZON_DAYS} + {WINDOW_DAYS - 1}) / {WINDOW_DAYS}
+                  + pre_ordered + requested - stock - pending, 0)) STORED)''',
+    '''CREATE TABLE IF NOT EXISTS reorder_refresh
+       (id INTEGER PRIMARY KEY CHECK (id = 1), day TEXT)''',
+    '''CREATE INDEX IF NOT EXISTS idx_reorder_suggested ON reorder_status(days_of_cover, variant_id)
+       WHERE suggested_quantity > 0''',
+    '''CREATE TRIGGER IF NOT EXISTS reorder_variant_insert AFTER INSERT ON variants
+       BEGIN
+           INSERT OR REPLACE INTO reorder_status (variant_id, stock) VALUES (NEW.variant_id, NEW.stock);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS reorder_variant_stock AFTER UPDATE OF stock ON variants
+       BEGIN
+           UPDATE reorder_status SET stock = NEW.stock WHERE variant_id = NEW.variant_id;
+       END''',
+    f'''CREATE TRIGGER IF NOT EXISTS reorder_sale_insert AFTER INSERT ON sales
+        WHEN NEW.sale_time >= {WINDOW_START}
+        BEGIN
+            UPDATE reorder_status SET recent_units = recent_units + NEW.quantity WHERE variant_id = NEW.variant_id;
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS reorder_sale_delete AFTER DELETE ON sales
+        WHEN OLD.sale_time >= {WINDOW_START}
+        BEGIN
+            UPDATE reorder_status SET recent_units = MAX(recent_units - OLD.quantity, 0) WHERE variant_id = OLD.variant_id;
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS reorder_pre_order_insert AFTER INSERT ON pre_orders
+       BEGIN
+           UPDATE reorder_status SET pre_ordered = pre_ordered + NEW.quantity WHERE variant_id = NEW.variant_id;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS reorder_pre_order_delete AFTER DELETE ON pre_orders
+       BEGIN
+           UPDATE reorder_status SET pre_ordered = MAX(pre_ordered - OLD.quantity, 0) WHERE variant_id = OLD.variant_id;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS reorder_request_insert AFTER INSERT ON requests
+       BEGIN
+           UPDATE reorder_status SET requested = requested + 1 WHERE variant_id = NEW.variant_id;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS reorder_request_delete AFTER DELETE ON requests
+       BEGIN
+           UPDATE reorder_status SET requested = MAX(requested - 1, 0) WHERE variant_id = OLD.variant_id;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS reorder_purchase_insert AFTER INSERT ON purchases
+       BEGIN
+           UPDATE reorder_status SET pending = pending + NEW.quantity WHERE variant_id = NEW.variant_id;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS reorder_purchase_delete AFTER DELETE ON purchases
+       BEGIN
+           UPDATE reorder_status SET pending = MAX(pending - OLD.quantity, 0) WHERE variant_id = OLD.variant_id;
+       END''',
+]
+
+# Triggers on `sales`, for bulk loaders that suspend them and call rebuild()
+SALES_TRIGGERS = ('reorder_sale_insert', 'reorder_sale_delete')
+
+def create_reorder(c):
+    for statement in SCHEMA:
+        c.execute(statement)
+    rebuild(c)
+
+def window_start(today=None):
+    return ((today or date.today()) - timedelta(days=WINDOW_DAYS)).isoformat()
+
+# Recompute every variant's row from the source tables
+def rebuild(c):
+    c.execute("DELETE FROM reorder_status")
+    c.execute('''INSERT INTO reorder_status (variant_id, stock, pre_ordered, requested, pending)
+                 SELECT v.variant_id, v.stock,
+                        COALESCE((SELECT SUM(quantity) FROM pre_orders po WHERE po.variant_id = v.variant_id), 0),
+                        (SELECT COUNT(*) FROM requests r WHERE r.variant_id = v.variant_id),
+                        COALESCE((SELECT SUM(quantity) FROM purchases pu WHERE pu.variant_id = v.variant_id), 0)
+                 FROM variants v''')
+    refresh(c, force=True)
+
+# Expire sales that have slid out of the velocity window by re-counting the
+# window in one grouped pass. Only needed once per day; returns False when
+# today's refresh has already been done.
+def refresh(c, force=False):
+    today = date.today().isoformat()
+    c.execute("SELECT day FROM reorder_refresh WHERE id = 1")
+    row = c.fetchone()
+    if row and row[0] == today and not force:
+        return False
+    c.execute("UPDATE reorder_status SET recent_units = 0 WHERE recent_units != 0")
+    c.execute('''UPDATE reorder_status SET recent_units = recent.quantity
+                 FROM (SELECT variant_id, SUM(quantity) AS quantity FROM sales
+                       WHERE sale_time >= ? GROUP BY variant_id) AS recent
+                 WHERE reorder_status.variant_id = recent.variant_id''', (window_start(),))
+    c.execute("INSERT OR REPLACE INTO reorder_refresh VALUES (1, ?)", (today,))
+    logger.info("Reorder velocity window refreshed")
+    return True
+
+def needs_refresh(c):
+    c.execute("SELECT day FROM reorder_refresh WHERE id = 1")
+    row = c.fetchone()
+    return not row or row[0] != date.today().isoformat()
+
+# Variants with a positive suggested quantity, fewest days of cover first
+# (variants with outstanding demand but no recent sales come first). The
+# CROSS JOIN keeps reorder_status as the outer loop so the partial index
+# serves both the filter and the order.
+def suggestions(c, limit, variant_ids=None):
+    where = ''
+    params = []
+    if variant_ids:
+        where = 'AND r.variant_id IN (SELECT value FROM json_each(?))'
+        params.append(json.dumps(variant_ids))
+    c.execute(f'''SELECT r.variant_id, p.name, v.type, v.size, v.barcode, r.stock, r.pending, r.pre_ordered, r.requested,
+                         r.recent_units, r.days_of_cover, r.suggested_quantity
+                  FROM reorder_status r CROSS JOIN variants v ON v.variant_id = r.variant_id
+                  JOIN products p ON p.product_id = v.product_id
+                  WHERE r.suggested_quantity > 0 {where}
+                  ORDER BY r.days_of_cover, r.variant_id
+                  LIMIT ?''', params + [limit])
+    return [{'variant_id': variant_id, 'name': name, 'type': type_, 'size': size, 'barcode': barcode,
+             'stock': stock, 'pending': pending, 'pre_ordered': pre_ordered, 'requested': requested,
+             'daily_velocity': round(recent_units / WINDOW_DAYS, 3),
+             'days_of_cover': round(days_of_cover, 1) if days_of_cover is not None else None,
+             'suggested_quantity': suggested}
+            for (variant_id, name, type_, size, barcode, stock, pending, pre_ordered, requested,
+                 recent_units, days_of_cover, suggested) in c.fetchall()]
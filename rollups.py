@@ -0,0 +1,107 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Revenue/profit rollups maintained by triggers on `sales`, so they are
+# updated in the same transaction as every sale insert or delete
+# (including ON DELETE CASCADE from variants). Cost is the unit cost
+# recorded on the sale row, not the variant's current cost.
+ROLLUP_COLUMNS = '''sale_count INTEGER NOT NULL DEFAULT 0, quantity INTEGER NOT NULL DEFAULT 0,
+                    revenue REAL NOT NULL DEFAULT 0, cost REAL NOT NULL DEFAULT 0'''
+
+SCHEMA = [
+    f'''CREATE TABLE IF NOT EXISTS sales_rollup_totals
+        (id INTEGER PRIMARY KEY CHECK (id = 1), {ROLLUP_COLUMNS})''',
+    f'''CREATE TABLE IF NOT EXISTS sales_rollup_daily
+        (day TEXT PRIMARY KEY, {ROLLUP_COLUMNS})''',
+    f'''CREATE TABLE IF NOT EXISTS sales_rollup_variant
+        (variant_id TEXT PRIMARY KEY, {ROLLUP_COLUMNS})''',
+    '''CREATE TRIGGER IF NOT EXISTS sales_rollup_insert AFTER INSERT ON sales
+       BEGIN
+           INSERT INTO sales_rollup_totals VALUES (1, 1, NEW.quantity, NEW.revenue, COALESCE(NEW.unit_cost, 0) * NEW.quantity)
+           ON CONFLICT(id) DO UPDATE SET sale_count = sale_count + 1, quantity = quantity + excluded.quantity,
+                                         revenue = revenue + excluded.revenue, cost = cost + excluded.cost;
+           INSERT INTO sales_rollup_daily VALUES (substr(NEW.sale_time, 1, 10), 1, NEW.quantity, NEW.revenue,
+                                                  COALESCE(NEW.unit_cost, 0) * NEW.quantity)
+           ON CONFLICT(day) DO UPDATE SET sale_count = sale_count + 1, quantity = quantity + excluded.quantity,
+                                          revenue = revenue + excluded.revenue, cost = cost + excluded.cost;
+           INSERT INTO sales_rollup_variant VALUES (NEW.variant_id, 1, NEW.quantity, NEW.revenue,
+                                                    COALESCE(NEW.unit_cost, 0) * NEW.quantity)
+           ON CONFLICT(variant_id) DO UPDATE SET sale_count = sale_count + 1, quantity = quantity + excluded.quantity,
+                                                 revenue = revenue + excluded.revenue, cost = cost + excluded.cost;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS sales_rollup_delete AFTER DELETE ON sales
+       BEGIN
+           UPDATE sales_rollup_totals SET sale_count = sale_count - 1, quantity = quantity - OLD.quantity,
+                  revenue = revenue - OLD.revenue, cost = cost - COALESCE(OLD.unit_cost, 0) * OLD.quantity
+           WHERE id = 1;
+           UPDATE sales_rollup_daily SET sale_count = sale_count - 1, quantity = quantity - OLD.quantity,
+                  revenue = revenue - OLD.revenue, cost = cost - COALESCE(OLD.unit_cost, 0) * OLD.quantity
+           WHERE day = substr(OLD.sale_time, 1, 10);
+           UPDATE sales_rollup_variant SET sale_count = sale_count - 1, quantity = quantity - OLD.quantity,
+                  revenue = revenue - OLD.revenue, cost = cost - COALESCE(OLD.unit_cost, 0) * OLD.quantity
+           WHERE variant_id = OLD.variant_id;
+           DELETE FROM sales_rollup_daily WHERE day = substr(OLD.sale_time, 1, 10) AND sale_count = 0;
+           DELETE FROM sales_rollup_variant WHERE variant_id = OLD.variant_id AND sale_count = 0;
+       END''',
+]
+
+def create_rollups(c):
+    c.execute("PRAGMA table_info(sales)")
+    missing_cost = 'unit_cost' not in [column[1] for column in c.fetchall()]
+    if missing_cost:
+        # Older databases: backfill with today's cost, the best figure available
+        logger.info("Adding sale-time unit_cost to sales")
+        c.execute("ALTER TABLE sales ADD COLUMN unit_cost REAL")
+        c.execute('''UPDATE sales SET unit_cost = (SELECT cost FROM variants v WHERE v.variant_id = sales.variant_id)
+                     WHERE unit_cost IS NULL''')
+    for statement in SCHEMA:
+        c.execute(statement)
+    if missing_cost:
+        rebuild_rollups(c)
+
+# Recompute every rollup from the sales table, or another source of sales rows
+def rebuild_rollups(c, source='sales'):
+    c.execute("DELETE FROM sales_rollup_totals")
+    c.execute("DELETE FROM sales_rollup_daily")
+    c.execute("DELETE FROM sales_rollup_variant")
+    c.execute(f'''INSERT INTO sales_rollup_totals
+                 SELECT 1, COUNT(*), COALESCE(SUM(quantity), 0), COALESCE(SUM(revenue), 0),
+                        COALESCE(SUM(COALESCE(unit_cost, 0) * quantity), 0)
+                 FROM {source}''')
+    c.execute(f'''INSERT INTO sales_rollup_daily
+                 SELECT substr(sale_time, 1, 10), COUNT(*), SUM(quantity), SUM(revenue), SUM(COALESCE(unit_cost, 0) * quantity)
+                 FROM {source} GROUP BY substr(sale_time, 1, 10)''')
+    c.execute(f'''INSERT INTO sales_rollup_variant
+                 SELECT variant_id, COUNT(*), SUM(quantity), SUM(revenue), SUM(COALESCE(unit_cost, 0) * quantity)
+                 FROM {source} GROUP BY variant_id''')
+
+# Add a source's sales rows to the existing rollups, for bulk loaders that
+# insert with the rollup trigger suspended. Unlike rebuild_rollups() this
+# keeps whatever the rollups already count, including archived months.
+def add_rollups(c, source, params=()):
+    c.execute(f'''INSERT INTO sales_rollup_totals
+                 SELECT 1, COUNT(*), COALESCE(SUM(quantity), 0), COALESCE(SUM(revenue), 0),
+                        COALESCE(SUM(COALESCE(unit_cost, 0) * quantity), 0)
+                 FROM {source} WHERE true
+                 ON CONFLICT(id) DO UPDATE SET sale_count = sale_count + excluded.sale_count,
+                        quantity = quantity + excluded.quantity, revenue = revenue + excluded.revenue,
+                        cost = cost + excluded.cost''', params)
+    c.execute(f'''INSERT INTO sales_rollup_daily
+                 SELECT substr(sale_time, 1, 10), COUNT(*), SUM(quantity), SUM(revenue), SUM(COALESCE(unit_cost, 0) * quantity)
+                 FROM {source} WHERE true GROUP BY substr(sale_time, 1, 10)
+                 ON CONFLICT(day) DO UPDATE SET sale_count = sale_count + excluded.sale_count,
+                        quantity = quantity + excluded.quantity, revenue = revenue + excluded.revenue,
+                        cost = cost + excluded.cost''', params)
+    c.execute(f'''INSERT INTO sales_rollup_variant
+                 SELECT variant_id, COUNT(*), SUM(quantity), SUM(revenue), SUM(COALESCE(unit_cost, 0) * quantity)
+                 FROM {source} WHERE true GROUP BY variant_id
+                 ON CONFLICT(variant_id) DO UPDATE SET sale_count = sale_count + excluded.sale_count,
+                        quantity = quantity + excluded.quantity, revenue = revenue + excluded.revenue,
+                        cost = cost + excluded.cost''', params)
+
+# Returns (total_revenue, total_profit) from the single totals row
+def totals(c):
+    c.execute("SELECT revenue, revenue - cost FROM sales_rollup_totals WHERE id = 1")
+    row = c.fetchone()
+    return row if row else (0, 0)
@@ -0,0 +1,79 @@
+import re
+
+# FTS5 index over product name, type, size and barcode, one row per variant,
+# kept in sync by triggers. FTS rows are keyed through search_keys, whose
+# INTEGER PRIMARY KEY (unlike the variants rowid) survives VACUUM, so a
+# variant's row can be replaced by rowid without scanning the index. (The
+# key insert avoids OR IGNORE: an outer INSERT OR REPLACE on variants would
+# override it and hand the variant a new key, orphaning its old FTS row.)
+SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 50
+# bm25 column weights: name, type, size, barcode
+WEIGHTS = (10.0, 2.0, 1.0, 5.0)
+
+INDEX_VARIANTS = '''INSERT OR REPLACE INTO variant_search (rowid, name, type, size, barcode)
+                    SELECT k.search_id, p.name, v.type, v.size, v.barcode
+                    FROM variants v JOIN search_keys k ON k.variant_id = v.variant_id
+                    JOIN products p ON p.product_id = v.product_id'''
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS search_keys
+       (search_id INTEGER PRIMARY KEY, variant_id TEXT NOT NULL UNIQUE)''',
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS variant_search
+       USING fts5(name, type, size, barcode, tokenize = 'unicode61', prefix = '2 3')''',
+    f'''CREATE TRIGGER IF NOT EXISTS search_variant_insert AFTER INSERT ON variants
+        BEGIN
+            INSERT INTO search_keys (variant_id) SELECT NEW.variant_id
+            WHERE NOT EXISTS (SELECT 1 FROM search_keys WHERE variant_id = NEW.variant_id);
+            {INDEX_VARIANTS} WHERE v.variant_id = NEW.variant_id;
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS search_variant_update AFTER UPDATE OF product_id, barcode, type, size ON variants
+        BEGIN
+            {INDEX_VARIANTS} WHERE v.variant_id = NEW.variant_id;
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS search_variant_delete AFTER DELETE ON variants
+       BEGIN
+           DELETE FROM variant_search WHERE rowid = (SELECT search_id FROM search_keys WHERE variant_id = OLD.variant_id);
+           DELETE FROM search_keys WHERE variant_id = OLD.variant_id;
+       END''',
+    f'''CREATE TRIGGER IF NOT EXISTS search_product_rename AFTER UPDATE OF name ON products
+        BEGIN
+            {INDEX_VARIANTS} WHERE v.product_id = NEW.product_id;
+        END''',
+]
+
+def create_search(c):
+    for statement in SCHEMA:
+        c.execute(statement)
+    rebuild(c)
+
+def rebuild(c):
+    c.execute("DELETE FROM variant_search")
+    c.execute("DELETE FROM search_keys WHERE variant_id NOT IN (SELECT variant_id FROM variants)")
+    c.execute("INSERT OR IGNORE INTO search_keys (variant_id) SELECT variant_id FROM variants")
+    c.execute(INDEX_VARIANTS)
+
+_token = re.compile(r'\w+', re.UNICODE)
+
+# Every word of the input must match the start of a token in some column,
+# e.g. "jers hom" finds "Team Jersey / Home". Returns None for empty input.
+def match_expression(text):
+    words = _token.findall(text.lower())
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+def search(c, text, limit):
+    expression = match_expression(text)
+    if expression is None:
+        return []
+    weights = ', '.join(str(weight) for weight in WEIGHTS)
+    # Rank inside the FTS table first so only the top rows are joined
+    c.execute(f'''SELECT v.variant_id, p.name, v.type, v.size, v.barcode, v.selling_price, v.stock, v.photo
+                  FROM (SELECT rowid, bm25(variant_search, {weights}) AS score FROM variant_search
+                        WHERE variant_search MATCH ? ORDER BY score LIMIT ?) s
+                  JOIN search_keys k ON k.search_id = s.rowid
+                  JOIN variants v ON v.variant_id = k.variant_id
+                  JOIN products p ON p.product_id = v.product_id
+                  ORDER BY s.score''', (expression, limit))
+    return c.fetchall()
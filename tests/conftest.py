@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as inventory_app
+import db
+
+# A freshly migrated and seeded database per test, with cheap password
+# hashing on the request thread and empty in-process caches
+@pytest.fixture
+def app(tmp_path):
+    application = inventory_app.create_app({
+        'DATABASE': str(tmp_path / 'inventory.db'), 'SECRET_KEY': 'test', 'INIT_DB': True,
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'), 'ARCHIVE_FOLDER': str(tmp_path / 'archive'),
+        'BCRYPT_LOG_ROUNDS': 4, 'PASSWORD_WORKERS': 0, 'MULTIPROCESS': False, 'WRITE_BEHIND': False,
+        'TESTING': True,
+    })
+    for cache in (inventory_app.scan_cache, inventory_app.analytics_cache, inventory_app.page_cache):
+        cache.clear()
+    yield application
+    db.get_pool().close()
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    response = client.post('/login', json={'username': 'admin', 'password': 'adminpass'})
+    assert response.status_code == 200
+    return client
+
+@pytest.fixture
+def conn(app):
+    with db.get_pool().connection() as connection:
+        yield connection
@@ -0,0 +1,59 @@
+import sqlite3
+from datetime import date
+
+import pytest
+
+import archive
+import rollups
+
+def add_sales(conn, month, count):
+    conn.executemany('''INSERT INTO sales (sale_id, variant_id, quantity, revenue, sale_time, unit_cost)
+                        VALUES (?, 'v1', 1, 79.99, ?, 49.99)''',
+                     [(f'{month}-{i}', f'{month}-{i % 28 + 1:02d}T12:00:00') for i in range(count)])
+    conn.commit()
+
+def trigger_sql(conn):
+    return dict(conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'sales'"))
+
+def test_archive_keeps_rollups_and_trigger_definitions(app, conn):
+    add_sales(conn, '2025-01', 30)
+    add_sales(conn, '2025-06', 5)
+    triggers = trigger_sql(conn)
+    totals = rollups.totals(conn.cursor())
+    moved = archive.archive_sales(conn, app.config['ARCHIVE_FOLDER'], keep_months=3, today=date(2025, 6, 15))
+    assert moved == {'2025-01': 30}
+    assert conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0] == 5
+    assert trigger_sql(conn) == triggers
+    assert rollups.totals(conn.cursor()) == totals
+    assert archive.archived_months(app.config['ARCHIVE_FOLDER']) == ['2025-01']
+
+def test_abandoned_archive_export_detaches_cleanly(app, conn):
+    add_sales(conn, '2025-01', 30)
+    archive.archive_sales(conn, app.config['ARCHIVE_FOLDER'], keep_months=3, today=date(2025, 6, 15))
+    batches = archive.sales_batches(conn.cursor(), app.config['ARCHIVE_FOLDER'], None, None,
+                                    'SELECT sale_id FROM {sales} ORDER BY sale_id', (), 10)
+    assert len(next(batches)) == 10
+    batches.close()
+    assert [row[1] for row in conn.execute('PRAGMA database_list')] == ['main']
+    rows = [row for batch in archive.sales_batches(conn.cursor(), app.config['ARCHIVE_FOLDER'], None, None,
+                                                   'SELECT sale_id FROM {sales}', (), 10) for row in batch]
+    assert len(rows) == 30
+
+def test_sales_source_refuses_a_pending_transaction(app, conn):
+    add_sales(conn, '2025-01', 3)
+    archive.archive_sales(conn, app.config['ARCHIVE_FOLDER'], keep_months=3, today=date(2025, 6, 15))
+    conn.execute("UPDATE variants SET stock = 99 WHERE variant_id = 'v1'")
+    with pytest.raises(sqlite3.ProgrammingError):
+        with archive.sales_source(conn.cursor(), app.config['ARCHIVE_FOLDER'], None, None):
+            pass
+    conn.rollback()
+    assert conn.execute("SELECT stock FROM variants WHERE variant_id = 'v1'").fetchone()[0] == 10
+
+def test_sales_source_unions_archived_months(app, conn):
+    add_sales(conn, '2025-01', 3)
+    add_sales(conn, '2025-06', 2)
+    archive.archive_sales(conn, app.config['ARCHIVE_FOLDER'], keep_months=3, today=date(2025, 6, 15))
+    c = conn.cursor()
+    with archive.sales_source(c, app.config['ARCHIVE_FOLDER'], None, None) as source:
+        assert c.execute(f'SELECT COUNT(*) FROM {source}').fetchone()[0] == 5
+    assert not conn.in_transaction
@@ -0,0 +1,30 @@
+import io
+
+import catalog_import
+
+def import_csv(conn, folder, text):
+    c = conn.cursor()
+    report = catalog_import.import_catalog(c, catalog_import.read_rows(io.BytesIO(text.encode()), 'catalog.csv'), folder)
+    conn.commit()
+    return report
+
+def test_import_uses_placeholder_and_existing_photos(app, conn):
+    folder = app.config['UPLOAD_FOLDER']
+    with open(f'{folder}/scarf.jpg', 'wb') as f:
+        f.write(b'jpeg')
+    report = import_csv(conn, folder, 'name,barcode,cost,selling_price,stock,photo\n'
+                                      'Scarf,700001,5,12,4,scarf.jpg\n'
+                                      'Cap,700002,4,10,2,\n')
+    assert report['imported'] == 2 and report['errors'] == []
+    photos = dict(conn.execute("SELECT barcode, photo FROM variants WHERE barcode IN ('700001', '700002')"))
+    assert photos == {'700001': 'scarf.jpg', '700002': 'placeholder.jpg'}
+
+def test_import_rejects_photo_paths(app, conn, tmp_path):
+    folder = app.config['UPLOAD_FOLDER']
+    (tmp_path / 'victim.txt').write_text('keep me')
+    report = import_csv(conn, folder, 'name,barcode,cost,selling_price,stock,photo\n'
+                                      'Scarf,700001,5,12,4,../victim.txt\n'
+                                      'Cap,700002,4,10,2,/etc/hostname\n')
+    assert report['imported'] == 0
+    assert [error['row'] for error in report['errors']] == [2, 3]
+    assert conn.execute("SELECT COUNT(*) FROM variants WHERE barcode IN ('700001', '700002')").fetchone()[0] == 0
@@ -0,0 +1,38 @@
+from datetime import date, datetime, timedelta
+
+import archive
+import datagen
+import rollups
+
+def rollup_figures(conn):
+    c = conn.cursor()
+    totals = c.execute("SELECT sale_count, quantity, ROUND(revenue, 2), ROUND(cost, 2) FROM sales_rollup_totals").fetchone()
+    daily = c.execute("SELECT day, sale_count, quantity FROM sales_rollup_daily ORDER BY day").fetchall()
+    variants = c.execute("SELECT variant_id, sale_count, quantity FROM sales_rollup_variant ORDER BY variant_id").fetchall()
+    return totals, daily, variants
+
+def trigger_sql(conn):
+    return dict(conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'"))
+
+def test_generate_ends_now_and_fills_reorder_window(conn):
+    datagen.generate(conn, variants=60, sales=3000, pre_orders=10, requests=10, purchases=10, days=60, seed=1)
+    latest = conn.execute("SELECT MAX(sale_time) FROM sales").fetchone()[0]
+    assert datetime.fromisoformat(latest) > datetime.now() - timedelta(days=2)
+    assert conn.execute("SELECT SUM(recent_units) FROM reorder_status").fetchone()[0] > 0
+
+def test_generate_after_archive_adds_to_rollups(app, conn):
+    folder = app.config['ARCHIVE_FOLDER']
+    datagen.generate(conn, variants=60, sales=3000, pre_orders=0, requests=0, purchases=0, days=365, seed=1,
+                     end=datetime(2025, 12, 31))
+    archive.archive_sales(conn, folder, keep_months=3, today=date(2026, 1, 15))
+    triggers = trigger_sql(conn)
+    datagen.generate(conn, variants=60, sales=2000, pre_orders=0, requests=0, purchases=0, days=30, seed=2,
+                     end=datetime(2026, 1, 10))
+    assert trigger_sql(conn) == triggers
+    incremental = rollup_figures(conn)
+    c = conn.cursor()
+    with archive.sales_source(c, folder, None, None) as source:
+        rollups.rebuild_rollups(c, source)
+    conn.commit()
+    assert rollup_figures(conn) == incremental
+    assert incremental[0][0] == 5000
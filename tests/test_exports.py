@@ -0,0 +1,27 @@
+import db
+import exports
+
+def test_streaming_exports_hold_no_pooled_connection(app, client, conn, monkeypatch):
+    conn.executemany("INSERT INTO sales (sale_id, variant_id, quantity, revenue, sale_time) VALUES (?, 'v1', 1, 79.99, ?)",
+                     [(f's{i}', f'2025-01-{i + 1:02d}T12:00:00') for i in range(5)])
+    conn.commit()
+    monkeypatch.setattr(exports, 'EXPORT_BATCH_SIZE', 1)
+    pool = db.get_pool()
+    pool.timeout = 0.01
+    in_use = pool.stats()['in_use']
+    downloads = []
+    for path in ['/export_inventory?format=csv', '/export_sales?format=csv'] * pool.size:
+        response = client.get(path, buffered=False)
+        assert response.status_code == 200
+        next(response.response)
+        downloads.append(response)
+    assert pool.stats()['in_use'] == in_use
+    assert client.get('/api/inventory').status_code == 200
+    for response in downloads:
+        response.close()
+
+def test_inventory_csv_export(client):
+    response = client.get('/export_inventory?format=csv')
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines[0] == 'Product Name,Type,Size,Barcode,Cost,Selling Price,Stock'
+    assert len(lines) == 5
@@ -0,0 +1,52 @@
+import hashlib
+import io
+import os
+
+import images
+
+PHOTO = b'not really a jpeg'
+FILENAME = f"{hashlib.sha256(PHOTO).hexdigest()}.jpg"
+
+def product_form(*barcodes):
+    form = {'name': 'Away Shirt'}
+    for i, barcode in enumerate(barcodes):
+        form.update({f'barcode_{i}': barcode, f'type_{i}': 'Away', f'size_{i}': 'L', f'cost_{i}': '40',
+                     f'selling_price_{i}': '70', f'stock_{i}': '3', f'photo_{i}': (io.BytesIO(PHOTO), 'shirt.jpg')})
+    return form
+
+def stored(app):
+    return os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], FILENAME))
+
+def test_add_product_stores_photo_after_commit(app, client, conn):
+    response = client.post('/add_product', data=product_form('555000111'), content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert conn.execute("SELECT photo FROM variants WHERE barcode = '555000111'").fetchone()[0] == FILENAME
+    assert stored(app)
+
+def test_rejected_product_leaves_no_photo(app, client, conn):
+    response = client.post('/add_product', data=product_form('555000111', '123456789'),
+                           content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert conn.execute("SELECT COUNT(*) FROM variants WHERE barcode = '555000111'").fetchone()[0] == 0
+    assert not stored(app)
+
+def test_remove_keeps_photo_referenced_again(app, conn):
+    folder = app.config['UPLOAD_FOLDER']
+    images.save_upload(folder, FILENAME, PHOTO).result()
+    orphans = images.unreferenced(conn.cursor(), [FILENAME])
+    assert orphans == [FILENAME]
+    # An upload of the same image commits between the delete and the removal
+    conn.execute("UPDATE variants SET photo = ? WHERE variant_id = 'v1'", (FILENAME,))
+    conn.commit()
+    images.remove(folder, orphans)
+    assert stored(app)
+    conn.execute("UPDATE variants SET photo = 'placeholder.jpg' WHERE variant_id = 'v1'")
+    conn.commit()
+    images.remove(folder, orphans)
+    assert not stored(app)
+
+def test_remove_never_leaves_the_upload_folder(app, conn, tmp_path):
+    victim = tmp_path / 'victim.txt'
+    victim.write_text('keep me')
+    images.remove(app.config['UPLOAD_FOLDER'], ['../victim.txt', str(victim)])
+    assert victim.read_text() == 'keep me'
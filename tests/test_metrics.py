@@ -0,0 +1,40 @@
+import metrics
+
+def test_statement_labels_fingerprint_without_merging():
+    assert metrics.statement_label("SELECT stock FROM variants WHERE variant_id = 'v1' AND stock > 5") == \
+        'SELECT stock FROM variants WHERE variant_id = ? AND stock > ?'
+    assert metrics.statement_label('SELECT 1 FROM t WHERE a IN (?, ?, ?)') == 'SELECT ? FROM t WHERE a IN (?...)'
+    assert metrics.statement_label('CREATE INDEX IF NOT EXISTS idx ON t(a)') == metrics.SCHEMA_LABEL
+    assert metrics.statement_label('PRAGMA journal_mode = WAL') == metrics.SCHEMA_LABEL
+    prefix = 'SELECT ' + ', '.join(f'column_{i}' for i in range(40))
+    first = metrics.statement_label(prefix + ' FROM first_table')
+    second = metrics.statement_label(prefix + ' FROM second_table')
+    assert first != second
+    assert len(first) <= metrics.MAX_LABEL_LENGTH and len(second) <= metrics.MAX_LABEL_LENGTH
+
+def test_startup_schema_statements_share_one_label(app):
+    body = app.test_client().get('/metrics').get_data(as_text=True)
+    assert 'CREATE ' not in body and 'PRAGMA ' not in body
+
+def test_metrics_require_loopback_or_token(app):
+    client = app.test_client()
+    assert client.get('/metrics').status_code == 200
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.5'}).status_code == 403
+    app.config['METRICS_TOKEN'] = 'scrape-secret'
+    try:
+        assert client.get('/metrics').status_code == 401
+        assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+        response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'},
+                              environ_base={'REMOTE_ADDR': '10.0.0.5'})
+        assert response.status_code == 200
+    finally:
+        app.config['METRICS_TOKEN'] = None
+
+def test_admin_session_can_read_metrics(client):
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.5'}).status_code == 200
+
+def test_schema_statements_do_not_use_label_slots():
+    before = len(metrics._labels_in_use)
+    for i in range(50):
+        assert metrics.statement_label(f'CREATE\n    INDEX IF NOT EXISTS idx_{i} ON t(a)') == metrics.SCHEMA_LABEL
+    assert len(metrics._labels_in_use) == before
@@ -0,0 +1,27 @@
+import pytest
+
+import db
+
+def test_exhausted_pool_raises_pool_timeout(app):
+    pool = db.get_pool()
+    pool.timeout = 0.01
+    held = [pool.acquire() for _ in range(pool.size)]
+    try:
+        with pytest.raises(db.PoolTimeout):
+            pool.acquire()
+    finally:
+        for conn in held:
+            pool.release(conn)
+
+def test_exhausted_pool_answers_503(app, client):
+    pool = db.get_pool()
+    pool.timeout = 0.01
+    held = [pool.acquire() for _ in range(pool.size)]
+    try:
+        response = client.get('/api/inventory')
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+    finally:
+        for conn in held:
+            pool.release(conn)
+    assert client.get('/api/inventory').status_code == 200
@@ -0,0 +1,21 @@
+def variant_ids(response):
+    assert response.status_code == 200
+    return [item['variant_id'] for item in response.json['items']]
+
+def test_inventory_filters(client):
+    assert variant_ids(client.get('/api/inventory')) == ['v1', 'v2', 'v3', 'v4']
+    assert variant_ids(client.get('/api/inventory?type=Home&size=L')) == ['v2']
+    assert variant_ids(client.get('/api/inventory?low_stock=5')) == ['v2', 'v3']
+    assert variant_ids(client.get('/api/inventory?product_id=p2')) == ['v4']
+    assert client.get('/api/inventory?low_stock=few').status_code == 400
+
+def test_inventory_pages_follow_cursor(client):
+    first = client.get('/api/inventory?limit=3')
+    assert variant_ids(first) == ['v1', 'v2', 'v3']
+    assert variant_ids(client.get(f"/api/inventory?limit=3&cursor={first.json['next_cursor']}")) == ['v4']
+
+def test_sales_page_newest_first(client):
+    for price in (79.99, 78.0):
+        client.post('/transactions', json={'action': 'sell', 'variant_id': 'v1', 'selling_price': price})
+    response = client.get('/api/sales')
+    assert [item['revenue'] for item in response.json['items']] == [78.0, 79.99]
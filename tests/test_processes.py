@@ -0,0 +1,49 @@
+import sqlite3
+
+import pytest
+
+import app as inventory_app
+import db
+
+@pytest.fixture
+def multiprocess_app(app):
+    yield inventory_app.create_app({'MULTIPROCESS': True})
+    db.stop_change_watcher()
+
+def cache_survives_request(client):
+    inventory_app.scan_cache.put('sentinel', 1)
+    version = inventory_app.data_version.value
+    client.get('/login')
+    return inventory_app.scan_cache.get('sentinel') == 1 and inventory_app.data_version.value == version
+
+def test_own_commits_keep_process_caches(multiprocess_app):
+    client = multiprocess_app.test_client()
+    for _ in range(3):
+        db.write(lambda c: c.execute("UPDATE variants SET selling_price = selling_price WHERE variant_id = 'v1'"))
+        with db.transaction() as c:
+            c.execute("INSERT INTO purchases VALUES (?, 'v1', 1, '2025-01-01T00:00:00')", (f'p{_}',))
+        assert cache_survives_request(client)
+
+def test_own_write_queue_commits_keep_process_caches(multiprocess_app):
+    client = multiprocess_app.test_client()
+    db.start_write_queue()
+    try:
+        db.write(lambda c: c.execute("UPDATE variants SET stock = 3 WHERE variant_id = 'v1'"))
+    finally:
+        db.stop_write_queue()
+    assert cache_survives_request(client)
+
+def test_other_process_commit_clears_caches(multiprocess_app):
+    client = multiprocess_app.test_client()
+    other = sqlite3.connect(multiprocess_app.config['DATABASE'])
+    # Another worker stamps the shared counter with its commit
+    other.execute("UPDATE change_counter SET version = version + 1 WHERE id = 1")
+    other.execute("UPDATE variants SET stock = 1 WHERE variant_id = 'v1'")
+    other.commit()
+    assert not cache_survives_request(client)
+    # A commit from outside the app does not stamp it, and is noticed too
+    other.execute("UPDATE variants SET stock = 2 WHERE variant_id = 'v1'")
+    other.commit()
+    assert not cache_survives_request(client)
+    other.close()
+    assert cache_survives_request(client)
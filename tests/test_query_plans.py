@@ -0,0 +1,27 @@
+import datagen
+import query_plans
+
+def test_hot_queries_use_indexes(conn):
+    assert query_plans.check(conn) == []
+
+def test_hot_queries_use_indexes_with_generated_data(conn):
+    datagen.generate(conn, variants=200, sales=5000, pre_orders=200, requests=200, purchases=200, days=90, seed=3)
+    conn.execute('ANALYZE')
+    conn.commit()
+    assert query_plans.check(conn) == []
+
+def test_dropped_index_fails_the_check(conn):
+    conn.execute('DROP INDEX idx_variants_photo')
+    conn.commit()
+    assert ('photo references', 'SCAN variants') in query_plans.check(conn)
+
+def test_check_query_plans_command(app):
+    result = app.test_cli_runner().invoke(args=['check-query-plans'])
+    assert result.exit_code == 0
+
+def test_every_hot_query_runs_statements(conn):
+    for name, run, allowed in query_plans.HOT_QUERIES:
+        c = conn.cursor(query_plans.RecordingCursor)
+        run(c)
+        assert c.statements, name
+    conn.rollback()
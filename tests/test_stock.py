@@ -0,0 +1,50 @@
+def sales_count(conn, variant_id):
+    return conn.execute("SELECT COUNT(*) FROM sales WHERE variant_id = ?", (variant_id,)).fetchone()[0]
+
+def stock(conn, variant_id):
+    return conn.execute("SELECT stock FROM variants WHERE variant_id = ?", (variant_id,)).fetchone()[0]
+
+def test_sell_decrements_stock_and_labels_movement(client, conn):
+    response = client.post('/transactions', json={'action': 'sell', 'variant_id': 'v1', 'selling_price': 79.99})
+    assert response.status_code == 200
+    assert response.json['new_stock'] == 9
+    assert stock(conn, 'v1') == 9
+    assert sales_count(conn, 'v1') == 1
+    assert conn.execute("SELECT reason FROM stock_movements WHERE variant_id = 'v1' ORDER BY movement_id DESC").fetchone()[0] == 'sale'
+    assert conn.execute("SELECT COUNT(*) FROM stock_reason").fetchone()[0] == 0
+
+def test_selling_zero_stock_variant_fails_without_a_sale(client, conn):
+    for _ in range(3):
+        response = client.post('/transactions', json={'action': 'sell', 'variant_id': 'v2', 'selling_price': 79.99})
+        assert response.status_code == 400
+        assert response.json['error'] == 'Out of stock'
+    assert stock(conn, 'v2') == 0
+    assert sales_count(conn, 'v2') == 0
+
+def test_checkout_refuses_more_than_stock(client, conn):
+    response = client.post('/checkout', json={'lines': [{'variant_id': 'v3', 'quantity': 6, 'selling_price': 89.99}]})
+    assert response.status_code == 409
+    assert stock(conn, 'v3') == 5
+    assert sales_count(conn, 'v3') == 0
+
+def test_checkout_all_or_nothing_rolls_back_sold_lines(client, conn):
+    response = client.post('/checkout', json={'lines': [{'variant_id': 'v1', 'quantity': 2, 'selling_price': 79.99},
+                                                        {'variant_id': 'v2', 'quantity': 1, 'selling_price': 79.99}]})
+    assert response.status_code == 409
+    assert stock(conn, 'v1') == 10
+    assert sales_count(conn, 'v1') == 0
+
+def test_checkout_rejects_malformed_baskets(client):
+    for body in ([], {'lines': [1]}, {'lines': 'v1'}, {'lines': [{'variant_id': ['v1'], 'selling_price': 1}]}):
+        response = client.post('/checkout', json=body)
+        assert response.status_code == 400
+        assert response.json['error'] == 'Invalid basket'
+
+def test_checkout_reports_unknown_variant(client, conn):
+    response = client.post('/checkout', json={'lines': [{'variant_id': 'nope', 'quantity': 1, 'selling_price': 9.99},
+                                                        {'variant_id': 'v1', 'quantity': 1, 'selling_price': 79.99}]})
+    assert response.status_code == 404
+    assert response.json['error'] == 'Unknown variant'
+    assert response.json['lines'][0]['error'] == 'Unknown variant'
+    assert 'request_url' not in response.json['lines'][0]
+    assert stock(conn, 'v1') == 10
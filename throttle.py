@@ -0,0 +1,48 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Counts failures per key (a username or a client address) in a fixed
+# window. Once a key reaches `limit` failures, retry_after() reports how
+# long until its window ends, and callers refuse it without doing the
+# expensive work. Only the `max_keys` most recently failing keys are kept,
+# so a flood of distinct keys cannot grow memory without bound.
+class FailureLimiter:
+    def __init__(self, limit, window, max_keys=10000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+        self.refused = 0
+
+    def retry_after(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._windows.get(key)
+            if entry is None or entry[1] < self.limit:
+                return 0
+            started, _ = entry
+            if now - started >= self.window:
+                del self._windows[key]
+                return 0
+            self.refused += 1
+            return self.window - (now - started)
+
+    def failed(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            started, count = self._windows.pop(key, (now, 0))
+            if now - started >= self.window:
+                started, count = now, 0
+            self._windows[key] = (started, count + 1)
+            while len(self._windows) > self.max_keys:
+                self._windows.popitem(last=False)
+
+    def reset(self, key):
+        with self._lock:
+            self._windows.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {'keys': len(self._windows), 'refused': self.refused}
@@ -0,0 +1,38 @@
+# WSGI entry point for production serving.
+#
+# Several worker processes (gunicorn, Linux/macOS):
+#     SECRET_KEY=... gunicorn -c gunicorn.conf.py wsgi:app
+# gunicorn.conf.py migrates and seeds the database once in the master
+# before the workers fork, and runs each worker with threads (gthread).
+#
+# One process with threads (waitress, any platform):
+#     flask --app app init-db
+#     SECRET_KEY=... waitress-serve --listen=0.0.0.0:8000 --threads=16 wsgi:app
+#
+# SQLite allows one writer at a time however many processes there are, so
+# extra workers buy CPU for page rendering and password hashing, not write
+# throughput. Every connection runs in WAL mode, so readers never wait for
+# the writer, and waits for the write lock are bounded by busy_timeout.
+# Keep threads x workers modest (16-32 in total) and DB_POOL_SIZE at or
+# below the threads per worker.
+#
+# /metrics answers only localhost unless METRICS_TOKEN is set, in which
+# case scrapers send it as a bearer token.
+#
+# State that lives in each process rather than in the database:
+#   - the /scan cache, analytics cache and rendered-page cache;
+#   - the data version behind ETags (each process has its own token, so a
+#     page revalidated against another worker is simply sent again);
+#   - the live event feed (/events), which only carries writes made by the
+#     same process; the Sell page still resyncs its catalog every minute;
+#   - the write-behind queue (WRITE_BEHIND=1), which batches only that
+#     process's writes;
+#   - the password hashing pool (PASSWORD_WORKERS processes per worker, so
+#     size workers x PASSWORD_WORKERS to the cores left after serving) and
+#     the failed-login limits, which each worker counts separately.
+# With more than one worker MULTIPROCESS=1 is set (gunicorn.conf.py does
+# this), and each process drops its caches whenever another connection has
+# committed, so no worker serves data older than the latest write.
+from app import create_app
+
+app = create_app()